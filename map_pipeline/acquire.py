@@ -0,0 +1,60 @@
+'''
+Acquisition stage : runs the network-bound fetches of a pipeline run (sheets,
+JHU, line list, WHO, total count) concurrently in a thread pool.
+
+Each source has its own timeout and failures are isolated : a source that
+raises or times out is reported in `errors` while the others still hand
+their results to the transform stages. The wall time of the stage is about
+that of the slowest source instead of the sum of all of them.
+'''
+import concurrent.futures
+import time
+from collections import namedtuple
+from typing import Tuple
+
+
+# func is called without arguments (use functools.partial), timeout is in
+# seconds from the start of the stage, None to wait as long as it takes.
+Source = namedtuple('Source', ['name', 'func', 'timeout'])
+
+
+def acquire(sources: list, max_workers: int = None) -> Tuple[dict, dict]:
+    '''
+    Run the sources concurrently.
+
+    A source that times out can't be interrupted, its thread is left to
+    finish in the background (sources should also set timeouts on their
+    own connections).
+
+    Args :
+        sources (list) : Source tuples, names must be unique.
+        max_workers (int) : size of the thread pool, one thread per source
+                            by default.
+
+    Returns :
+        results (dict) : return value of each source that succeeded, by name.
+        errors (dict) : exception of each source that failed, by name
+                        (TimeoutError when it ran out of time).
+    '''
+    results, errors = {}, {}
+    if not sources:
+        return results, errors
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or len(sources))
+    start = time.monotonic()
+    futures = [(source, executor.submit(source.func)) for source in sources]
+    try:
+        for source, future in futures:
+            remaining = None
+            if source.timeout is not None:
+                remaining = max(0, start + source.timeout - time.monotonic())
+            try:
+                results[source.name] = future.result(timeout=remaining)
+            except concurrent.futures.TimeoutError:
+                future.cancel()
+                errors[source.name] = TimeoutError('{} timed out after {}s'.format(source.name, source.timeout))
+            except Exception as Err:
+                errors[source.name] = Err
+    finally:
+        executor.shutdown(wait=False)
+    return results, errors
@@ -0,0 +1,334 @@
+'''
+Aggregations of the case table used for the map outputs.
+
+All functions work on whole columns (groupby/NumPy), rows can be weighted
+with a `cases` column (see case_weights). Tables can be typed (schema.py) or
+all strings.
+'''
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+from dates import parse_dates, parse_ranges
+
+
+LOCATION = ['latitude', 'longitude']
+
+# Only displayed on the map when there is a single case at a location.
+SINGLE_CASE_FIELDS = ['age', 'sex', 'symptoms', 'source', 'date_confirmation']
+
+UNIQUE_COLUMNS = ['latitude', 'longitude', 'city', 'province', 'country', 'age', 'sex',
+                  'symptoms', 'source', 'date_confirmation', 'cases', 'geo_resolution']
+
+
+def text(column: pd.Series) -> pd.Series:
+    '''
+    Column as strings, missing values as empty strings. Also works on typed
+    columns (floats, categoricals) e.g. from the columnar cache.
+    '''
+    return column.astype(object).fillna('').astype(str)
+
+
+def text_codes(column: pd.Series, sort: bool = False) -> Tuple[np.ndarray, int]:
+    '''
+    Integer codes of a text column (-1 for missing values), and the number of
+    distinct values. Categoricals (schema.py) are coded without going back to
+    strings. With sort, codes follow the order of the strings.
+    '''
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        codes = column.cat.codes.values.astype(np.int64)
+        categories = np.asarray(column.cat.categories, dtype=object)
+        if sort: # the categories of a cached table aren't always sorted
+            rank = np.empty(len(categories), dtype=np.int64)
+            rank[np.argsort(categories, kind='stable')] = np.arange(len(categories))
+            codes = np.where(codes >= 0, rank[codes], -1)
+        return codes, len(categories)
+    codes, uniques = pd.factorize(column, sort=sort)
+    return codes.astype(np.int64), len(uniques)
+
+
+def case_weights(data: pd.DataFrame) -> pd.Series:
+    '''
+    Number of cases each row stands for. Rows are weighted when they carry
+    a `cases` column (e.g. JHU counts), otherwise every row is one case.
+    '''
+    if 'cases' in data.columns:
+        return data['cases'].fillna(1).astype(int)
+    return pd.Series(1, index=data.index)
+
+
+def most_common_city(location: np.ndarray, city: pd.Series, cases: np.ndarray) -> pd.Series:
+    '''
+    City with the most cases at each location, ties go to the first city in
+    alphabetical order. Missing cities are ignored.
+
+    Args :
+        location (np.ndarray) : location code of each row.
+        city (pd.Series) : city of each row.
+        cases (np.ndarray) : weight of each row.
+
+    Returns :
+        city (pd.Series) : most common city, indexed by location code.
+    '''
+    codes, cities = pd.factorize(city, sort=True)
+    named = codes >= 0
+    pairs = location[named] * len(cities) + codes[named]
+    pairs, inverse = np.unique(pairs, return_inverse=True)
+    totals = np.bincount(inverse, weights=cases[named])
+
+    pair_location = pairs // len(cities)
+    pair_city = pairs % len(cities)
+    order = np.lexsort((pair_city, -totals, pair_location))
+    pair_location, first = np.unique(pair_location[order], return_index=True)
+    return pd.Series(np.asarray(cities, dtype=object)[pair_city[order][first]], index=pair_location)
+
+
+def reduce_to_unique(data: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Get counts for unique locations (by lat/long combination), in a single
+    aggregation pass. Location names are those of the first row at each
+    location, except for :
+    - Singapore (country only) and Macau (province only),
+    - locations with several cities, which get the most common one.
+
+    Returns :
+        unique (pd.DataFrame) : one row per location, sorted by lat/long,
+        with columns UNIQUE_COLUMNS.
+    '''
+    df = data[data.latitude.notnull() & data.longitude.notnull()].reset_index(drop=True)
+    if df.empty:
+        return pd.DataFrame(columns=UNIQUE_COLUMNS)
+    cases = case_weights(df).values
+    for c in SINGLE_CASE_FIELDS + ['city', 'province', 'country', 'geo_resolution']:
+        if c not in df.columns:
+            df[c] = ''
+
+    # Locations are numbered in lat/long order, rows then only need integer operations.
+    latitude, _ = text_codes(df.latitude, sort=True)
+    longitude, nlongitudes = text_codes(df.longitude, sort=True)
+    _, location = np.unique(latitude * nlongitudes + longitude, return_inverse=True)
+    nlocations = location.max() + 1
+    _, first = np.unique(location, return_index=True)
+
+    unique = df.iloc[first].reset_index(drop=True)
+    for c in unique.columns:
+        if isinstance(unique[c].dtype, pd.CategoricalDtype):
+            unique[c] = unique[c].astype(object)
+    unique['cases'] = np.bincount(location, weights=cases, minlength=nlocations).astype(np.int64)
+
+    # get city that occurs the most.
+    city_codes = pd.factorize(df.city)[0] + 1 # missing cities count as a value.
+    pairs = np.unique(location * (city_codes.max() + 1) + city_codes)
+    several = np.bincount(pairs // (city_codes.max() + 1), minlength=nlocations) > 1
+    if several.any():
+        city = most_common_city(location, df.city, cases)
+        unique.loc[several, 'city'] = city.reindex(np.flatnonzero(several)).values
+
+    singapore = np.bincount(location, weights=(df.country == 'Singapore').values, minlength=nlocations) > 0
+    macau = np.bincount(location, weights=(df.province == 'Macau').values, minlength=nlocations) > 0
+    macau &= ~singapore
+    if singapore.any():
+        unique.loc[singapore, ['city', 'province', 'country']] = ['', '', 'Singapore']
+    if macau.any():
+        unique.loc[macau, ['city', 'province', 'country']] = ['', 'Macau', 'China']
+
+    multiple = unique['cases'] != 1
+    for c in SINGLE_CASE_FIELDS:
+        unique[c] = unique[c].where(~multiple, '')
+
+    return unique[UNIQUE_COLUMNS]
+
+
+def animation_cells(data: pd.DataFrame, groupby: str = 'week') -> Tuple[pd.DataFrame, pd.DataFrame]:
+    '''
+    New and total cases at every location for each date (or week), as used
+    by the animation.
+
+    Counts are pivoted to a sparse (date x location) table and summed along
+    time. A location only shows up once it has had a case, and is then
+    repeated on every following date (with 0 new cases) so that it doesn't
+    disappear in the animation. Dates without any new case are left out.
+
+    Args :
+        data (pd.DataFrame) : case table, dates are the start of
+                              date_confirmation (dd.mm.yyyy), date_start
+                              when the table is typed.
+        groupby (str) : 'week' to count by week (starting on mondays),
+                        anything else to count by day.
+
+    Returns :
+        locations (pd.DataFrame) : latitude, longitude, city, province,
+            country and geo_resolution of each location (first row seen),
+            indexed by location number (order of appearance in data).
+        cells (pd.DataFrame) : date, location, new and total, sorted by date
+            then location.
+    '''
+    if all(isinstance(data[c].dtype, pd.CategoricalDtype) for c in LOCATION):
+        # Typed coordinates, locations are numbered in order of appearance without building keys.
+        latitude, _ = text_codes(data.latitude)
+        longitude, nlongitudes = text_codes(data.longitude)
+        location, _ = pd.factorize((latitude + 1) * (nlongitudes + 1) + longitude + 1)
+    else:
+        geoid = text(data.latitude) + '|' + text(data.longitude) # To reference locations by a key
+        location, _ = pd.factorize(geoid)
+
+    if 'date_start' in data.columns:
+        date = data['date_start'] # parsed by schema.apply_schema
+    else:
+        date = parse_ranges(data.date_confirmation)['date_start']
+    if groupby == 'week':
+        date = date - pd.to_timedelta(date.dt.weekday, unit='D')
+
+    # Only locations with a dated case make it to the animation.
+    dated = np.flatnonzero(date.notnull().values)
+    dates, date_idx = np.unique(date.values[dated], return_inverse=True)
+    location = location[dated]
+    cases = case_weights(data).values[dated]
+
+    # Build reference table (to plug back in city/province/country later)
+    seen, first = np.unique(location, return_index=True)
+    rows = dated[first]
+    locations = pd.DataFrame(index=seen)
+    for c in LOCATION + ['city', 'province', 'country', 'geo_resolution']:
+        locations[c] = text(data[c].iloc[rows]).values
+
+    # Sparse counts, one entry per (location, date) with new cases. Sorted by
+    # location then date, so totals are cumulative sums within each location.
+    ndates = len(dates)
+    key, inverse = np.unique(location * ndates + date_idx, return_inverse=True)
+    new = np.bincount(inverse, weights=cases).astype(np.int64)
+    total = np.cumsum(new)
+    starts = np.flatnonzero(np.diff(key // ndates, prepend=-1))
+    total -= np.repeat(total[starts] - new[starts], np.diff(np.append(starts, len(key))))
+
+    # Every location is shown from its first date onwards.
+    first_date = key[starts] % ndates
+    appeared = np.arange(ndates)[:, None] >= first_date[None, :]
+    rows, columns = np.nonzero(appeared)
+    cell_key = seen[columns] * ndates + rows
+
+    # Look up each cell in the sparse counts, the latest entry at or before
+    # the cell's date holds the total.
+    pos = np.searchsorted(key, cell_key, side='right') - 1
+    cells = pd.DataFrame({
+        'date': dates[rows],
+        'location': seen[columns],
+        'new': np.where(key[pos] == cell_key, new[pos], 0),
+        'total': total[pos],
+    })
+    return locations, cells
+
+
+def animation_features(locations: pd.DataFrame, cells: pd.DataFrame):
+    '''
+    GeoJSON features for the animation, one per cell (see animation_cells).
+    '''
+    lat = locations.latitude.astype(float)
+    lon = locations.longitude.astype(float)
+    reference = {i: (lon[i], lat[i], row.city, row.province, row.country, row.geo_resolution)
+                 for i, row in zip(locations.index, locations.itertuples())}
+    dates = pd.Series(cells.date.unique())
+    datestr = dict(zip(dates, dates.dt.strftime('%Y-%m-%d')))
+
+    for d, i, N_new, total in zip(cells.date, cells.location.tolist(), cells.new.tolist(), cells.total.tolist()):
+        x, y, city, province, country, geo_resolution = reference[i]
+        yield {
+                "type": "Feature",
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": [x, y]
+                },
+                "properties": {
+                    "date": datestr[d],
+                    "new": N_new,
+                    "total": total,
+                    "city": city,
+                    "province": province,
+                    "country": country,
+                    "geo_resolution" : geo_resolution
+                }
+        }
+
+
+def totals_features(df: pd.DataFrame):
+    '''
+    GeoJSON features for the aggregated data (one per unique location).
+    '''
+    columns = ['age', 'sex', 'city', 'province', 'country',
+               'date_confirmation', 'source', 'symptoms', 'geo_resolution']
+    # Coordinates and counts converted once per column.
+    lon = df.longitude.astype(float).tolist()
+    lat = df.latitude.astype(float).tolist()
+    cases = df.cases.astype(np.int64).tolist()
+    for x, y, n, row in zip(lon, lat, cases, df[columns].itertuples(index=False)):
+        yield {
+                'type' : 'Feature',
+                'geometry': {
+                    'type': 'Point',
+                    'coordinates': [x, y]
+                    },
+                'properties': {
+                    'age': row.age,
+                    'sex': row.sex,
+                    'city': row.city,
+                    'province': row.province,
+                    'country': row.country,
+                    'date': row.date_confirmation,
+                    'source': row.source,
+                    'symptoms': row.symptoms,
+                    'cases': n,
+                    'geo_resolution': row.geo_resolution
+                }
+                }
+
+
+# Pin for the animation markers, by total number of cases : < 10, < 25, < 50, more.
+PIN_THRESHOLDS = [10, 25, 50]
+PINS = np.array(['pin4.svg', 'pin3.svg', 'pin2.svg', 'pin1.svg'], dtype=object)
+
+
+def daily_pins(data: pd.DataFrame) -> list:
+    '''
+    Cumulative counts at each location for every date, with the pin to
+    display. Built from a single groupby over (date, coordinates).
+
+    Only exact dates (dd.mm.yyyy) are counted, date ranges are left out.
+    Locations are listed in order of appearance within each date.
+
+    Returns :
+        array (list) : [{date: [{caseCount, latitude, longitude, pin}, ...]}, ...]
+    '''
+    data = data[['latitude', 'longitude', 'date_confirmation']].assign(cases=case_weights(data))
+
+    # drop #REF! in case they are propagated here :
+    invalid = (data.latitude == '#REF!') | (data.longitude == '#REF!') | (data.date_confirmation == '#REF!')
+    data = data[~invalid].copy()
+
+    data['date'] = parse_dates(data.date_confirmation)
+    data = data.dropna()
+    data['coord'] = data.latitude.astype(str) + '|' + data.longitude.astype(str)
+
+    # Sort so that results are in order (might be important for animation)
+    data = data.sort_values(by='date', kind='mergesort')
+    counts = data.groupby(['date', 'coord'], sort=False)['cases'].sum()
+    sums = counts.groupby(level='coord', sort=False).cumsum()
+    pins = PINS[np.digitize(sums.values, PIN_THRESHOLDS)]
+
+    coords = sums.index.get_level_values('coord')
+    unique_coords = pd.Series(coords.unique())
+    split = unique_coords.str.split('|', n=1)
+    latitude = dict(zip(unique_coords, split.str[0]))
+    longitude = dict(zip(unique_coords, split.str[1]))
+
+    results = {}
+    dates = sums.index.get_level_values('date').strftime('%Y-%m-%d')
+    for datestr, coord, count, pin in zip(dates, coords, sums.tolist(), pins):
+        if datestr not in results:
+            results[datestr] = []
+        results[datestr].append({'caseCount': count,
+                                 'latitude': latitude[coord],
+                                 'longitude': longitude[coord],
+                                 'pin': pin})
+
+    return [{d: results[d]} for d in results]
@@ -0,0 +1,425 @@
+'''
+Benchmarks for the map pipeline transforms.
+
+Usage :
+    python benchmark.py jhu [--jhu-file path] [--legacy-rows 50]
+    python benchmark.py jhu-update [--cases 1000000] [--locations 3300] [--days 300]
+    python benchmark.py reduce [--locations 200000] [--legacy-locations 2000]
+    python benchmark.py animation [--locations 100000] [--days 300]
+    python benchmark.py pins [--rows 100000 300000 1000000]
+    python benchmark.py geojson [--locations 1000 5000 20000]
+    python benchmark.py cache [--rows 1000000]
+    python benchmark.py clusters [--locations 100000 1000000] [--max-zoom 12]
+    python benchmark.py timeline [--locations 20000] [--days 120]
+    python benchmark.py schema [--rows 1000000]
+    python benchmark.py suite [--scale 1m] [--output results.json] [--baseline baseline.json] [--threshold 0.25]
+
+suite times the pipeline transforms on synthetic data (see synthetic.py),
+results are saved as JSON, and compared against a previous results file :
+the run fails (exit status 1) when a transform got slower than the threshold.
+'''
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import aggregation
+import cache
+import clusters
+import jhu
+import legacy
+import schema
+import synthetic
+import timeline
+import writers
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'map_data')
+
+THRESHOLD = 0.25 # suite regression : 25% slower than the baseline
+MIN_SECONDS = 0.01 # differences under this are noise
+
+
+def timeit(func, *args, **kwargs):
+    '''Run func once, returns (result, elapsed seconds).'''
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def legacy_jhu_reformat(us_data: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Row by row JHU expansion as previously done in pipeline.py, growing the
+    DataFrame one append at a time.
+    '''
+    us_data, date_columns = jhu.rename_date_columns(us_data)
+    us_reformed = pd.DataFrame(columns=['latitude', 'longitude', 'city', 'province', 'date_confirmation'])
+    for i, date in enumerate(date_columns):
+        for j, row in us_data.iterrows():
+            if float(row['Lat']) == 0 or float(row['Long_']) == 0:
+                continue
+            if pd.isnull(row['Lat']) or pd.isnull(row['Long_']):
+                continue
+            if i == 0:
+                N = int(row[date])
+            else:
+                N = int(row[date]) - int(row[date_columns[i-1]])
+            entry = {
+                    'latitude': row['Lat'],
+                    'longitude': row['Long_'],
+                    'city': row['Admin2'],
+                    'province': row['Province_State'],
+                    'date_confirmation': date
+            }
+            if N > 0:
+                us_reformed = pd.concat([us_reformed, pd.DataFrame([entry]*N)], ignore_index=True)
+    return us_reformed
+
+
+def bench_jhu(args):
+    us_data = jhu.read_jhu(args.jhu_file)
+
+    result, elapsed = timeit(jhu.jhu_to_line_list, us_data)
+    print(f'vectorized : {len(us_data)} locations -> {len(result)} cases in {elapsed:.3f}s')
+
+    subset = us_data.iloc[:args.legacy_rows]
+    fast, fast_elapsed = timeit(jhu.jhu_to_line_list, subset)
+    slow, slow_elapsed = timeit(legacy_jhu_reformat, subset)
+    assert len(fast) == len(slow), 'Vectorized and legacy expansions differ'
+    print(f'legacy     : {len(subset)} locations -> {len(slow)} cases in {slow_elapsed:.3f}s '
+          f'(vectorized {fast_elapsed:.3f}s on the same rows)')
+
+
+def bench_jhu_update(args):
+    us_data = synthetic.jhu_series(args.cases, n_locations=args.locations, n_days=args.days)
+    earlier = us_data.iloc[:, :-1] # the same file a day earlier
+
+    (weighted, state), full_time = timeit(jhu.update_weighted, us_data)
+    print(f'full rebuild : {args.locations} locations x {args.days} days -> {len(weighted)} rows in {full_time:.3f}s')
+    previous, earlier_state = jhu.update_weighted(earlier)
+    _, new_time = timeit(jhu.update_weighted, us_data, previous, earlier_state)
+    print(f'one new date : {new_time:.3f}s')
+    # Nothing to diff, but the counts of every processed date are still hashed to detect revisions.
+    _, same_time = timeit(jhu.update_weighted, us_data, weighted, state)
+    _, hash_time = timeit(jhu.count_hashes, *jhu.rename_date_columns(us_data))
+    print(f'no new date  : {same_time:.3f}s, of which {hash_time:.3f}s hashing the counts')
+
+
+def bench_reduce(args):
+    data = synthetic.line_list(args.locations * 3, args.locations)
+    result, elapsed = timeit(aggregation.reduce_to_unique, data)
+    print(f'vectorized : {len(data)} rows -> {len(result)} locations in {elapsed:.3f}s')
+
+    subset = synthetic.line_list(args.legacy_locations * 3, args.legacy_locations)
+    fast, fast_elapsed = timeit(aggregation.reduce_to_unique, subset)
+    slow, slow_elapsed = timeit(legacy.legacy_reduce, subset)
+    assert len(fast) == len(slow), 'Vectorized and legacy reductions differ'
+    print(f'legacy     : {len(subset)} rows -> {len(slow)} locations in {slow_elapsed:.3f}s '
+          f'(vectorized {fast_elapsed:.3f}s on the same rows)')
+
+
+def bench_animation(args):
+    data = synthetic.line_list(args.locations * 3, args.locations, args.days)
+    (locations, cells), elapsed = timeit(aggregation.animation_cells, data, 'day')
+    print(f'daily cells : {len(data)} rows, {len(locations)} locations over {args.days} days '
+          f'-> {len(cells)} cells in {elapsed:.3f}s')
+    (locations, cells), elapsed = timeit(aggregation.animation_cells, data, 'week')
+    print(f'weekly cells : {len(cells)} cells in {elapsed:.3f}s')
+
+
+def bench_pins(args):
+    for n_rows in args.rows:
+        data = synthetic.line_list(n_rows, max(n_rows // 10, 1))
+        result, elapsed = timeit(aggregation.daily_pins, data)
+        print(f'{n_rows} rows -> {len(result)} dates in {elapsed:.3f}s ({n_rows / elapsed:,.0f} rows/s)')
+
+
+def peak_memory(func, *args, **kwargs):
+    '''Run func once, returns (result, peak traced memory in MB).'''
+    tracemalloc.start()
+    try:
+        result = func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak / 2**20
+
+
+def dump_feature_collection(features, outfile):
+    '''Build the whole FeatureCollection in memory, then json.dump it.'''
+    with open(outfile, 'w') as F:
+        json.dump({'type': 'FeatureCollection', 'features': list(features)}, F)
+
+
+def bench_geojson(args):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        outfile = os.path.join(tmpdir, 'dailies.geojson')
+        for n_locations in args.locations:
+            data = synthetic.line_list(n_locations * 3, n_locations, 30)
+            locations, cells = aggregation.animation_cells(data, 'day')
+
+            _, streamed = peak_memory(writers.write_feature_collection,
+                                      writers.encode_animation_features(locations, cells), outfile)
+            size = os.path.getsize(outfile) / 2**20
+            _, dumped = peak_memory(dump_feature_collection,
+                                    aggregation.animation_features(locations, cells), outfile)
+            print(f'{len(cells)} features ({size:.1f}MB) : peak {streamed:.1f}MB streamed, {dumped:.1f}MB with json.dump')
+
+
+def bench_cache(args):
+    data = synthetic.line_list(args.rows, max(args.rows // 10, 1))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        jsonpath = os.path.join(tmpdir, 'full-data.json')
+        with open(jsonpath, 'w') as F:
+            json.dump({'data': data.to_dict(orient='records')}, F)
+
+        def load_json():
+            with open(jsonpath) as F:
+                return pd.DataFrame(json.load(F)['data'])
+        _, elapsed = timeit(load_json)
+        print(f'full-data.json : {len(data)} rows loaded in {elapsed:.3f}s')
+
+        for backend in ['arrow', 'numpy']:
+            if backend == 'arrow' and cache.pa is None:
+                continue
+            cachepath = os.path.join(tmpdir, f'full-data.{backend}.cache')
+            _, written = timeit(cache.save_case_table, data, cachepath, backend)
+            _, elapsed = timeit(cache.load_case_table, cachepath)
+            print(f'{backend} cache : written in {written:.3f}s, loaded in {elapsed:.3f}s')
+
+
+def bench_clusters(args):
+    for n_locations in args.locations:
+        data = synthetic.line_list(n_locations, n_locations)
+        totals = data[['latitude', 'longitude']].assign(cases=1)
+        levels, elapsed = timeit(clusters.cluster_levels, totals, 0, args.max_zoom)
+        per_level = elapsed / len(levels)
+        print(f'{n_locations} locations -> {len(levels[args.max_zoom])} clusters at zoom {args.max_zoom}, '
+              f'{len(levels[0])} at zoom 0 in {elapsed:.3f}s ({per_level / n_locations * 1e9:.0f}ns per location and level)')
+
+
+def bench_timeline(args):
+    data = synthetic.line_list(args.locations * 3, args.locations, args.days)
+    locations, cells = aggregation.animation_cells(data, 'day')
+    with tempfile.TemporaryDirectory() as tmpdir:
+        geojson = os.path.join(tmpdir, 'dailies.geojson')
+        writers.write_feature_collection(writers.encode_animation_features(locations, cells), geojson)
+        binary = os.path.join(tmpdir, 'dailies.bin')
+        sizes = timeline.write_timeline(locations, cells, binary, compress=['gzip'])
+        normalized = os.path.join(tmpdir, 'dailies.timeline.json')
+        sizes.update(timeline.write_timeline_json(locations, cells, normalized, compress=['gzip']))
+        with open(geojson, 'rb') as F:
+            geojson_gz = len(timeline.COMPRESSIONS['gzip'][1](F.read()))
+
+        def load_geojson():
+            with open(geojson) as F:
+                return json.load(F)
+        _, geojson_time = timeit(load_geojson)
+        _, binary_time = timeit(timeline.read_timeline, binary)
+        _, json_time = timeit(timeline.read_timeline_json, normalized)
+
+        print(f'{len(cells)} cells, {len(locations)} locations over {args.days} days')
+        print(f'GeoJSON : {os.path.getsize(geojson) / 2**20:.1f}MB ({geojson_gz / 2**20:.2f}MB gzip), parsed in {geojson_time:.3f}s')
+        print(f'timeline : {sizes[binary] / 2**20:.1f}MB ({sizes[binary + ".gz"] / 2**20:.2f}MB gzip), '
+              f'parsed in {binary_time:.3f}s')
+        print(f'JSON timeline : {sizes[normalized] / 2**20:.1f}MB ({sizes[normalized + ".gz"] / 2**20:.2f}MB gzip), '
+              f'parsed in {json_time:.3f}s')
+        for name, path, elapsed in [('timeline', binary, binary_time), ('JSON timeline', normalized, json_time)]:
+            print(f'{name} : {geojson_gz / sizes[path + ".gz"]:.0f}x less to transfer, '
+                  f'{geojson_time / elapsed:.0f}x faster to parse')
+
+
+def bench_schema(args):
+    data = synthetic.line_list(args.rows)
+    typed, elapsed = timeit(schema.apply_schema, data)
+    print(f'schema applied to {len(data)} rows in {elapsed:.3f}s')
+    for name, table in [('text', data), ('typed', typed)]:
+        size = table.memory_usage(deep=True).sum() / len(table) * 1e6 / 2**20
+        _, reduce_time = timeit(aggregation.reduce_to_unique, table)
+        _, animation_time = timeit(aggregation.animation_cells, table)
+        print(f'{name:6}: {size:.0f}MB per million rows, reduce_to_unique {reduce_time:.3f}s, '
+              f'animation_cells {animation_time:.3f}s')
+
+
+def best_of(repeat: int, func, *args, **kwargs):
+    '''Run func repeat times, returns (result of the last run, seconds of each run).'''
+    runs = []
+    for _ in range(repeat):
+        result, elapsed = timeit(func, *args, **kwargs)
+        runs.append(elapsed)
+    return result, runs
+
+
+def run_suite(n_cases: int, repeat: int = 3, seed: int = 0, dirty: float = 0.02) -> dict:
+    '''
+    Time the pipeline transforms on n_cases synthetic cases, half from the
+    line list and half from the JHU time series, merged as in pipeline.py.
+
+    Returns :
+        results (dict) : run parameters and versions, and by step : seconds
+                         (best run), runs, rows_in and rows_out.
+    '''
+    # Imported here, sheet_cleaner has a functions module too (test runs).
+    from functions import clean_data, reduceToUnique, animation_formating, animation_formating_geo, convert_to_geojson
+
+    sheet = synthetic.line_list(n_cases // 2, dirty=dirty, seed=seed)
+    us_data = synthetic.jhu_series(n_cases - n_cases // 2, seed=seed)
+    steps = {}
+
+    def step(name, rows_in, func, *args):
+        result, runs = best_of(repeat, func, *args)
+        rows_out = len(result[1] if isinstance(result, tuple) else result) if result is not None else None
+        steps[name] = {'seconds': min(runs), 'runs': runs, 'rows_in': rows_in, 'rows_out': rows_out}
+        print(f'{name:24} {rows_in:>10} rows in {min(runs):8.3f}s')
+        return result
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        weighted = step('jhu_to_weighted', len(us_data), jhu.jhu_to_weighted, us_data)
+        step('expand_cases', len(weighted), jhu.expand_cases, weighted)
+        clean = step('clean_data', len(sheet), clean_data, sheet, jhu.COLUMNS)
+
+        merged = pd.concat([clean, weighted], ignore_index=True, sort=False)
+        merged['cases'] = aggregation.case_weights(merged)
+        unique = step('reduceToUnique', len(merged), reduceToUnique, merged)
+        step('animation_formating', len(merged), animation_formating, merged)
+        step('animation_formating_geo', len(merged), animation_formating_geo,
+             merged, os.path.join(tmpdir, 'dailies.geojson'))
+        step('convert_to_geojson', len(unique), convert_to_geojson, unique, os.path.join(tmpdir, 'totals.geojson'))
+
+    return {
+        'cases': n_cases,
+        'seed': seed,
+        'repeat': repeat,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'steps': steps,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float = THRESHOLD, min_seconds: float = MIN_SECONDS) -> list:
+    '''
+    Steps slower than in the baseline by more than threshold (and
+    min_seconds), as (step, baseline seconds, seconds).
+
+    Raises :
+        ValueError : when the runs are not on the same data.
+    '''
+    for key in ['cases', 'seed']:
+        if results[key] != baseline[key]:
+            raise ValueError(f'baseline {key} is {baseline[key]}, not {results[key]}')
+    regressions = []
+    for name, step in results['steps'].items():
+        previous = baseline['steps'].get(name)
+        if previous is None:
+            continue
+        if step['seconds'] > previous['seconds'] * (1 + threshold) and step['seconds'] - previous['seconds'] > min_seconds:
+            regressions.append((name, previous['seconds'], step['seconds']))
+    return regressions
+
+
+def bench_suite(args):
+    results = run_suite(synthetic.parse_scale(args.scale), args.repeat, args.seed)
+    if args.output:
+        with open(args.output, 'w') as F:
+            json.dump(results, F, indent=1)
+    if not args.baseline:
+        return
+
+    with open(args.baseline) as F:
+        baseline = json.load(F)
+    for name, step in results['steps'].items():
+        previous = baseline['steps'].get(name)
+        if previous:
+            change = step['seconds'] / previous['seconds'] - 1 if previous['seconds'] else 0
+            print(f'{name:24} {previous["seconds"]:8.3f}s -> {step["seconds"]:8.3f}s ({change:+.0%})')
+    regressions = compare(results, baseline, args.threshold)
+    for name, before, after in regressions:
+        print(f'REGRESSION {name} : {before:.3f}s -> {after:.3f}s')
+    if regressions:
+        sys.exit(1)
+
+
+parser = argparse.ArgumentParser(description='Benchmarks for the map pipeline')
+subparsers = parser.add_subparsers(dest='benchmark')
+
+jhu_parser = subparsers.add_parser('jhu', help='JHU wide to long expansion')
+jhu_parser.add_argument('--jhu-file', default=os.path.join(DATA_DIR, 'jhu_US_timeseries.csv'),
+                        help='JHU US time series csv')
+jhu_parser.add_argument('--legacy-rows', type=int, default=50,
+                        help='Number of locations to run the legacy loop on')
+jhu_parser.set_defaults(func=bench_jhu)
+
+jhu_update_parser = subparsers.add_parser('jhu-update', help='incremental JHU runs against a full rebuild')
+jhu_update_parser.add_argument('--cases', type=int, default=1000000, help='Number of cases')
+jhu_update_parser.add_argument('--locations', type=int, default=3300, help='Number of counties')
+jhu_update_parser.add_argument('--days', type=int, default=300, help='Number of date columns')
+jhu_update_parser.set_defaults(func=bench_jhu_update)
+
+reduce_parser = subparsers.add_parser('reduce', help='reduceToUnique')
+reduce_parser.add_argument('--locations', type=int, default=200000,
+                           help='Number of distinct locations (3 rows each on average)')
+reduce_parser.add_argument('--legacy-locations', type=int, default=2000,
+                           help='Number of distinct locations to run the legacy loop on')
+reduce_parser.set_defaults(func=bench_reduce)
+
+animation_parser = subparsers.add_parser('animation', help='animation_formating_geo counts')
+animation_parser.add_argument('--locations', type=int, default=100000,
+                              help='Number of distinct locations (3 rows each on average)')
+animation_parser.add_argument('--days', type=int, default=300,
+                              help='Number of days the cases are spread over')
+animation_parser.set_defaults(func=bench_animation)
+
+pins_parser = subparsers.add_parser('pins', help='animation_formating, rows/s should stay flat')
+pins_parser.add_argument('--rows', type=int, nargs='+', default=[100000, 300000, 1000000],
+                         help='Number of rows (10 per location on average)')
+pins_parser.set_defaults(func=bench_pins)
+
+geojson_parser = subparsers.add_parser('geojson', help='streamed animation GeoJSON, peak memory should stay flat')
+geojson_parser.add_argument('--locations', type=int, nargs='+', default=[1000, 5000, 20000],
+                            help='Number of distinct locations (3 rows each on average, over 30 days)')
+geojson_parser.set_defaults(func=bench_geojson)
+
+cache_parser = subparsers.add_parser('cache', help='loading full-data.json against the columnar cache')
+cache_parser.add_argument('--rows', type=int, default=1000000, help='Number of rows')
+cache_parser.set_defaults(func=bench_cache)
+
+clusters_parser = subparsers.add_parser('clusters', help='totals clusters, time per location and level should stay flat')
+clusters_parser.add_argument('--locations', type=int, nargs='+', default=[100000, 1000000],
+                             help='Number of distinct locations')
+clusters_parser.add_argument('--max-zoom', type=int, default=12, help='Clusters for zoom levels 0 to max-zoom')
+clusters_parser.set_defaults(func=bench_clusters)
+
+timeline_parser = subparsers.add_parser('timeline', help='binary and JSON timelines against the animation GeoJSON')
+timeline_parser.add_argument('--locations', type=int, default=20000, help='Number of distinct locations (3 rows each on average)')
+timeline_parser.add_argument('--days', type=int, default=120, help='Number of days the cases are spread over')
+timeline_parser.set_defaults(func=bench_timeline)
+
+schema_parser = subparsers.add_parser('schema', help='memory and aggregations of text and typed case tables')
+schema_parser.add_argument('--rows', type=int, default=1000000, help='Number of rows')
+schema_parser.set_defaults(func=bench_schema)
+
+suite_parser = subparsers.add_parser('suite', help='pipeline transforms on synthetic data, against a baseline')
+suite_parser.add_argument('--scale', default='10k', help=f'Number of cases, or one of {", ".join(synthetic.SCALES)}')
+suite_parser.add_argument('--repeat', type=int, default=3, help='Runs of each step, the best one is kept')
+suite_parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic data')
+suite_parser.add_argument('--output', help='Where to save the results (JSON), e.g. a new baseline')
+suite_parser.add_argument('--baseline', help='Results of a previous run to compare against')
+suite_parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                          help='Fail when a step is slower than the baseline by more than this share')
+suite_parser.set_defaults(func=bench_suite)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.benchmark is None:
+        parser.print_help()
+    else:
+        args.func(args)
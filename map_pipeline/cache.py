@@ -0,0 +1,150 @@
+'''
+Columnar cache of the merged case table (line list + JHU).
+
+full-data.json and latestdata.csv are row oriented and keep every value as
+a string, so they are slow to parse. The cache is written next to them with
+the typed columns of schema.py :
+- date_confirmation parsed to date_start/date_end (datetime64),
+- coordinates and repeated text fields (location, source, ...) dictionary
+  encoded, with the text of the sheets.
+
+It is an uncompressed Arrow IPC file when pyarrow is installed, otherwise a
+directory of .npy files. Both are read memory-mapped.
+'''
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from schema import apply_schema
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+
+
+ARROW_MAGIC = b'ARROW1'
+
+
+def cache_path(fullpath: str) -> str:
+    '''Cache file written next to full-data.json.'''
+    return os.path.splitext(fullpath)[0] + '.cache'
+
+
+def to_columnar(data: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Typed copy of the case table, as stored in the cache (see schema.apply_schema).
+    '''
+    return apply_schema(data)
+
+
+def _write_arrow(df: pd.DataFrame, path: str) -> None:
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    feather.write_feather(table, path, compression='uncompressed')
+
+
+def _write_numpy(df: pd.DataFrame, path: str) -> None:
+    os.mkdir(path)
+    meta = []
+    for c in df.columns:
+        column = df[c]
+        if pd.api.types.is_datetime64_any_dtype(column):
+            np.save(os.path.join(path, f'{c}.npy'), column.values.view(np.int64))
+            meta.append({'name': c, 'kind': 'datetime'})
+        elif pd.api.types.is_numeric_dtype(column) and not isinstance(column.dtype, pd.CategoricalDtype):
+            np.save(os.path.join(path, f'{c}.npy'), column.values)
+            meta.append({'name': c, 'kind': 'numeric'})
+        else:
+            # Text columns are always dictionary encoded.
+            codes, categories = pd.factorize(column.astype(object))
+            np.save(os.path.join(path, f'{c}.npy'), codes.astype(np.int32))
+            meta.append({'name': c, 'kind': 'text', 'categories': [str(x) for x in categories]})
+    with open(os.path.join(path, 'meta.json'), 'w') as F:
+        json.dump(meta, F)
+
+
+def save_case_table(data: pd.DataFrame, path: str, backend: str = None, typed: bool = True) -> None:
+    '''
+    Write the case table to the cache, atomically (temporary file + rename).
+
+    Args :
+        data (pd.DataFrame) : case table.
+        path (str) : cache path (see cache_path).
+        backend (str) : 'arrow' or 'numpy', defaults to arrow when available.
+        typed (bool) : store typed columns (see to_columnar), or the values
+                       as they are (text stays text).
+    '''
+    if backend is None:
+        backend = 'arrow' if pa is not None else 'numpy'
+    df = to_columnar(data) if typed else data.reset_index(drop=True)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    tmp = tempfile.mkdtemp(dir=directory, prefix='.cache-')
+    try:
+        tmppath = os.path.join(tmp, 'cache')
+        if backend == 'arrow':
+            _write_arrow(df, tmppath)
+        else:
+            _write_numpy(df, tmppath)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.isdir(tmppath) and os.path.exists(path):
+            os.remove(path)
+        os.replace(tmppath, path)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def is_case_cache(path: str) -> bool:
+    '''Whether path is a case table cache (either backend).'''
+    if os.path.isdir(path):
+        return os.path.exists(os.path.join(path, 'meta.json'))
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as F:
+        return F.read(len(ARROW_MAGIC)) == ARROW_MAGIC
+
+
+def _read_numpy(path: str) -> pd.DataFrame:
+    with open(os.path.join(path, 'meta.json')) as F:
+        meta = json.load(F)
+    columns = {}
+    for m in meta:
+        values = np.load(os.path.join(path, '{}.npy'.format(m['name'])), mmap_mode='r')
+        if m['kind'] == 'datetime':
+            columns[m['name']] = values.view('datetime64[ns]')
+        elif m['kind'] == 'text':
+            columns[m['name']] = pd.Categorical.from_codes(values, m['categories'])
+        else:
+            columns[m['name']] = values
+    return pd.DataFrame(columns, columns=[m['name'] for m in meta])
+
+
+def load_case_table(path: str) -> pd.DataFrame:
+    '''
+    Read the case table from the cache, memory-mapped.
+    '''
+    if os.path.isdir(path):
+        return _read_numpy(path)
+    if pa is None:
+        raise ImportError('pyarrow is needed to read {}'.format(path))
+    return feather.read_table(path, memory_map=True).to_pandas()
+
+
+def load_untyped_table(path: str) -> pd.DataFrame:
+    '''
+    Read a table saved with save_case_table(..., typed=False), text columns
+    back as objects like before it was saved (missing values as NaN, with
+    either backend).
+    '''
+    df = load_case_table(path)
+    for c in df.columns:
+        if isinstance(df[c].dtype, pd.CategoricalDtype) or df[c].dtype == object:
+            column = df[c].astype(object)
+            df[c] = column.where(column.notnull(), np.nan)
+    return df
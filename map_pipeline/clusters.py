@@ -0,0 +1,142 @@
+'''
+Precomputed clusters of the totals layer, one layer per zoom level, so that
+the browser doesn't have to cluster thousands of points on every pan.
+
+Locations are bucketed in a grid of CELL_SIZE pixel cells in Web Mercator
+(256 pixel tiles). Cells of consecutive zoom levels nest (a cell at zoom z
+is 2x2 cells at z+1), so each level is built from the clusters of the level
+above it by halving the cell coordinates and merging on a hash of the cell
+(pd.factorize), i.e. in O(n) per level.
+
+A cluster has the summed cases and number of locations of its members, and
+is shown at its representative location : the location with the most cases
+(the first one in totals on ties).
+'''
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from tiles import MAX_ZOOM, MIN_ZOOM, mercator, replace_directory
+from writers import write_feature_collection
+
+
+TILE_SIZE = 256 # pixels
+CELL_SIZE = 64 # pixels, a power of 2 up to TILE_SIZE
+
+
+def cells_per_side(zoom: int, cell_size: int = CELL_SIZE) -> int:
+    '''Number of grid cells along each axis at a zoom level.'''
+    if cell_size > TILE_SIZE or TILE_SIZE % cell_size or cell_size & (cell_size - 1):
+        raise ValueError('cell_size must be a power of 2 up to {}, got {}'.format(TILE_SIZE, cell_size))
+    return 2 ** zoom * (TILE_SIZE // cell_size)
+
+
+def cluster_levels(totals: pd.DataFrame, min_zoom: int = MIN_ZOOM, max_zoom: int = MAX_ZOOM,
+                   cell_size: int = CELL_SIZE) -> dict:
+    '''
+    Clusters of the totals at every zoom level.
+
+    Args :
+        totals (pd.DataFrame) : one row per location with latitude, longitude
+                                and cases (see aggregation.reduce_to_unique).
+        min_zoom, max_zoom (int) : zoom levels (included).
+        cell_size (int) : grid cell size in pixels.
+
+    Returns :
+        levels (dict) : by zoom level, a DataFrame with one row per cluster :
+            cases, locations (number of locations) and representative (row
+            number in totals of the location with the most cases).
+    '''
+    cases = totals.cases.values.astype(np.int64)
+    x, y = mercator(totals.latitude.astype(float).values, totals.longitude.astype(float).values)
+    n = cells_per_side(max_zoom, cell_size)
+    cx = np.floor(x * n).astype(np.int64)
+    cy = np.floor(y * n).astype(np.int64)
+
+    # Items of the current level : locations at max_zoom, then the clusters of the level above.
+    locations = np.ones(len(totals), dtype=np.int64)
+    representative = np.arange(len(totals))
+    representative_cases = cases
+    levels = {}
+    for zoom in range(max_zoom, min_zoom - 1, -1):
+        if zoom < max_zoom:
+            cx >>= 1
+            cy >>= 1
+        codes, _ = pd.factorize(cx * cells_per_side(zoom, cell_size) + cy)
+        ncells = codes.max() + 1 if len(codes) else 0
+
+        # Location with the most cases in each cell, ties go to the first one in totals.
+        most = pd.Series(representative_cases).groupby(codes, sort=True).max().values
+        candidates = representative_cases == most[codes]
+        first = pd.Series(representative[candidates]).groupby(codes[candidates], sort=True).min().values
+        chosen = np.flatnonzero(representative == first[codes])
+        largest = np.empty(ncells, dtype=np.int64)
+        largest[codes[chosen]] = chosen
+        cases = np.bincount(codes, weights=cases, minlength=ncells).astype(np.int64)
+        locations = np.bincount(codes, weights=locations, minlength=ncells).astype(np.int64)
+        representative = representative[largest]
+        representative_cases = representative_cases[largest]
+        cx, cy = cx[largest], cy[largest]
+
+        levels[zoom] = pd.DataFrame({'cases': cases, 'locations': locations, 'representative': representative})
+    return levels
+
+
+def cluster_features(totals: pd.DataFrame, clusters: pd.DataFrame):
+    '''
+    GeoJSON features of a cluster level, at the representative locations.
+    '''
+    rep = totals.iloc[clusters.representative.values]
+    columns = ['city', 'province', 'country', 'geo_resolution']
+    lon = rep.longitude.astype(float).tolist()
+    lat = rep.latitude.astype(float).tolist()
+    for x, y, row, cases, n in zip(lon, lat, rep[columns].itertuples(index=False),
+                                   clusters.cases.tolist(), clusters.locations.tolist()):
+        yield {
+                'type': 'Feature',
+                'geometry': {
+                    'type': 'Point',
+                    'coordinates': [x, y]
+                },
+                'properties': {
+                    'cases': cases,
+                    'locations': n,
+                    'city': row.city,
+                    'province': row.province,
+                    'country': row.country,
+                    'geo_resolution': row.geo_resolution
+                }
+        }
+
+
+def write_clusters(outdir: str, totals: pd.DataFrame, min_zoom: int = MIN_ZOOM, max_zoom: int = MAX_ZOOM,
+                   cell_size: int = CELL_SIZE) -> dict:
+    '''
+    Write one FeatureCollection per zoom level (<outdir>/<z>.geojson) and an
+    index.json, replacing outdir atomically.
+
+    Returns :
+        index (dict) : content of index.json (number of clusters by zoom).
+    '''
+    totals = totals.reset_index(drop=True)
+    levels = cluster_levels(totals, min_zoom, max_zoom, cell_size)
+    index = {'minzoom': min_zoom, 'maxzoom': max_zoom, 'cell_size': cell_size, 'clusters': {}}
+
+    parent = os.path.dirname(os.path.abspath(outdir))
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, prefix='.clusters-')
+    os.chmod(tmp, 0o755) # served as is
+    try:
+        for zoom in sorted(levels):
+            path = os.path.join(tmp, '{}.geojson'.format(zoom))
+            index['clusters'][str(zoom)] = write_feature_collection(cluster_features(totals, levels[zoom]), path)
+        with open(os.path.join(tmp, 'index.json'), 'w') as F:
+            json.dump(index, F)
+        replace_directory(tmp, outdir)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return index
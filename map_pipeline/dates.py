@@ -0,0 +1,77 @@
+'''
+Date parsing shared by the pipeline stages.
+
+Dates in the sheets are dd.mm.yyyy, or ranges : "a - b", "- b" (up to b),
+"a -" (from a). A date column has a few hundred distinct values for millions
+of rows, so every function here parses each distinct string once (and
+remembers it for the next calls), then maps the results back to the rows.
+'''
+import pandas as pd
+
+
+DATE_FORMAT = '%d.%m.%Y'
+RANGE_SEPARATOR = '-'
+
+# (format, string) -> parsed date (NaT when it doesn't parse).
+_parsed = {}
+MAX_MEMO = 100000
+
+
+def _parse_unique(unique: pd.Index, date_format: str) -> pd.DatetimeIndex:
+    '''Parse distinct strings, only those not seen before are parsed.'''
+    new = [x for x in unique if (date_format, x) not in _parsed]
+    if new:
+        if len(_parsed) + len(new) > MAX_MEMO:
+            _parsed.clear()
+        parsed = pd.to_datetime(pd.Series(new, dtype=object), format=date_format, exact=True, errors='coerce')
+        _parsed.update(zip([(date_format, x) for x in new], parsed))
+    return pd.DatetimeIndex([_parsed.get((date_format, x), pd.NaT) for x in unique])
+
+
+def _distinct(values: pd.Series):
+    '''Integer code of each value (-1 for missing values) and the distinct values.'''
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.values, pd.Index(values.cat.categories.astype(str))
+    codes, unique = pd.factorize(values)
+    return codes, pd.Index(unique).astype(str)
+
+
+def _take(parsed: pd.DatetimeIndex, codes, index) -> pd.Series:
+    '''Map the parsed distinct values back to the rows, NaT for missing values.'''
+    values = parsed.take(codes, allow_fill=True, fill_value=pd.NaT) if len(parsed) else pd.NaT
+    return pd.Series(values, index=index, dtype='datetime64[ns]')
+
+
+def parse_dates(values: pd.Series, date_format: str = DATE_FORMAT) -> pd.Series:
+    '''
+    Parse a column of single dates (exactly date_format), NaT for values
+    that don't parse (e.g. ranges) and missing values.
+
+    Returns :
+        dates (pd.Series) : datetime64, with the index of values.
+    '''
+    codes, unique = _distinct(values)
+    return _take(_parse_unique(unique, date_format), codes, values.index)
+
+
+def split_ranges(unique: pd.Index):
+    '''Start and end strings of dates and ranges, the same string for single dates.'''
+    parts = pd.Series(unique, dtype=object).str.split(RANGE_SEPARATOR)
+    return pd.Index(parts.str[0].str.strip()), pd.Index(parts.str[-1].str.strip())
+
+
+def parse_ranges(values: pd.Series, date_format: str = DATE_FORMAT) -> pd.DataFrame:
+    '''
+    Start and end of each date or range, single dates start and end on the
+    same day, open ranges have a NaT start ("- b") or end ("a -").
+
+    Returns :
+        dates (pd.DataFrame) : date_start and date_end (datetime64), with the
+        index of values.
+    '''
+    codes, unique = _distinct(values)
+    start, end = split_ranges(unique)
+    return pd.DataFrame({
+        'date_start': _take(_parse_unique(start, date_format), codes, values.index),
+        'date_end': _take(_parse_unique(end, date_format), codes, values.index),
+    }, index=values.index)
@@ -0,0 +1,104 @@
+'''
+Conditional, streamed downloads of the pipeline inputs (JHU time series,
+latestdata.csv).
+
+All requests go through one pooled requests.Session. Responses are written
+to disk chunk by chunk, to a temporary file renamed over the destination
+once complete, so an interrupted download never leaves a truncated file.
+
+The ETag/Last-Modified of the last download are kept in a sidecar file
+(<path>.http.json) and sent back on the next request : when the server
+answers 304 Not Modified the file is left as it is and fetch returns False,
+so that the pipeline can skip the stages depending on it.
+'''
+import json
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from pipeline_common.files import atomic_write
+
+
+CHUNK_SIZE = 1 << 20 # 1MB
+TIMEOUT = 60 # seconds, to connect and between chunks
+
+_session = None
+
+
+def get_session() -> requests.Session:
+    '''
+    Session shared by every download (connection pooling), retrying
+    connection errors and 502/503/504 answers with backoff.
+    '''
+    global _session
+    if _session is None:
+        retry = Retry(total=3, backoff_factor=1, status_forcelist=[502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry)
+        _session = requests.Session()
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+    return _session
+
+
+def sidecar_path(path: str) -> str:
+    '''Validators (ETag, Last-Modified) of the file at path.'''
+    return path + '.http.json'
+
+
+def load_validators(path: str, url: str) -> dict:
+    '''
+    Validators saved with the file at path, only if it still exists and was
+    downloaded from the same url.
+    '''
+    if not os.path.exists(path) or not os.path.exists(sidecar_path(path)):
+        return {}
+    with open(sidecar_path(path)) as F:
+        validators = json.load(F)
+    if validators.get('url') != url:
+        return {}
+    return validators
+
+
+def fetch(url: str, path: str, session: requests.Session = None, timeout: float = TIMEOUT,
+          chunk_size: int = CHUNK_SIZE) -> bool:
+    '''
+    Download url to path, unless it didn't change since the last download.
+
+    Args :
+        url (str) : url to download.
+        path (str) : destination file.
+        session (requests.Session) : defaults to the shared session.
+        timeout (float) : seconds to connect, and between chunks.
+        chunk_size (int) : size of the chunks written to disk.
+
+    Returns :
+        modified (bool) : True if path was (re)written, False if the server
+        answered 304 Not Modified.
+
+    Raises :
+        requests.RequestException : connection error or error status, path
+        is left untouched.
+    '''
+    session = session or get_session()
+    validators = load_validators(path, url)
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 304:
+            return False
+        response.raise_for_status()
+        atomic_write(path, response.iter_content(chunk_size=chunk_size))
+        validators = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+
+    atomic_write(sidecar_path(path), [json.dumps(validators)], mode='w')
+    return True
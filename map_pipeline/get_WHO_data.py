@@ -7,17 +7,25 @@ Query copied after using interface at :
 
 import requests
 import json
- 
-query = 'https://services.arcgis.com/5T5nSi527N4F7luB/ArcGIS/rest/services/COVID_19_CasesByCountry(pl)_VIEW/FeatureServer/0/query?where=1%3D1&objectIds=&time=&geometry=&geometryType=esriGeometryEnvelope&inSR=&spatialRel=esriSpatialRelIntersects&resultType=none&distance=0.0&units=esriSRUnit_Meter&returnGeodetic=true&outFields=cum_conf%2C+ADM0_NAME&returnGeometry=false&returnCentroid=true&featureEncoding=esriDefault&multipatchOption=xyFootprint&maxAllowableOffset=&geometryPrecision=&outSR=&datumTransformation=&applyVCSProjection=false&returnIdsOnly=false&returnUniqueIdsOnly=false&returnCountOnly=false&returnExtentOnly=false&returnQueryGeometry=false&returnDistinctValues=false&cacheHint=false&orderByFields=&groupByFieldsForStatistics=&outStatistics=&having=&resultOffset=&resultRecordCount=&returnZ=false&returnM=false&returnExceededLimitFeatures=true&quantizationParameters=&sqlFormat=none&f=pjson&token='
 
-req = requests.get(query)
+WHO_QUERY = 'https://services.arcgis.com/5T5nSi527N4F7luB/ArcGIS/rest/services/COVID_19_CasesByCountry(pl)_VIEW/FeatureServer/0/query?where=1%3D1&objectIds=&time=&geometry=&geometryType=esriGeometryEnvelope&inSR=&spatialRel=esriSpatialRelIntersects&resultType=none&distance=0.0&units=esriSRUnit_Meter&returnGeodetic=true&outFields=cum_conf%2C+ADM0_NAME&returnGeometry=false&returnCentroid=true&featureEncoding=esriDefault&multipatchOption=xyFootprint&maxAllowableOffset=&geometryPrecision=&outSR=&datumTransformation=&applyVCSProjection=false&returnIdsOnly=false&returnUniqueIdsOnly=false&returnCountOnly=false&returnExtentOnly=false&returnQueryGeometry=false&returnDistinctValues=false&cacheHint=false&orderByFields=&groupByFieldsForStatistics=&outStatistics=&having=&resultOffset=&resultRecordCount=&returnZ=false&returnM=false&returnExceededLimitFeatures=true&quantizationParameters=&sqlFormat=none&f=pjson&token='
 
-if req.status_code == 200:
+
+def get_WHO_data(url: str = WHO_QUERY, timeout: float = 60) -> dict:
+    '''
+    Counts by country from the WHO RestAPI, as saved for the side bar.
+    '''
+    req = requests.get(url, timeout=timeout)
+    req.raise_for_status()
     data = json.loads(req.text)
-    features = {'features': data['features']}
+    return {'features': data['features']}
+
+
+def save_WHO_data(features: dict, paths: list) -> None:
+    for path in paths:
+        with open(path, 'w') as F:
+            json.dump(features, F)
 
-    with open('/path/to/archive/who.json', 'w') as F:
-        json.dump(features, F)
 
-    with open('/path/to/site/who.json', 'w') as F: 
-        json.dump(features, F)
+if __name__ == '__main__':
+    save_WHO_data(get_WHO_data(), ['/path/to/archive/who.json', '/path/to/site/who.json'])
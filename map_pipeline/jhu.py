@@ -0,0 +1,310 @@
+'''
+Ingestion of the JHU US time series (time_series_covid19_confirmed_US.csv).
+
+The JHU file is "wide": one row per US county and one column per date with
+cumulative counts. The map pipeline needs the same structure as the line
+list, i.e. one row per case, so the cumulative counts are diffed per day and
+each daily increment is expanded into that many rows. The weighted form (one
+row per date and location, with the number of cases in `cases`) is also
+available so that downstream code doesn't have to expand the counts at all.
+
+Everything here is done column-wise with NumPy/pandas, the output is
+identical to the row by row loop it replaces (same order, same JHU<n> IDs).
+
+Runs can be incremental (see update_weighted) : the weighted rows and a
+small state file (last date, last ID, a hash of the cumulative counts of
+every location) are kept next to the JHU file, and only the date columns
+added since the last run are diffed.
+'''
+import hashlib
+import json
+import os
+import re
+import tempfile
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+from cache import is_case_cache, load_untyped_table, save_case_table
+from dates import DATE_FORMAT, parse_dates
+
+
+JHU_URL = 'https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_confirmed_US.csv'
+
+# Date columns in the JHU header look like 1/22/20 (m/d/yy).
+JHU_DATE_PATTERN = r'\d{1,2}/\d{1,2}/\d'
+JHU_DATE_FORMAT = '%m/%d/%y'
+
+# Final column order, same as the sheet data.
+COLUMNS = ['ID', 'latitude', 'longitude', 'city', 'province', 'country',
+           'age', 'sex', 'symptoms', 'source', 'date_confirmation', 'geo_resolution']
+
+
+def read_jhu(path: str) -> pd.DataFrame:
+    '''
+    Read a JHU time series file, everything is kept as strings.
+    '''
+    return pd.read_csv(path, dtype=str)
+
+
+def rename_date_columns(us_data: pd.DataFrame) -> Tuple[pd.DataFrame, list]:
+    '''
+    Rename the JHU date columns (m/d/yy) to match sheet format (dd.mm.yyyy).
+    All columns are renamed in a single pass.
+
+    Returns :
+        data (pd.DataFrame) : copy of us_data with renamed columns.
+        date_columns (list) : renamed date columns, sorted chronologically.
+    '''
+    jhu_columns = pd.Series([c for c in us_data.columns if re.match(JHU_DATE_PATTERN, c)], dtype=object)
+    parsed = parse_dates(jhu_columns, JHU_DATE_FORMAT).sort_values(kind='mergesort')
+    renamed = parsed.dt.strftime(DATE_FORMAT)
+
+    data = us_data.rename(columns=dict(zip(jhu_columns[parsed.index], renamed)))
+    return data, renamed.tolist()
+
+
+def located(us_data: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Locations with coordinates (not null nor 0), the others aren't mapped.
+    '''
+    lat = pd.to_numeric(us_data['Lat'])
+    lon = pd.to_numeric(us_data['Long_'])
+    valid = lat.notnull() & lon.notnull() & (lat != 0) & (lon != 0)
+    return us_data[valid.values]
+
+
+def daily_counts(us_data: pd.DataFrame, date_columns: list) -> pd.DataFrame:
+    '''
+    Diff the cumulative counts of every location and flatten them to one row
+    per (date, location) with new cases, in date major order (the order in
+    which IDs are handed out).
+
+    Locations without coordinates (null or 0) are dropped, as are negative
+    daily differences (corrections on JHU's side).
+
+    Returns :
+        counts (pd.DataFrame) : latitude, longitude, city, province,
+        date_confirmation and cases (number of new cases on that date).
+    '''
+    locations = located(us_data)
+
+    cumulative = locations[date_columns].values.astype(np.int64)
+    new = np.diff(cumulative, axis=1, prepend=0)
+    new = np.clip(new, 0, None)
+
+    # date major : transpose before flattening.
+    new = new.T.ravel()
+    nrows = len(locations)
+    row_idx = np.tile(np.arange(nrows), len(date_columns))
+    date_idx = np.repeat(np.arange(len(date_columns)), nrows)
+
+    keep = new > 0
+    row_idx = row_idx[keep]
+    date_idx = date_idx[keep]
+
+    counts = pd.DataFrame({
+        'latitude': locations['Lat'].values[row_idx],
+        'longitude': locations['Long_'].values[row_idx],
+        'city': locations['Admin2'].values[row_idx],
+        'province': locations['Province_State'].values[row_idx],
+        'date_confirmation': np.asarray(date_columns, dtype=object)[date_idx],
+        'cases': new[keep],
+    })
+    return counts
+
+
+def to_sheet_format(counts: pd.DataFrame, first_id: int = 1) -> pd.DataFrame:
+    '''
+    Add the columns needed to match the sheet structure to the daily counts,
+    keeping one weighted row per (date, location).
+
+    The ID of a weighted row is the ID of the first case it stands for, IDs
+    of the following cases are consecutive (see expand_cases). Numbering
+    starts at first_id.
+    '''
+    data = counts.reset_index(drop=True)
+    first = np.cumsum(data['cases'].values) - data['cases'].values + first_id
+    data['ID'] = 'JHU' + pd.Series(first, dtype=object).astype(str)
+    data['country'] = 'United States'
+    data['age'] = ''
+    data['sex'] = ''
+    data['symptoms'] = ''
+    data['source'] = 'JHU'
+    data['geo_resolution'] = 'admin2'
+    return data[COLUMNS + ['cases']]
+
+
+def expand_cases(data: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Expand weighted rows (`cases` column) to one row per case, rows without
+    a weight count as a single case. JHU IDs are numbered consecutively from
+    the ID of the weighted row.
+    '''
+    if 'cases' not in data.columns:
+        return data.copy()
+
+    weights = data['cases'].fillna(1).values.astype(np.int64)
+    expanded = data.drop('cases', axis=1).iloc[np.repeat(np.arange(len(data)), weights)]
+    expanded = expanded.reset_index(drop=True)
+
+    # position of each case within its weighted row.
+    starts = np.cumsum(weights) - weights
+    offset = np.arange(len(expanded)) - np.repeat(starts, weights)
+    is_jhu = (expanded['ID'].str.match(r'^JHU\d+$') == True).values & (offset > 0)
+    if is_jhu.any():
+        expanded['ID'] = expanded['ID'].astype(object)
+        first = expanded.loc[is_jhu, 'ID'].str[3:].astype(np.int64).values
+        expanded.loc[is_jhu, 'ID'] = 'JHU' + pd.Series(first + offset[is_jhu], dtype=object).astype(str).values
+    return expanded
+
+
+def jhu_to_weighted(us_data: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Reformat the JHU time series to have the same structure as the sheets,
+    with one row per (date, location) and the number of cases in `cases`.
+    '''
+    us_data, date_columns = rename_date_columns(us_data)
+    counts = daily_counts(us_data, date_columns)
+    return to_sheet_format(counts)
+
+
+def jhu_to_line_list(us_data: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Reformat the JHU time series to have the same structure as the sheets,
+    one row per case.
+    '''
+    return expand_cases(jhu_to_weighted(us_data))
+
+
+def weighted_path(jhu_file: str) -> str:
+    '''Weighted JHU rows from the previous runs, kept next to the JHU file.'''
+    return os.path.splitext(jhu_file)[0] + '.weighted.cache'
+
+
+def state_path(jhu_file: str) -> str:
+    '''State of the previous run, kept next to the JHU file.'''
+    return os.path.splitext(jhu_file)[0] + '.state.json'
+
+
+def load_state(path: str) -> dict:
+    '''
+    State saved by the previous run, None if there is none.
+
+    Returns :
+        state (dict) : last_date (dd.mm.yyyy), last_id (last JHU<n> issued)
+        and hashes (hash of the cumulative counts of each location on every
+        date up to last_date, by UID, see count_hashes).
+    '''
+    if not os.path.exists(path):
+        return None
+    with open(path) as F:
+        return json.load(F)
+
+
+def save_state(state: dict, path: str) -> None:
+    '''Write the state atomically (temporary file + rename).'''
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmppath = tempfile.mkstemp(dir=directory, prefix='.state-')
+    try:
+        with os.fdopen(fd, 'w') as F:
+            json.dump(state, F)
+        os.replace(tmppath, path)
+    except BaseException:
+        os.remove(tmppath)
+        raise
+
+
+def count_hashes(us_data: pd.DataFrame, date_columns: list) -> dict:
+    '''
+    Hash of the cumulative counts of each location in date_columns, by UID :
+    a count revised on any of these dates changes the hash of its location.
+    '''
+    locations = located(us_data)
+    counts = np.ascontiguousarray(locations[date_columns].astype(np.int64).values)
+    hashes = [hashlib.blake2b(row.tobytes(), digest_size=8).hexdigest() for row in counts]
+    return dict(zip(locations['UID'].astype(str), hashes))
+
+
+def run_state(us_data: pd.DataFrame, date_columns: list, last_id: int) -> dict:
+    '''
+    State after processing us_data (with renamed date columns) up to its last
+    date column.
+    '''
+    return {
+        'last_date': date_columns[-1],
+        'last_id': int(last_id),
+        'hashes': count_hashes(us_data, date_columns),
+    }
+
+
+def update_weighted(us_data: pd.DataFrame, previous: pd.DataFrame = None, state: dict = None) -> Tuple[pd.DataFrame, dict]:
+    '''
+    Weighted JHU rows (as jhu_to_weighted), only diffing the date columns
+    added since the run that produced previous and state.
+
+    The result is the same as jhu_to_weighted on the whole file. Everything
+    is rebuilt when there is no previous run, or when it no longer matches
+    the file : last date missing, locations added or removed, or the
+    cumulative count of any date up to the last date revised by JHU (the
+    counts of each location are compared by hash, see count_hashes).
+
+    Only the diff and the new weighted rows are limited to the added dates :
+    every run still parses and hashes the counts of all the processed dates
+    (about 0.1s for 3300 locations over 300 days, python benchmark.py
+    jhu-update), including runs without any new date.
+
+    Args :
+        us_data (pd.DataFrame) : JHU time series (see read_jhu).
+        previous (pd.DataFrame) : weighted rows from the previous run.
+        state (dict) : state from the previous run.
+
+    Returns :
+        weighted (pd.DataFrame) : weighted rows for every date.
+        state (dict) : state to pass to the next run (see load_state).
+    '''
+    us_data, date_columns = rename_date_columns(us_data)
+
+    # The rows and state are saved separately, a run interrupted in between leaves them out of sync.
+    in_sync = previous is not None and state is not None and previous['cases'].sum() == state['last_id']
+    if in_sync and state['last_date'] in date_columns:
+        processed = date_columns[:date_columns.index(state['last_date']) + 1]
+        if count_hashes(us_data, processed) == state.get('hashes'):
+            new_columns = date_columns[len(processed):]
+            if not new_columns:
+                return previous, state
+            # The last processed column is only there to diff the first new one.
+            counts = daily_counts(us_data, [state['last_date']] + new_columns)
+            counts = counts[counts.date_confirmation != state['last_date']]
+            added = to_sheet_format(counts, state['last_id'] + 1)
+            weighted = pd.concat([previous, added], ignore_index=True, sort=False)
+            return weighted, run_state(us_data, date_columns, state['last_id'] + added['cases'].sum())
+
+    counts = daily_counts(us_data, date_columns)
+    weighted = to_sheet_format(counts)
+    return weighted, run_state(us_data, date_columns, weighted['cases'].sum())
+
+
+def load_weighted(path: str) -> pd.DataFrame:
+    '''Weighted JHU rows saved by save_case_table(..., typed=False).'''
+    return load_untyped_table(path)
+
+
+def update_jhu_file(jhu_file: str, full_rebuild: bool = False) -> pd.DataFrame:
+    '''
+    Weighted JHU rows for jhu_file, reusing the previous run unless
+    full_rebuild is set. The rows and state are saved for the next run.
+    '''
+    weightedpath = weighted_path(jhu_file)
+    statepath = state_path(jhu_file)
+    previous, state = None, None
+    if not full_rebuild and is_case_cache(weightedpath):
+        previous = load_weighted(weightedpath)
+        state = load_state(statepath)
+
+    weighted, new_state = update_weighted(read_jhu(jhu_file), previous, state)
+    if new_state != state:
+        save_case_table(weighted, weightedpath, typed=False)
+        save_state(new_state, statepath)
+    return weighted
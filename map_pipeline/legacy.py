@@ -0,0 +1,96 @@
+'''
+Reference implementations : the previous code of functions.py, before it
+was vectorized in aggregation.py. The tests check the new code against them
+and benchmark.py times both.
+
+The code is kept as it was in functions.py, except where noted.
+'''
+import pandas as pd
+
+
+def legacy_reduce(data: pd.DataFrame) -> list:
+    '''
+    Get counts for unique locations (by lat/long combination). 
+    Output is a records style list [{d1}, {d2}, ... {}]. 
+
+    Does some situatinal name changing for consistency, but this should be done on Curator's side.
+    '''
+    df = data.copy()
+    groups = df.groupby(['latitude', 'longitude'])
+    
+
+    results = []
+    for g in groups:
+        lat, lon = g[0]
+        cut      = g[1]
+        count    = len(cut)
+        try:
+            # Uniques to flag inconsistencies. 
+            cities = cut.city.unique()
+            provinces = cut.province.unique()
+            countries = cut.country.unique()
+    
+            # Subject to change. 
+            city     = cities[0]
+            province = provinces[0]
+            country  = countries[0]
+
+            if 'Singapore' in countries:
+                city = ''
+                province = ''
+                country = 'Singapore'
+
+            elif 'Macau' in provinces:
+                city = ''
+                province = 'Macau'
+                country = 'China'
+
+            else:
+                # get city that occurs the most.
+                if len(cities) > 1:
+                    vcounts = cut.city.value_counts()
+                    city = vcounts[vcounts == vcounts.max()].index[0]
+
+            # Only display this info on map if N cases == 1
+            age = cut.age.values[0] if count == 1 else ''
+            sex = cut.sex.values[0] if count == 1 else ''
+            symptoms = cut.symptoms.values[0] if count == 1 else ''
+            source = cut.source.values[0] if count == 1 else ''
+            date_confirmation = cut.date_confirmation.values[0] if count == 1 else '' # was undefined (NameError)
+            geo_resolution = cut.geo_resolution.values[0]
+           
+            d = {
+                    'latitude': lat,
+                    'longitude': lon,
+                    'city': city,
+                    'province': province,
+                    'country': country,
+                    'age': age,
+                    'sex': sex,
+                    'symptoms': symptoms,
+                    'source': source,
+                    'date_confirmation': date_confirmation,
+                    'cases': count,
+                    'geo_resolution' : geo_resolution
+                }
+            results.append(d)
+
+        except:
+            d = {
+                    'latitude': lat,
+                    'longitude': lon,
+                    'city': city,
+                    'province': province,
+                    'country': country,
+                    'age': '',
+                    'sex': '',
+                    'symptoms': '',
+                    'source': '',
+                    'date_confirmation' : '',
+                    'cases': count,
+                    'geo_resolution': geo_resolution
+                }
+            results.append(d)
+
+    return results
+
@@ -10,13 +10,24 @@ email  : thomas.brewer@childrens.harvard.edu
 
 testing = True
 
+import argparse
 import configparser
 import pandas as pd
-from shutil import copyfile
 from functions import *
-import requests
+from jhu import JHU_URL, update_jhu_file, expand_cases
+from tiles import write_tiles, MIN_ZOOM, MAX_ZOOM
+from clusters import write_clusters, CELL_SIZE
+from timeline import write_timeline, write_timeline_json, COORDINATE_PRECISION
+from publish import publish, html_targets
+from fetch import fetch
+from acquire import Source, acquire
+from side_bar import side_bar_sources, save_side_bar
+from sheets_api import SheetsSession
+from validation import format_rejections
+from schema import apply_schema, as_text
+from collections import Counter
+from functools import partial
 import sys
-import re
 
 configfile = '/var/www/scripts/covid-19/DataPipeline/.CONF'
 config = configparser.ConfigParser()
@@ -25,20 +36,44 @@ logfile = config['FILES'].get('LOG')
 
 
 jhu_file = config['FILES']['JHU']
-jhu_url = 'https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_confirmed_US.csv'
+
+FETCH_TIMEOUT = 600 # seconds, for each source
 
 COLNAMES = ['ID', 'latitude', 'longitude', 'city', 'province', 'country',
             'age', 'sex', 'symptoms', 'source', 'date_confirmation', 'geo_resolution'] # desired columns from sheets
 # A1 notation ranges from sheets
 
+parser = argparse.ArgumentParser(description='Fetch and reformat data for the map')
+parser.add_argument('--full-rebuild', action='store_true',
+                    help='Reprocess every JHU date column instead of only the new ones')
+
+
 def main():
+    args = parser.parse_args()
     try :
         sheets       = get_GoogleSheets(config)
         unique_data  = []
         full_data    = []
 
-        for sheet in sheets:
-            sheet.data = load_sheet(sheet, config)
+        # Sheets, JHU and side bar data are fetched concurrently, every sheet is needed for the map.
+        # All sheets are read with the same credentials and Sheets service.
+        session = SheetsSession.from_config(config)
+        names   = [f'{sheet.ID}-{sheet.name}' for sheet in sheets]
+        rejected = {name: Counter() for name in names}
+        sources = [Source(name, partial(load_sheet, sheet, config, session, rejected[name]), FETCH_TIMEOUT)
+                   for name, sheet in zip(names, sheets)]
+        sources.append(Source('jhu', partial(fetch, JHU_URL, jhu_file), FETCH_TIMEOUT))
+        sources.extend(side_bar_sources(config))
+        results, errors = acquire(sources)
+        for name, Err in errors.items():
+            log_message(f'{name} fetch failed, {Err}', config)
+        for name in names:
+            if name in errors:
+                raise errors[name]
+        save_side_bar(results, config)
+
+        for name, sheet in zip(names, sheets):
+            sheet.data = results[name]
             # Edit ids in original to keep track
             if sheet.name == 'outside_Hubei':
                 sheet.data.ID = sheet.data.ID.apply(lambda x: f'000-1-{x}')
@@ -49,77 +84,34 @@ def main():
             filter_ = ~sheet.data.country.isin(['United States', 'Virgin Islands, U.S.'])
             sheet.data = sheet.data[filter_]
 
-            full= clean_data(sheet.data, COLNAMES)
+            # Typed once here (coordinates, dates, categories), as in pipeline.py.
+            full= apply_schema(clean_data(sheet.data, COLNAMES, rejected[name]))
             full_data.append(full)
+            if rejected[name]:
+                log_message(f'{name} rows left out, {format_rejections(rejected[name])}', config)
 
 
         #  type change list -> DataFrame
         full_data = pd.concat(full_data, ignore_index=True, sort=False)
 
-        # Get JHU data
-        req = requests.get(jhu_url)
-        if req.status_code == 200:
-            with open(jhu_file, 'w') as F:
-                F.write(req.text)
-        
-        us_data = pd.read_csv(jhu_file, dtype=str)
-      
-        # rename date columns to match sheet format (%d.%m.%d)
-        rx = '\d{1,2}/\d{1,2}/\d'
-        date_columns = []
-        for c in us_data.columns:
-            if re.match(rx, c):
-                month, day, year = c.split('/')
-                month = str(month).zfill(2)
-                day   = str(day).zfill(2)
-                year = '20' + str(year)
-                date = '{}.{}.{}'.format(day, month, year)
-                date_columns.append(date)
-                us_data.rename({c : date}, axis=1, inplace=True)
-        date_columns = sorted(date_columns, key=lambda x: pd.to_datetime(x, format='%d.%m.%Y'))
-        
-        # reformat JHU to have same structure as sheet
-        # This may seem silly because we unpack and then reduce to Unique again, 
-        # we do it because the "full_data" file is sent to FM-Global
-
-        # only defining columns where values will change for now.
-        # Loop is done in this order so that IDs persist. 
-        print(len(us_data[us_data.Lat.astype(float) == 0]))
-        us_reformed = pd.DataFrame(columns=['latitude', 'longitude', 'city', 'province', 'date_confirmation'])
-        for i, date in enumerate(date_columns):
-            print(date)
-            for j, row in us_data.iterrows():
-                if float(row['Lat']) == 0 or float(row['Long_']) == 0:
-                    continue
-
-                if i == 0:
-                    N = int(row[date])
-                else:
-                    N = int(row[date]) - int(row[date_columns[i-1]])
-                entry = {
-                        'latitude': row['Lat'],
-                        'longitude': row['Long_'],
-                        'city': row['Admin2'],
-                        'province': row['Province_State'],
-                        'date_confirmation': date
-                }
-                us_reformed = us_reformed.append([entry]*N, ignore_index=True)
-
-        print(len(us_reformed[us_reformed['latitude'].astype(float) == 0]))
-        us_reformed.insert(0, 'ID', range(1, len(us_reformed) + 1))
-        us_reformed['ID'] = us_reformed['ID'].apply(lambda x : 'JHU' + str(x))
-        us_reformed.insert(5, 'country', 'United States')
-        us_reformed.insert(6, 'age', '')
-        us_reformed.insert(7, 'sex', '')
-        us_reformed.insert(8, 'symptoms', '')
-        us_reformed.insert(9, 'source', 'JHU')
-        us_reformed.insert(11, 'geo_resolution', 'admin2')
-
-        full_data = full_data.append(us_reformed, ignore_index = True)
+        # reformat JHU to have same structure as sheet, with one row per date and location
+        # weighted by the number of cases, counts are only unpacked for the "full_data" export.
+        # Only the dates added since the last run are processed (unless --full-rebuild).
+        us_weighted = update_jhu_file(jhu_file, args.full_rebuild)
+
+        full_data = full_data.append(us_weighted, ignore_index = True, sort=False)
+        full_data['cases'] = case_weights(full_data)
+        full_data = apply_schema(full_data) # the JHU rows are text
         unique_data = reduceToUnique(full_data) 
-        full_data = {'data': full_data.to_dict(orient='records')}
+
+        # Columnar cache of the merged table, read by later runs and s3push.py
         fullpath  = config['FILES'].get('FULL')
-        savedata(full_data, fullpath)
+        cachepath = config['FILES'].get('CACHE', cache_path(fullpath or './full-data.json'))
+        save_case_table(full_data, cachepath)
+
+        # One row per case, the "full_data" file is sent to FM-Global
+        if fullpath:
+            savedata({'data': as_text(expand_cases(full_data)).to_dict(orient='records')}, fullpath)
         
         # aggregated data
         unique_data = {'data': unique_data} 
@@ -128,7 +120,7 @@ def main():
 
         # animation data
         anipath = config['FILES'].get('ANIMATION')
-        anidata = animation_formating(fullpath)
+        anidata = animation_formating(full_data)
         savedata(anidata, anipath)
 
         # aggregated data, geojson
@@ -142,23 +134,39 @@ def main():
         #savedata(unique_data, uniquepath)
 
         geo_uniquepath = config['FILES'].get('GEO_TOTALS')
-        convert_to_geojson(uniquepath, geo_uniquepath)
+        convert_to_geojson(unique_data, geo_uniquepath)
 
         geo_anipath    = config['FILES'].get('GEO_ANIME')
-        animation_formating_geo(fullpath, geo_anipath)
+        animation = animation_formating_geo(full_data, geo_anipath)
+
+        # Same cells as compact timelines (+ precompressed copies), when a path is set
+        if config.has_section('TIMELINE'):
+            timeline_config = config['TIMELINE']
+            if timeline_config.get('BINARY'):
+                write_timeline(*animation, timeline_config['BINARY'])
+            if timeline_config.get('JSON'):
+                write_timeline_json(*animation, timeline_config['JSON'],
+                                    timeline_config.getint('PRECISION', COORDINATE_PRECISION))
+
+        # Totals and animation split in map tiles, when a tiles directory is set
+        if config.has_section('TILES'):
+            tile_config = config['TILES']
+            write_tiles(tile_config['DIR'], as_frame(unique_data), animation,
+                        tile_config.getint('MIN_ZOOM', MIN_ZOOM), tile_config.getint('MAX_ZOOM', MAX_ZOOM))
+
+        # Totals clustered by zoom level, when a clusters directory is set
+        if config.has_section('CLUSTERS'):
+            cluster_config = config['CLUSTERS']
+            write_clusters(cluster_config['DIR'], as_frame(unique_data),
+                           cluster_config.getint('MIN_ZOOM', MIN_ZOOM), cluster_config.getint('MAX_ZOOM', MAX_ZOOM),
+                           cluster_config.getint('CELL_SIZE', CELL_SIZE))
         
 
         if not testing:
-            # Copy files to HTML directoryi
-            htmlpath1 = config['HTML'].get('TOTALS')
-            htmlpath2 = config['HTML'].get('ANIMATION')
-            copyfile(uniquepath, htmlpath1) 
-            copyfile(anipath, htmlpath2)
-
-            htmlpath1 = config['HTML'].get('GEO_TOTALS')
-            htmlpath2 = config['HTML'].get('GEO_ANIME')
-            copyfile(geo_uniquepath, htmlpath1)
-            copyfile(geo_anipath, htmlpath2)
+            # Publish to the HTML directory, only the files that changed are copied
+            outputs = {'TOTALS': uniquepath, 'ANIMATION': anipath,
+                       'GEO_TOTALS': geo_uniquepath, 'GEO_ANIME': geo_anipath}
+            publish(html_targets(config['HTML'], outputs))
 
     except Exception as Err:
         message = f'Update Error, {Err}'
@@ -10,13 +10,27 @@ email  : thomas.brewer@childrens.harvard.edu
 
 testing = True
 
+import argparse
 import configparser
 import pandas as pd
-from shutil import copyfile
 from functions import *
-import requests
+from jhu import JHU_URL, update_jhu_file, expand_cases, load_weighted, weighted_path
+from tiles import write_tiles, MIN_ZOOM, MAX_ZOOM
+from clusters import write_clusters, CELL_SIZE
+from timeline import write_timeline, write_timeline_json, read_timeline, COORDINATE_PRECISION
+from publish import publish, html_targets
+from fetch import fetch
+from stages import Stage, PipelineLocked, run_lock, run_stages
+from pipeline_common.metrics import RunMetrics
+from cache import load_case_table, load_untyped_table
+from schema import apply_schema, as_text
+from acquire import Source, acquire
+from side_bar import side_bar_sources, save_side_bar
+from validation import format_rejections
+from collections import Counter
+from functools import partial
+import os
 import sys
-import re
 
 configfile = './.CONF'
 config = configparser.ConfigParser()
@@ -25,118 +39,194 @@ logfile = config['FILES'].get('LOG')
 
 
 jhu_file = config['FILES']['JHU']
-jhu_url = 'https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_confirmed_US.csv'
+
+LATEST_DATA_URL = 'https://raw.githubusercontent.com/beoutbreakprepared/nCoV2019/master/latest_data/latestdata.csv'
+FETCH_TIMEOUT = 600 # seconds, for each source
 
 COLNAMES = ['ID', 'latitude', 'longitude', 'city', 'province', 'country',
             'age', 'sex', 'symptoms', 'source', 'date_confirmation', 'geo_resolution'] # desired columns from sheets
 # A1 notation ranges from sheets
+
+parser = argparse.ArgumentParser(description='Fetch and reformat data for the map')
+parser.add_argument('--full-rebuild', action='store_true',
+                    help='Run every stage, and reprocess every JHU date column instead of only the new ones')
+parser.add_argument('--force', action='append', default=[], metavar='STAGE',
+                    help='Run a stage even when its inputs did not change (can be repeated)')
+
+# Time, memory and row counts of the stages, written at the end of the run ([METRICS])
+metrics = RunMetrics('map_pipeline', config.has_section('METRICS') and
+                     config['METRICS'].getboolean('TRACE_MEMORY', False))
+
+
+def fetch_stage(latest_data_path: str) -> None:
+    # Line list, JHU and side bar data, fetched concurrently. Line list and JHU files are
+    # only downloaded when they changed upstream, the map can't be built without the line list.
+    sources = [
+        Source('line_list', partial(fetch, LATEST_DATA_URL, latest_data_path), FETCH_TIMEOUT),
+        Source('jhu', partial(fetch, JHU_URL, jhu_file), FETCH_TIMEOUT),
+    ] + side_bar_sources(config)
+    results, errors = acquire(sources)
+    for name, Err in errors.items():
+        log_message(f'{name} fetch failed, {Err}', config)
+    if 'line_list' in errors:
+        sys.exit(1)
+    save_side_bar(results, config)
+
+
+def clean_stage(latest_data_path: str, cleanpath: str) -> None:
+    df = pd.read_csv(latest_data_path, dtype=str)
+    filter_ = ~df.country.isin(['United States', 'Virgin Islands, U.S.'])
+    df = df[filter_]
+    rejected = Counter()
+    # Typed once here (coordinates, dates, categories), the next stages read typed tables.
+    clean = apply_schema(clean_data(df, COLNAMES, rejected))
+    metrics.count(rows_in=len(df), rows_out=len(clean))
+    if rejected:
+        log_message(f'latestdata rows left out, {format_rejections(rejected)}', config)
+    save_case_table(clean, cleanpath)
+
+
+def jhu_stage(full_rebuild: bool) -> None:
+    weighted = update_jhu_file(jhu_file, full_rebuild)
+    metrics.count(rows_out=len(weighted))
+
+
+def merge_stage(cleanpath: str, mergedpath: str, cachepath: str) -> None:
+    full_data = load_case_table(cleanpath)
+    jhu_data = load_weighted(weighted_path(jhu_file))
+    metrics.count(rows_in=len(full_data) + len(jhu_data))
+    full_data = full_data.append(jhu_data, ignore_index = True, sort=False)
+    full_data['cases'] = case_weights(full_data)
+    full_data = apply_schema(full_data) # the JHU rows are text
+    save_case_table(full_data, mergedpath)
+    metrics.count(rows_out=len(full_data))
+    # Columnar cache of the merged table, read by later runs and s3push.py
+    save_case_table(full_data, cachepath)
+
+
+def reduce_stage(mergedpath: str, totalspath: str) -> None:
+    merged = load_case_table(mergedpath)
+    unique_data = reduceToUnique(merged)
+    metrics.count(rows_in=len(merged), rows_out=len(unique_data))
+    save_case_table(pd.DataFrame(unique_data), totalspath, typed=False)
+
+
+def full_stage(mergedpath: str, fullpath: str) -> None:
+    # One row per case, the "full_data" file is sent to FM-Global
+    merged = load_case_table(mergedpath)
+    cases = as_text(expand_cases(merged))
+    metrics.count(rows_in=len(merged), rows_out=len(cases))
+    savedata({'data': cases.to_dict(orient='records')}, fullpath)
+
+
+def timeline_outputs() -> list:
+    if not config.has_section('TIMELINE'):
+        return []
+    return [p for p in [config['TIMELINE'].get('BINARY'), config['TIMELINE'].get('JSON')] if p]
+
+
+def animation_stage(mergedpath: str, geo_anipath: str, animationpath: str) -> None:
+    merged = load_case_table(mergedpath)
+    animation = animation_formating_geo(merged, geo_anipath)
+    metrics.count(rows_in=len(merged), rows_out=len(animation[1]))
+    write_timeline(*animation, animationpath, compress=())
+
+    # Same cells as compact timelines (+ precompressed copies), when a path is set
+    if config.has_section('TIMELINE'):
+        timeline_config = config['TIMELINE']
+        if timeline_config.get('BINARY'):
+            write_timeline(*animation, timeline_config['BINARY'])
+        if timeline_config.get('JSON'):
+            write_timeline_json(*animation, timeline_config['JSON'],
+                                timeline_config.getint('PRECISION', COORDINATE_PRECISION))
+
+
+def tiles_stage(totalspath: str, animationpath: str) -> None:
+    # Totals and animation split in map tiles
+    tile_config = config['TILES']
+    totals = load_untyped_table(totalspath)
+    metrics.count(rows_in=len(totals))
+    write_tiles(tile_config['DIR'], totals, read_timeline(animationpath),
+                tile_config.getint('MIN_ZOOM', MIN_ZOOM), tile_config.getint('MAX_ZOOM', MAX_ZOOM))
+
+
+def clusters_stage(totalspath: str) -> None:
+    # Totals clustered by zoom level
+    cluster_config = config['CLUSTERS']
+    totals = load_untyped_table(totalspath)
+    metrics.count(rows_in=len(totals))
+    write_clusters(cluster_config['DIR'], totals,
+                   cluster_config.getint('MIN_ZOOM', MIN_ZOOM), cluster_config.getint('MAX_ZOOM', MAX_ZOOM),
+                   cluster_config.getint('CELL_SIZE', CELL_SIZE))
+
+
+def pipeline_stages(args) -> list:
+    '''
+    Stages of a run with the files they read and write, intermediate tables
+    are kept in the work directory ([FILES] WORK).
+    '''
+    latest_data_path = config['FILES'].get('SHEETDATA', './latestdata.csv')
+    geo_anipath = config['FILES'].get('GEO_ANIME')
+    fullpath  = config['FILES'].get('FULL')
+    cachepath = config['FILES'].get('CACHE', cache_path(fullpath or './full-data.json'))
+    work = config['FILES'].get('WORK', './work')
+    cleanpath = os.path.join(work, 'clean.cache')
+    mergedpath = os.path.join(work, 'merged.cache')
+    totalspath = os.path.join(work, 'totals.cache')
+    animationpath = os.path.join(work, 'animation.bin')
+
+    stages = [
+        Stage('fetch', partial(fetch_stage, latest_data_path), [], [latest_data_path, jhu_file]),
+        Stage('clean', partial(clean_stage, latest_data_path, cleanpath), [latest_data_path], [cleanpath]),
+        # reformat JHU to have same structure as sheet, with one row per date and location
+        # weighted by the number of cases, counts are only unpacked for the "full_data" export.
+        # Only the dates added since the last run are processed (unless --full-rebuild).
+        Stage('jhu', partial(jhu_stage, args.full_rebuild), [jhu_file], [weighted_path(jhu_file)]),
+        Stage('merge', partial(merge_stage, cleanpath, mergedpath, cachepath),
+              [cleanpath, weighted_path(jhu_file)], [mergedpath, cachepath]),
+        Stage('reduce', partial(reduce_stage, mergedpath, totalspath), [mergedpath], [totalspath]),
+        Stage('animation', partial(animation_stage, mergedpath, geo_anipath, animationpath),
+              [mergedpath, configfile], [geo_anipath, animationpath] + timeline_outputs()),
+    ]
+    if fullpath:
+        stages.append(Stage('full', partial(full_stage, mergedpath, fullpath), [mergedpath], [fullpath]))
+    if config.has_section('TILES'):
+        stages.append(Stage('tiles', partial(tiles_stage, totalspath, animationpath),
+                            [totalspath, animationpath, configfile], [config['TILES']['DIR']]))
+    if config.has_section('CLUSTERS'):
+        stages.append(Stage('clusters', partial(clusters_stage, totalspath),
+                            [totalspath, configfile], [config['CLUSTERS']['DIR']]))
+    if not testing:
+        # Publish to the HTML directory, only the files that changed are copied
+        targets = html_targets(config['HTML'], {'GEO_ANIME': geo_anipath})
+        stages.append(Stage('publish', partial(publish, targets),
+                            [source for source, _ in targets], [destination for _, destination in targets]))
+    return stages
+
+
 def main():
+    args = parser.parse_args()
     try :
-        # Line list data
-        latest_data_path = config['FILES'].get('SHEETDATA', './latestdata.csv')
-        req = requests.get('https://raw.githubusercontent.com/beoutbreakprepared/nCoV2019/master/latest_data/latestdata.csv')
-        if req.status_code == 200:
-            with open(latest_data_path, 'w') as f:
-                f.write(req.text)
-        else :
-            sys.exit(1)
-
-        df = pd.read_csv(latest_data_path, dtype=str)
-        filter_ = ~df.country.isin(['United States', 'Virgin Islands, U.S.'])
-        df = df[filter_]
-        full_data = clean_data(df, COLNAMES)
-    
-
-        # JHU data
-        req = requests.get(jhu_url)
-        if req.status_code == 200:
-            with open(jhu_file, 'w') as F:
-                F.write(req.text)
-        
-        us_data = pd.read_csv(jhu_file, dtype=str)
-      
-        # rename date columns to match sheet format (%d.%m.%d)
-        rx = '\d{1,2}/\d{1,2}/\d'
-        date_columns = []
-        for c in us_data.columns:
-            if re.match(rx, c):
-                month, day, year = c.split('/')
-                month = str(month).zfill(2)
-                day   = str(day).zfill(2)
-                year = '20' + str(year)
-                date = '{}.{}.{}'.format(day, month, year)
-                date_columns.append(date)
-                us_data.rename({c : date}, axis=1, inplace=True)
-        date_columns = sorted(date_columns, key=lambda x: pd.to_datetime(x, format='%d.%m.%Y'))
-        
-        # reformat JHU to have same structure as sheet
-        # This may seem silly because we unpack and then reduce to Unique again, 
-        # we do it because the "full_data" file is sent to FM-Global
-
-        # only defining columns where values will change for now.
-        # Loop is done in this order so that IDs persist. 
-        print(len(us_data[us_data.Lat.astype(float) == 0]))
-        us_reformed = pd.DataFrame(columns=['latitude', 'longitude', 'city', 'province', 'date_confirmation'])
-        for i, date in enumerate(date_columns):
-            print(date)
-            for j, row in us_data.iterrows():
-                if float(row['Lat']) == 0 or float(row['Long_']) == 0:
-                    continue
-
-                if pd.isnull(row['Lat']) or pd.isnull(row['Long_']): 
-                    continue
-
-                if i == 0:
-                    N = int(row[date])
-                else:
-                    N = int(row[date]) - int(row[date_columns[i-1]])
-                entry = {
-                        'latitude': row['Lat'],
-                        'longitude': row['Long_'],
-                        'city': row['Admin2'],
-                        'province': row['Province_State'],
-                        'date_confirmation': date
-                }
-                us_reformed = us_reformed.append([entry]*N, ignore_index=True)
-
-        print(len(us_reformed[us_reformed['latitude'].astype(float) == 0]))
-        us_reformed.insert(0, 'ID', range(1, len(us_reformed) + 1))
-        us_reformed['ID'] = us_reformed['ID'].apply(lambda x : 'JHU' + str(x))
-        us_reformed.insert(5, 'country', 'United States')
-        us_reformed.insert(6, 'age', '')
-        us_reformed.insert(7, 'sex', '')
-        us_reformed.insert(8, 'symptoms', '')
-        us_reformed.insert(9, 'source', 'JHU')
-        us_reformed.insert(11, 'geo_resolution', 'admin2')
-
-        full_data = full_data.append(us_reformed, ignore_index = True)
-        unique_data = reduceToUnique(full_data) 
-        full_data = {'data': full_data.to_dict(orient='records')}
-        fullpath  = config['FILES'].get('FULL')
-        savedata(full_data, fullpath)
-        
-        # animation data
-        geo_anipath    = config['FILES'].get('GEO_ANIME')
-        animation_formating_geo(fullpath, geo_anipath)
-        
-
-        if not testing:
-            # Copy files to HTML directoryi
-            htmlpath1 = config['HTML'].get('TOTALS')
-            htmlpath2 = config['HTML'].get('ANIMATION')
-            copyfile(uniquepath, htmlpath1) 
-            copyfile(anipath, htmlpath2)
-
-            htmlpath1 = config['HTML'].get('GEO_TOTALS')
-            htmlpath2 = config['HTML'].get('GEO_ANIME')
-            copyfile(geo_uniquepath, htmlpath1)
-            copyfile(geo_anipath, htmlpath2)
-
+        work = config['FILES'].get('WORK', './work')
+        os.makedirs(work, exist_ok=True)
+        # Overlapping runs (cron) exit right away, a stage that fails is resumed by the next run.
+        with run_lock(os.path.join(work, 'pipeline.lock')):
+            stages = pipeline_stages(args)
+            force = [s.name for s in stages] if args.full_rebuild else args.force
+            run_stages(stages, os.path.join(work, 'stages.json'), force, metrics)
+
+    except PipelineLocked as Err:
+        # No stage ran, the metrics of the run holding the lock are kept.
+        log_message(f'Update skipped, {Err}', config)
     except Exception as Err:
         message = f'Update Error, {Err}'
         log_message(message, config)
         raise Err
 
+    finally:
+        if config.has_section('METRICS') and metrics.stages:
+            metrics.write(config['METRICS'].get('JSON'), config['METRICS'].get('PROM'))
+
 
 if __name__ == '__main__':
     main()
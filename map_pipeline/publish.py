@@ -0,0 +1,159 @@
+'''
+Publish step : copy the pipeline outputs to the website directories.
+
+Each output is hashed (sha256) and only copied when its content changed
+since the last publish, so that the runs where nothing changed don't touch
+the site (nor invalidate the CDN caches). Copies are atomic (temporary file
+in the destination directory, then rename) so clients never read a half
+written file, and precompressed .gz (and .br, with the brotli module)
+siblings are written once per change.
+
+Each destination directory keeps a manifest.json of its published files :
+
+    {"dailies.geojson": {"sha256": "...", "size": 1234, "version": "..."}}
+
+version (the start of the hash) is meant for cache busting urls, e.g.
+dailies.geojson?v=<version>.
+'''
+import configparser
+import hashlib
+import json
+import os
+import zlib
+from collections import defaultdict
+
+from pipeline_common.files import atomic_write
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+MANIFEST = 'manifest.json'
+CHUNK_SIZE = 1 << 20 # 1MB
+VERSION_LENGTH = 12
+PERMISSIONS = 0o644 # served as is
+COMPRESSIONS = {'gzip': '.gz', 'br': '.br'}
+
+
+def read_chunks(path: str, chunk_size: int = CHUNK_SIZE):
+    with open(path, 'rb') as F:
+        for chunk in iter(lambda: F.read(chunk_size), b''):
+            yield chunk
+
+
+def file_hash(path: str, chunk_size: int = CHUNK_SIZE) -> str:
+    '''sha256 of a file, as hex.'''
+    h = hashlib.sha256()
+    for chunk in read_chunks(path, chunk_size):
+        h.update(chunk)
+    return h.hexdigest()
+
+
+def compress_chunks(chunks, compression: str):
+    '''
+    Compress a stream of chunks. gzip output doesn't embed a timestamp, the
+    same content always gives the same file.
+    '''
+    if compression == 'gzip':
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        finish = compressor.flush
+        process = compressor.compress
+    elif compression == 'br':
+        compressor = brotli.Compressor()
+        finish = compressor.finish
+        process = compressor.process
+    else:
+        raise ValueError(f'unknown compression {compression}')
+    for chunk in chunks:
+        yield process(chunk)
+    yield finish()
+
+
+def available_compressions(compress) -> list:
+    '''Compressions that can be written here (brotli needs the brotli module).'''
+    return [c for c in compress if c != 'br' or brotli is not None]
+
+
+def load_manifest(directory: str) -> dict:
+    '''Manifest of a destination directory, empty when there is none yet.'''
+    try:
+        with open(os.path.join(directory, MANIFEST)) as F:
+            return json.load(F)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(directory: str, manifest: dict) -> None:
+    data = json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8')
+    atomic_write(os.path.join(directory, MANIFEST), [data], permissions=PERMISSIONS)
+
+
+def is_published(destination: str, digest: str, entry: dict, compressions: list) -> bool:
+    '''Whether destination (and its compressed siblings) already has the content digest.'''
+    if not entry or entry.get('sha256') != digest or not os.path.exists(destination):
+        return False
+    return all(os.path.exists(destination + COMPRESSIONS[c]) for c in compressions)
+
+
+def publish_file(source: str, destination: str, digest: str, compressions: list) -> dict:
+    '''
+    Copy source to destination with its compressed siblings, atomically.
+    The siblings go first, the file itself last.
+
+    Returns :
+        entry (dict) : manifest entry of the file.
+    '''
+    for compression in compressions:
+        atomic_write(destination + COMPRESSIONS[compression],
+                     compress_chunks(read_chunks(source), compression), permissions=PERMISSIONS)
+    atomic_write(destination, read_chunks(source), permissions=PERMISSIONS)
+    return {'sha256': digest, 'size': os.path.getsize(destination), 'version': digest[:VERSION_LENGTH]}
+
+
+def publish(files: list, compress=('gzip', 'br')) -> dict:
+    '''
+    Publish files, skipping those whose content didn't change since they
+    were last published.
+
+    Args :
+        files (list) : (source, destination) paths.
+        compress (iterable) : compressed siblings to write ('gzip', 'br').
+
+    Returns :
+        changed (dict) : by destination, whether it was copied.
+    '''
+    compressions = available_compressions(compress)
+    by_directory = defaultdict(list)
+    for source, destination in files:
+        destination = os.path.abspath(destination)
+        by_directory[os.path.dirname(destination)].append((source, destination))
+
+    changed = {}
+    for directory, pairs in by_directory.items():
+        os.makedirs(directory, exist_ok=True)
+        manifest = load_manifest(directory)
+        for source, destination in pairs:
+            name = os.path.basename(destination)
+            digest = file_hash(source)
+            if is_published(destination, digest, manifest.get(name), compressions):
+                changed[destination] = False
+                continue
+            manifest[name] = publish_file(source, destination, digest, compressions)
+            changed[destination] = True
+        if any(changed[destination] for _, destination in pairs):
+            save_manifest(directory, manifest)
+    return changed
+
+
+def html_targets(html: configparser.SectionProxy, outputs: dict) -> list:
+    '''
+    (source, destination) pairs of the outputs that have a destination in
+    the [HTML] config section.
+
+    Args :
+        html (configparser.SectionProxy) : [HTML] section.
+        outputs (dict) : output path by [HTML] key, e.g. {'GEO_ANIME': path}.
+    '''
+    return [(source, html[key]) for key, source in outputs.items() if source and html.get(key)]
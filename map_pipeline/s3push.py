@@ -1,9 +1,43 @@
-import boto3
+'''
+Export of the case table for FM-Global : one row per case, as csv and json,
+pushed to the covid-19-fmglobal S3 bucket.
+
+Cases are read from the columnar cache when there is one (else from
+full-data.json) and written chunk by chunk, so neither the expanded table
+nor its records are ever in memory at once. Uploads are multipart, with
+parallel parts, and skipped when the object in the bucket already has the
+ETag of the local file.
+
+With --partitioned, the table is exported as one gzipped csv per date
+instead (date_confirmation=yyyy-mm-dd/part.csv.gz, the last date of ranges)
+with a manifest.json of the partition hashes. Only the partitions whose
+content changed since the last export are rewritten and uploaded, and those
+that disappeared are deleted from the bucket.
+'''
+import argparse
+import gzip
+import hashlib
 import json
 import os
-import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import pandas as pd
 
+from cache import cache_path, is_case_cache, load_case_table
+from dates import parse_ranges
+from jhu import expand_cases
+from pipeline_common.files import atomic_write
+from schema import as_text
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
 fname  = 'healthmap.covid19-data'
 bucket = 'covid-19-fmglobal'
 ACCESS_KEY = 'AWS-ACCESS-KEY'
@@ -11,29 +45,271 @@ SECRET_KEY = 'AWS-SECRET-KEY'
 
 directory    = '/path/to/archive/'
 infile       = directory + 'full-data.json'
+cachefile    = cache_path(infile)
 outfile_csv  = directory + fname + '.csv'
 outfile_json = directory + fname + '.json'
+partition_dir = directory + fname + '/'
+
+CHUNK_ROWS = 50000 # weighted rows expanded at once
+PART_SIZE = 8 * 2**20 # multipart threshold and part size, as boto3's default
+MAX_CONCURRENCY = 8 # parts of a file uploaded in parallel
+MAX_WORKERS = 8 # files uploaded in parallel
+DELETE_BATCH = 1000 # keys per delete request, S3 maximum
+
+PARTITION = 'date_confirmation={}'
+UNDATED = 'unknown'
+PART_NAME = 'part.csv.gz'
+MANIFEST = 'manifest.json'
+
+
+def case_chunks(infile: str, cachefile: str = None, chunk_rows: int = CHUNK_ROWS):
+    '''
+    The case table, one row per case, in chunks of DataFrames.
+
+    From the cache (memory-mapped) the weighted rows are expanded chunk by
+    chunk. full-data.json has to be parsed at once, its records are then
+    framed chunk by chunk.
+    '''
+    if cachefile and is_case_cache(cachefile):
+        # Weighted, typed table : back to the text of full-data.json chunk by chunk.
+        weighted = load_table(infile, cachefile)
+        for start in range(0, len(weighted), chunk_rows):
+            yield as_text(expand_cases(weighted.iloc[start:start + chunk_rows]))
+        return
+
+    with open(infile, 'r') as F:
+        data = json.load(F)['data']
+    columns = list(dict.fromkeys(key for record in data for key in record))
+    for start in range(0, len(data), chunk_rows):
+        yield pd.DataFrame(data[start:start + chunk_rows], columns=columns)
+
+
+def write_exports(chunks, csvpath: str, jsonpath: str) -> int:
+    '''
+    Stream the chunks to csv (df.to_csv(index=False)) and json (json.dump of
+    the records with indent=4), the files are the same as when written from
+    the whole table.
+
+    Returns :
+        n (int) : number of rows written.
+    '''
+    n = 0
+    with open(csvpath, 'w', newline='') as C, open(jsonpath, 'w') as J:
+        for chunk in chunks:
+            if not len(chunk):
+                continue
+            chunk.to_csv(C, index=False, header=not n)
+            # The records of a chunk with indent=4, without the enclosing "[\n" and "\n]".
+            J.write(',\n' if n else '[\n')
+            J.write(json.dumps(chunk.to_dict(orient='records'), indent=4)[2:-2])
+            n += len(chunk)
+        J.write('\n]' if n else '[]')
+    return n
+
+
+def local_etag(path: str, part_size: int = PART_SIZE) -> str:
+    '''
+    ETag S3 gives the file once uploaded with this part size : md5 for single
+    part uploads, md5 of the parts md5s with the number of parts otherwise.
+    '''
+    digests = []
+    with open(path, 'rb') as F:
+        for part in iter(lambda: F.read(part_size), b''):
+            digests.append(hashlib.md5(part).digest())
+    if os.path.getsize(path) < part_size:
+        return digests[0].hex() if digests else hashlib.md5().hexdigest()
+    return '{}-{}'.format(hashlib.md5(b''.join(digests)).hexdigest(), len(digests))
+
+
+def remote_etag(client, bucket: str, key: str) -> str:
+    '''ETag of an object, None when it doesn't exist.'''
+    try:
+        return client.head_object(Bucket=bucket, Key=key)['ETag'].strip('"')
+    except ClientError as Err:
+        if Err.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+
+
+def upload_if_changed(client, path: str, bucket: str, key: str = None, part_size: int = PART_SIZE,
+                      max_concurrency: int = MAX_CONCURRENCY) -> bool:
+    '''
+    Upload path to the bucket (multipart with parallel parts above
+    part_size), unless the object already has the same content.
+
+    Returns :
+        uploaded (bool) : False when the upload was skipped.
+    '''
+    key = key or os.path.basename(path)
+    if remote_etag(client, bucket, key) == local_etag(path, part_size):
+        return False
+    config = TransferConfig(multipart_threshold=part_size, multipart_chunksize=part_size,
+                            max_concurrency=max_concurrency, use_threads=True)
+    client.upload_file(path, bucket, key, Config=config)
+    return True
+
+
+def push(client, paths: list, bucket: str, part_size: int = PART_SIZE,
+         max_concurrency: int = MAX_CONCURRENCY, root: str = None, max_workers: int = MAX_WORKERS) -> dict:
+    '''
+    Upload the files concurrently, max_workers at a time, each with up to
+    max_concurrency parallel parts (see upload_if_changed). Files are keyed
+    by name, or by path relative to root (e.g.
+    fname/date_confirmation=.../part.csv.gz).
+
+    Returns :
+        uploaded (dict) : by path, whether it was uploaded.
+    '''
+    def key(path):
+        return os.path.relpath(path, root).replace(os.sep, '/') if root else None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {path: pool.submit(upload_if_changed, client, path, bucket, key(path), part_size, max_concurrency)
+                   for path in paths}
+        return {path: future.result() for path, future in futures.items()}
+
+
+def delete_keys(client, bucket: str, keys: list, batch_size: int = DELETE_BATCH) -> None:
+    '''
+    Delete the objects, batch_size keys per request.
+
+    Raises :
+        RuntimeError : some keys could not be deleted.
+    '''
+    for start in range(0, len(keys), batch_size):
+        response = client.delete_objects(Bucket=bucket, Delete={
+                'Objects': [{'Key': key} for key in keys[start:start + batch_size]], 'Quiet': True})
+        if response.get('Errors'):
+            raise RuntimeError('could not delete {} objects from {} : {}'.format(
+                len(response['Errors']), bucket,
+                ', '.join('{Key} ({Code})'.format(**error) for error in response['Errors'][:10])))
+
+
+def load_table(infile: str, cachefile: str = None) -> pd.DataFrame:
+    '''
+    The case table : weighted, typed rows from the cache (memory-mapped),
+    else the rows of full-data.json. Exports convert typed rows back with
+    schema.as_text.
+    '''
+    if cachefile and is_case_cache(cachefile):
+        return load_case_table(cachefile)
+    with open(infile, 'r') as F:
+        return pd.DataFrame(json.load(F)['data'])
+
+
+def partition_names(table: pd.DataFrame) -> pd.Series:
+    '''
+    Partition of each row : its confirmation date (the last date of ranges,
+    the first one of open ranges), UNDATED when it doesn't parse.
+    '''
+    dates = parse_ranges(table['date_confirmation'])
+    date = dates['date_end'].fillna(dates['date_start'])
+    names = date.dt.strftime(PARTITION.format('%Y-%m-%d'))
+    return names.where(date.notnull(), PARTITION.format(UNDATED))
+
+
+def load_manifest(outdir: str) -> dict:
+    '''Partitions of the last export, empty when there is none.'''
+    try:
+        with open(os.path.join(outdir, MANIFEST)) as F:
+            return json.load(F)
+    except (OSError, ValueError):
+        return {'partitions': {}}
+
+
+def write_partitions(table: pd.DataFrame, outdir: str, manifest: dict) -> tuple:
+    '''
+    Write the partitions of the table (one row per case) whose content
+    differs from the manifest of the last export, one partition in memory
+    at a time.
+
+    Args :
+        table (pd.DataFrame) : case table, weighted rows are expanded.
+        outdir (str) : export directory.
+        manifest (dict) : manifest of the last export (see load_manifest).
+
+    Returns :
+        manifest (dict) : manifest of this export, partition name -> sha256,
+                          rows and size.
+        changed (list) : paths of the partitions written.
+        removed (list) : paths of the partitions no longer in the table.
+    '''
+    previous = manifest.get('partitions', {})
+    names = partition_names(table)
+    codes, unique = pd.factorize(names, sort=True)
+    order = np.argsort(codes, kind='mergesort') # rows keep their order within partitions
+    bounds = np.searchsorted(codes[order], np.arange(len(unique) + 1))
+
+    partitions = {}
+    changed = []
+    for i, name in enumerate(unique):
+        part = as_text(expand_cases(table.iloc[order[bounds[i]:bounds[i + 1]]]))
+        data = part.to_csv(index=False).encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(outdir, name, PART_NAME)
+        if previous.get(name, {}).get('sha256') != digest or not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            atomic_write(path, [gzip.compress(data, compresslevel=6, mtime=0)])
+            changed.append(path)
+        partitions[name] = {'sha256': digest, 'rows': len(part), 'size': os.path.getsize(path)}
+
+    removed = [os.path.join(outdir, name, PART_NAME) for name in previous if name not in partitions]
+    return {'partitions': partitions}, changed, removed
+
+
+def export_partitions(table: pd.DataFrame, outdir: str, client=None, bucket: str = None,
+                      root: str = None) -> tuple:
+    '''
+    Partitioned export : write the changed partitions, upload them (when
+    given a client) with the manifest, and delete the removed ones.
+
+    The local manifest is only replaced once the uploads and deletions
+    succeeded, a failed one is retried on the next run.
+
+    Only the uploads are incremental : every run still expands, formats and
+    hashes all the partitions to compare them with the manifest.
+
+    Args :
+        root (str) : the bucket keys are the paths relative to root,
+                     defaults to the parent of outdir.
 
-with open(infile, 'r') as F:
-    read = json.load(F)
-data = read['data']
-df   = pd.DataFrame(data)
+    Returns :
+        changed, removed (list) : paths of the partitions written and removed.
+    '''
+    os.makedirs(outdir, exist_ok=True)
+    root = root or os.path.dirname(os.path.abspath(outdir))
+    manifest, changed, removed = write_partitions(table, outdir, load_manifest(outdir))
+    manifest_path = os.path.join(outdir, MANIFEST)
+    if client is not None:
+        push(client, changed, bucket, root=root)
+        delete_keys(client, bucket, [os.path.relpath(path, root).replace(os.sep, '/') for path in removed])
+    for path in removed:
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+    atomic_write(manifest_path, [json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8')])
+    if client is not None:
+        push(client, [manifest_path], bucket, root=root)
+    return changed, removed
 
-df.to_csv(outfile_csv, index=False)
-asdict = df.to_dict(orient='records')
 
-with open(outfile_json, 'w') as F:
-    json.dump(asdict, F, indent=4)
+parser = argparse.ArgumentParser(description='Export the case table to the FM-Global bucket')
+parser.add_argument('--partitioned', action='store_true',
+                    help='Export one csv.gz per date, only uploading the dates that changed')
 
 
+def main():
+    args = parser.parse_args()
+    client = boto3.client(
+        's3',
+        aws_access_key_id=ACCESS_KEY,
+        aws_secret_access_key=SECRET_KEY,
+    )
+    if args.partitioned:
+        export_partitions(load_table(infile, cachefile), partition_dir, client, bucket)
+        return
 
-client = boto3.client(
-    's3',
-    aws_access_key_id=ACCESS_KEY,
-    aws_secret_access_key=SECRET_KEY,
-)
+    write_exports(case_chunks(infile, cachefile), outfile_csv, outfile_json)
+    push(client, [outfile_csv, outfile_json], bucket)
 
 
-for f in [outfile_csv, outfile_json]:
-    s3name = f.split('/')[-1]
-    response = client.upload_file(f, bucket, f.split('/')[-1])
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+'''
+Typed schema of the case table.
+
+The sheets, latestdata.csv and full-data.json keep every value as a string.
+The schema is applied once, right after clean_data, and the stages then
+work on (and the cache stores) typed columns :
+- date_confirmation parsed to date_start/date_end (datetime64), the text
+  is kept for the outputs that show it,
+- latitude/longitude and the repeated text fields (location, source, ...)
+  as categoricals, each distinct string is stored once.
+
+Coordinates keep the text of the sheets : the same point written two ways
+(19.43333 / 19.4333300) stays two locations, and 28 isn't rewritten 28.0,
+as in the untyped outputs. They are only parsed to floats where the maths
+needs them, on one row per location (totals, clusters, tiles).
+
+A million rows take several times less memory than with object columns
+(python benchmark.py schema). The aggregations and writers accept typed and
+untyped tables alike, as_text converts back for the row oriented exports.
+'''
+import numpy as np
+import pandas as pd
+
+from dates import parse_ranges
+
+
+COORDINATE_COLUMNS = ['latitude', 'longitude']
+DATE_COLUMNS = ['date_start', 'date_end']
+# Low cardinality text columns.
+CATEGORICAL_COLUMNS = COORDINATE_COLUMNS + ['city', 'province', 'country', 'geo_resolution', 'source', 'sex', 'age',
+                                            'symptoms', 'date_confirmation']
+
+
+def apply_schema(data: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Typed copy of the case table, columns that are already typed are kept
+    as they are.
+
+    Args :
+        data (pd.DataFrame) : case table, typed or not.
+
+    Returns :
+        typed (pd.DataFrame) : dates that don't parse are NaT.
+    '''
+    df = data.reset_index(drop=True)
+    columns = {}
+    for c in CATEGORICAL_COLUMNS:
+        if c in df.columns and not isinstance(df[c].dtype, pd.CategoricalDtype):
+            columns[c] = df[c].astype('category')
+    if 'date_confirmation' in df.columns:
+        columns.update(parse_ranges(columns.get('date_confirmation', df['date_confirmation'])))
+    return df.assign(**columns)
+
+
+def is_typed(data: pd.DataFrame) -> bool:
+    '''Whether the schema was applied to the case table.'''
+    return all(isinstance(data[c].dtype, pd.CategoricalDtype) for c in COORDINATE_COLUMNS if c in data.columns) \
+        and all(c in data.columns for c in DATE_COLUMNS)
+
+
+def as_text(data: pd.DataFrame) -> pd.DataFrame:
+    '''
+    The case table with text columns, as in full-data.json : categoricals
+    as objects and without the parsed dates. Missing values are NaN.
+    '''
+    df = data.drop(DATE_COLUMNS, axis=1, errors='ignore')
+    for c in df.columns:
+        column = df[c]
+        if isinstance(column.dtype, pd.CategoricalDtype) or column.dtype == object:
+            column = column.astype(object)
+            df[c] = column.where(column.notnull(), np.nan)
+    return df
@@ -4,11 +4,14 @@ from bs4 import BeautifulSoup
 from datetime import datetime
 
 
-def scrape_total_count():
+def scrape_total_count(timeout: float = 60) -> dict:
+    '''
+    Total confirmed cases from the published sheet, as saved for the side bar.
+    '''
     #url = 'https://docs.google.com/spreadsheets/u/0/d/e/2PACX-1vR30F8lYP3jG7YOq8es0PBpJIE5yvRVZffOyaqC0GgMBN6yt0Q-NI8pxS7hd1F9dYXnowSC6zpZmW9D/pubhtml/sheet?headers=false&gid=0'
 
     url = 'https://docs.google.com/spreadsheets/d/e/2PACX-1vR30F8lYP3jG7YOq8es0PBpJIE5yvRVZffOyaqC0GgMBN6yt0Q-NI8pxS7hd1F9dYXnowSC6zpZmW9D/pubhtml/sheet?headers=false&gid=0&range=A1:I183'
-    fp = urllib.request.urlopen(url)
+    fp = urllib.request.urlopen(url, timeout=timeout)
     mybytes = fp.read()
 
     html = mybytes.decode("utf8")
@@ -18,12 +21,13 @@ def scrape_total_count():
     count = soup.select_one('tbody tr:nth-child(5) td:nth-child(2)').text
     date  = datetime.now().strftime('%Y-%m-%d') 
     
-    results = {'caseCount': count, 'date': date}
+    return {'caseCount': count, 'date': date}
 
 
-    with open('/path/to/website/latestCounts.json', 'w') as F: 
+def save_total_count(results: dict, path: str) -> None:
+    with open(path, 'w') as F: 
         json.dump([results], F)
 
 
 if __name__ == '__main__':
-    scrape_total_count()
+    save_total_count(scrape_total_count(), '/path/to/website/latestCounts.json')
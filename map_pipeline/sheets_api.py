@@ -0,0 +1,95 @@
+'''
+Google Sheets API session shared by every sheet read of a run.
+
+Credentials are loaded (and refreshed if needed) once, and the service is
+built once from the discovery document bundled in sheets.v4.discovery.json
+(spreadsheets.values get/batchGet only), so there is no discovery request.
+Each thread keeps its own HTTP transport (httplib2 isn't thread safe), and
+reuses its connections for all of its requests.
+'''
+import configparser
+import json
+import os
+import pickle
+import threading
+
+import httplib2
+from googleapiclient.discovery import build_from_document
+from google_auth_httplib2 import AuthorizedHttp
+from google_auth_oauthlib.flow import InstalledAppFlow
+from google.auth.transport.requests import Request
+
+
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
+DISCOVERY_DOCUMENT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sheets.v4.discovery.json')
+
+
+def get_credentials(config: configparser.ConfigParser):
+    '''
+    Credentials from the token in the config, refreshed or obtained through
+    the OAuth flow when needed (and then saved back to the token).
+    '''
+    # adapted from : https://developers.google.com/sheets/api/quickstart/python
+    creds       = None
+    token       = config['SHEETS'].get('TOKEN', './token.pickle')
+    credentials = config['SHEETS'].get('CREDENTIALS', './credentials.json')
+
+    if os.path.exists(token):
+        with open(token, 'rb') as t:
+            creds = pickle.load(t)
+
+    # If there are no (valid) credentials available, let the user log in.
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            creds.refresh(Request())
+        else:
+            flow = InstalledAppFlow.from_client_secrets_file(
+                credentials, SCOPES)
+            creds = flow.run_local_server(port=0)
+
+        # Save the credentials for the next run
+        with open(token, 'wb') as t:
+            pickle.dump(creds, t)
+    return creds
+
+
+class SheetsSession(object):
+    '''
+    Sheets API service, built once per run.
+    Attributes:
+    :credentials: -> google.auth credentials used by the threads' transports.
+    :service: -> Sheets API service.
+    '''
+
+    def __init__(self, credentials=None, http=None):
+        '''
+        Args :
+            credentials : google.auth credentials.
+            http : HTTP transport used for every request instead of one per
+                   thread (e.g. googleapiclient.http.HttpMockSequence).
+        '''
+        self.credentials = credentials
+        self._http = http
+        self._local = threading.local()
+        with open(DISCOVERY_DOCUMENT) as F:
+            document = json.load(F)
+        self.service = build_from_document(document, http=self.http())
+
+    @classmethod
+    def from_config(cls, config: configparser.ConfigParser) -> 'SheetsSession':
+        return cls(get_credentials(config))
+
+    def http(self):
+        '''HTTP transport of the calling thread.'''
+        if self._http is not None:
+            return self._http
+        if not hasattr(self._local, 'http'):
+            self._local.http = AuthorizedHttp(self.credentials, http=httplib2.Http())
+        return self._local.http
+
+    def values(self, spreadsheetid: str, data_range: str) -> list:
+        '''
+        Values in data_range (A1 notation) of a spreadsheet, as a list of rows.
+        '''
+        request = self.service.spreadsheets().values().get(spreadsheetId=spreadsheetid, range=data_range)
+        return request.execute(http=self.http()).get('values', [])
@@ -0,0 +1,53 @@
+'''
+Side bar counts (WHO counts by country, total confirmed cases) fetched
+alongside the map data by the acquisition stage.
+
+Each one is only fetched when its output is set in the config :
+    [FILES] WHO           : archive copy of the WHO counts,
+    [HTML] WHO            : WHO counts for the website,
+    [HTML] LATEST_COUNTS  : total count for the website.
+'''
+import configparser
+from functools import partial
+
+from acquire import Source
+from get_WHO_data import get_WHO_data, save_WHO_data
+
+try:
+    from scrape_total_count import scrape_total_count, save_total_count
+except ImportError: # beautifulsoup4 isn't installed
+    scrape_total_count = None
+
+
+TIMEOUT = 60 # seconds
+
+
+def who_paths(config: configparser.ConfigParser) -> list:
+    paths = [config['FILES'].get('WHO')]
+    if config.has_section('HTML'):
+        paths.append(config['HTML'].get('WHO'))
+    return [p for p in paths if p]
+
+
+def counts_path(config: configparser.ConfigParser) -> str:
+    if config.has_section('HTML'):
+        return config['HTML'].get('LATEST_COUNTS')
+    return None
+
+
+def side_bar_sources(config: configparser.ConfigParser) -> list:
+    '''Acquisition sources for the side bar outputs set in the config.'''
+    sources = []
+    if who_paths(config):
+        sources.append(Source('who', partial(get_WHO_data, timeout=TIMEOUT), TIMEOUT))
+    if counts_path(config) and scrape_total_count is not None:
+        sources.append(Source('total_count', partial(scrape_total_count, timeout=TIMEOUT), TIMEOUT))
+    return sources
+
+
+def save_side_bar(results: dict, config: configparser.ConfigParser) -> None:
+    '''Save the side bar sources that were fetched.'''
+    if 'who' in results:
+        save_WHO_data(results['who'], who_paths(config))
+    if 'total_count' in results:
+        save_total_count(results['total_count'], counts_path(config))
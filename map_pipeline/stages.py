@@ -0,0 +1,172 @@
+'''
+Stage runner for the pipeline.
+
+Each stage declares the files it reads (inputs) and writes (outputs). Stages
+run in dependency order (a stage runs after the stages writing its inputs),
+and a stage is skipped when the content of its inputs and outputs is the
+same as at the end of its last successful run. Stages without inputs (e.g.
+downloads) always run, their outputs then decide what runs next.
+
+The hashes of the last successful run of each stage are kept in a state
+file, saved after every stage : when a stage fails, the next run skips the
+stages that already went through and resumes from the failed one.
+
+run_lock keeps overlapping runs (e.g. from cron) from working on the same
+files at the same time. Given a pipeline_common.metrics.RunMetrics, the
+time, memory and row counts of each stage are recorded.
+'''
+import fcntl
+import hashlib
+import json
+import os
+from collections import namedtuple
+from contextlib import contextmanager
+
+from pipeline_common.files import atomic_write
+from publish import file_hash
+
+
+Stage = namedtuple('Stage', ['name', 'func', 'inputs', 'outputs'])
+
+# Status of each stage in a run
+RAN = 'ran'
+SKIPPED = 'skipped'
+
+
+class PipelineLocked(Exception):
+    '''Another run holds the lock.'''
+
+
+@contextmanager
+def run_lock(path: str):
+    '''
+    Exclusive lock on path for the duration of the block, raises
+    PipelineLocked right away when another process holds it. The lock goes
+    away with the process, even when it is killed.
+    '''
+    F = open(path, 'a')
+    try:
+        fcntl.flock(F, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        F.close()
+        raise PipelineLocked(f'{path} is locked by another run')
+    try:
+        yield
+    finally:
+        fcntl.flock(F, fcntl.LOCK_UN)
+        F.close()
+
+
+def path_hash(path: str) -> str:
+    '''
+    sha256 of a file, or of the names and content of the files in a
+    directory. None when path doesn't exist.
+    '''
+    if os.path.isfile(path):
+        return file_hash(path)
+    if not os.path.isdir(path):
+        return None
+    h = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            filepath = os.path.join(root, name)
+            h.update(os.path.relpath(filepath, path).encode('utf-8'))
+            h.update(file_hash(filepath).encode('ascii'))
+    return h.hexdigest()
+
+
+def hashes(paths: list) -> dict:
+    return {path: path_hash(path) for path in paths}
+
+
+def order_stages(stages: list) -> list:
+    '''
+    Stages in dependency order, otherwise in the order given.
+
+    Raises :
+        ValueError : when two stages write the same output, or on cycles.
+    '''
+    producer = {}
+    for stage in stages:
+        for path in stage.outputs:
+            if path in producer:
+                raise ValueError(f'{path} is written by both {producer[path]} and {stage.name}')
+            producer[path] = stage.name
+    depends = {stage.name: {producer[p] for p in stage.inputs if p in producer} - {stage.name} for stage in stages}
+
+    ordered, done = [], set()
+    while len(ordered) < len(stages):
+        ready = [s for s in stages if s.name not in done and depends[s.name] <= done]
+        if not ready:
+            raise ValueError('stages depend on each other : {}'.format(
+                    ', '.join(s.name for s in stages if s.name not in done)))
+        ordered.append(ready[0])
+        done.add(ready[0].name)
+    return ordered
+
+
+def load_state(path: str) -> dict:
+    '''State of the previous runs, empty when there is none.'''
+    try:
+        with open(path) as F:
+            return json.load(F)
+    except (OSError, ValueError):
+        return {'stages': {}, 'failed': None}
+
+
+def save_state(state: dict, path: str) -> None:
+    atomic_write(path, [json.dumps(state, indent=1, sort_keys=True).encode('utf-8')])
+
+
+def is_up_to_date(stage: Stage, previous: dict, inputs: dict) -> bool:
+    '''Whether the inputs and outputs of stage are those of its last successful run.'''
+    if not stage.inputs or not previous or previous['inputs'] != inputs:
+        return False
+    return previous['outputs'] == hashes(stage.outputs) and all(h is not None for h in previous['outputs'].values())
+
+
+def run_stages(stages: list, state_path: str, force=(), metrics=None) -> dict:
+    '''
+    Run the stages that aren't up to date.
+
+    Args :
+        stages (list) : Stage(name, func, inputs, outputs), func is called
+                        without arguments.
+        state_path (str) : state file.
+        force (iterable) : names of stages to run even when up to date.
+        metrics (pipeline_common.metrics.RunMetrics) : records the stages,
+                                                       optional.
+
+    Returns :
+        status (dict) : RAN or SKIPPED by stage name, in the order they ran.
+    '''
+    os.makedirs(os.path.dirname(os.path.abspath(state_path)), exist_ok=True)
+    state = load_state(state_path)
+    status = {}
+    for stage in order_stages(stages):
+        inputs = hashes(stage.inputs)
+        if stage.name not in force and is_up_to_date(stage, state['stages'].get(stage.name), inputs):
+            status[stage.name] = SKIPPED
+            if metrics is not None:
+                metrics.skipped(stage.name)
+            continue
+
+        # Forget the last run first, the outputs are about to change.
+        state['stages'].pop(stage.name, None)
+        try:
+            if metrics is not None:
+                with metrics.stage(stage.name):
+                    stage.func()
+            else:
+                stage.func()
+        except BaseException:
+            state['failed'] = stage.name
+            save_state(state, state_path)
+            raise
+        state['stages'][stage.name] = {'inputs': inputs, 'outputs': hashes(stage.outputs)}
+        if state.get('failed') == stage.name:
+            state['failed'] = None
+        save_state(state, state_path)
+        status[stage.name] = RAN
+    return status
@@ -0,0 +1,179 @@
+'''
+Seeded synthetic inputs for the map pipeline, at scales the sample data
+doesn't reach : line list rows as read from latestdata.csv, and JHU style
+wide time series.
+
+The same seed always gives the same tables. Values are strings, as in the
+sheets and in read_jhu, and cases are skewed towards a few locations and
+the last dates, like the real data.
+
+Usage :
+    python synthetic.py --scale 1m --outdir /path/to/data
+writes latestdata.csv and jhu.csv (half of the cases each), to run
+pipeline.py on ([FILES] SHEETDATA and JHU).
+'''
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+
+SCALES = {'10k': 10000, '100k': 100000, '1m': 1000000, '10m': 10000000}
+
+FIRST_DATE = '2020-01-22'
+SEXES = np.array(['male', 'female', ''], dtype=object)
+SYMPTOMS = np.array(['', '', 'fever', 'cough', 'fever, cough'], dtype=object)
+GEO_RESOLUTIONS = np.array(['point', 'admin3', 'admin2', 'admin1', 'admin0'], dtype=object)
+INVALID_COORDINATES = np.array(['', '#REF!', 'N/A'], dtype=object)
+INVALID_DATES = np.array(['', 'NA', '2020-03-01'], dtype=object)
+
+
+def parse_scale(scale: str) -> int:
+    '''Number of cases of a scale name (10k, 1m, ...) or number.'''
+    return SCALES[scale.lower()] if scale.lower() in SCALES else int(scale)
+
+
+def skewed(rng: np.random.RandomState, n: int, size: int, exponent: float = 0.8) -> np.ndarray:
+    '''size draws in range(n), rank i drawn about (i + 1) ** -exponent as often as rank 0.'''
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return rng.choice(n, size, p=weights / weights.sum())
+
+
+def growth(n_days: int) -> np.ndarray:
+    '''Share of the cases of each day, growing exponentially.'''
+    weights = np.exp(np.arange(n_days) / max(n_days / 4, 1))
+    return weights / weights.sum()
+
+
+def names(prefix: str, n: int) -> np.ndarray:
+    return np.array([f'{prefix} {i}' for i in range(n)], dtype=object)
+
+
+def coordinates(rng: np.random.RandomState, n: int, decimals: int = 4) -> tuple:
+    '''Latitude and longitude strings of n locations.'''
+    lat = np.round(rng.uniform(-60, 70, n), decimals).astype(str).astype(object)
+    lon = np.round(rng.uniform(-180, 180, n), decimals).astype(str).astype(object)
+    return lat, lon
+
+
+def line_list(n_cases: int, n_locations: int = None, n_days: int = 120, dirty: float = 0.0,
+              seed: int = 0) -> pd.DataFrame:
+    '''
+    Line list rows, one per case.
+
+    Args :
+        n_cases (int) : number of rows.
+        n_locations (int) : distinct coordinates, defaults to one per 20 cases.
+        n_days (int) : dates the cases are spread over, from FIRST_DATE.
+        dirty (float) : share of the rows with something for clean_data to
+                        do : padded names, date ranges, and (half as many
+                        each) invalid coordinates and dates.
+        seed (int) : random seed.
+    '''
+    rng = np.random.RandomState(seed)
+    n_locations = n_locations or max(n_cases // 20, 1)
+    n_provinces = max(n_locations // 10, 1)
+    n_countries = min(n_provinces, 200)
+
+    lat, lon = coordinates(rng, n_locations)
+    province = rng.randint(0, n_provinces, n_locations)
+    provinces = names('province', n_provinces)[province]
+    countries = names('country', n_countries)[province % n_countries]
+    resolutions = GEO_RESOLUTIONS[rng.randint(0, len(GEO_RESOLUTIONS), n_locations)]
+    dates = pd.date_range(FIRST_DATE, periods=n_days).strftime('%d.%m.%Y').values.astype(object)
+    sources = np.array([f'https://example.org/reports/{i}' for i in range(max(n_locations // 50, 1))], dtype=object)
+
+    location = skewed(rng, n_locations, n_cases)
+    day = rng.choice(n_days, n_cases, p=growth(n_days))
+    data = pd.DataFrame({
+        'ID': '000-' + pd.Series(np.arange(1, n_cases + 1)).astype(str),
+        'latitude': lat[location],
+        'longitude': lon[location],
+        'city': names('city', n_locations)[location],
+        'province': provinces[location],
+        'country': countries[location],
+        'age': np.where(rng.rand(n_cases) < 0.5, '', rng.randint(0, 95, n_cases).astype(str)).astype(object),
+        'sex': SEXES[rng.randint(0, len(SEXES), n_cases)],
+        'symptoms': SYMPTOMS[rng.randint(0, len(SYMPTOMS), n_cases)],
+        'source': sources[location % len(sources)],
+        'date_confirmation': dates[day],
+        'geo_resolution': resolutions[location],
+        'outcome': '', # not in the map, dropped by clean_data
+    })
+    if dirty:
+        roll = rng.rand(n_cases)
+        padded = roll < dirty
+        data.loc[padded, 'city'] = ' ' + data.loc[padded, 'city'] + '\xa0'
+        ranges = (roll >= dirty) & (roll < 2 * dirty)
+        data.loc[ranges, 'date_confirmation'] = dates[np.maximum(day[ranges] - 3, 0)] + ' - ' + dates[day[ranges]]
+        bad_coordinates = (roll >= 2 * dirty) & (roll < 2.5 * dirty)
+        data.loc[bad_coordinates, 'latitude'] = INVALID_COORDINATES[rng.randint(0, 3, bad_coordinates.sum())]
+        bad_dates = (roll >= 2.5 * dirty) & (roll < 3 * dirty)
+        data.loc[bad_dates, 'date_confirmation'] = INVALID_DATES[rng.randint(0, 3, bad_dates.sum())]
+    return data
+
+
+def jhu_series(n_cases: int, n_locations: int = 3000, n_days: int = 120, unlocated: float = 0.02,
+               seed: int = 0) -> pd.DataFrame:
+    '''
+    JHU US time series : one row per county, cumulative counts in m/d/yy
+    date columns, as read by jhu.read_jhu.
+
+    Args :
+        n_cases (int) : cases over all counties and dates.
+        n_locations (int) : number of counties.
+        n_days (int) : number of date columns, from FIRST_DATE.
+        unlocated (float) : share of the counties at 0, 0 (e.g.
+                            "Unassigned"), their cases aren't mapped.
+        seed (int) : random seed.
+    '''
+    rng = np.random.RandomState(seed)
+    lat, lon = coordinates(rng, n_locations)
+    missing = rng.rand(n_locations) < unlocated
+    lat[missing], lon[missing] = '0.0', '0.0'
+
+    weights = 1.0 / np.arange(1, n_locations + 1) ** 0.8
+    weights = rng.permutation(weights / weights.sum())
+    new = rng.multinomial(n_cases, np.outer(weights, growth(n_days)).ravel()).reshape(n_locations, n_days)
+    cumulative = np.cumsum(new, axis=1)
+
+    counties = names('county', n_locations)
+    states = names('state', min(n_locations, 56))[np.arange(n_locations) % min(n_locations, 56)]
+    data = pd.DataFrame({
+        'UID': (84000000 + np.arange(n_locations)).astype(str),
+        'iso2': 'US',
+        'iso3': 'USA',
+        'code3': '840',
+        'FIPS': (1000 + np.arange(n_locations)).astype(str),
+        'Admin2': counties,
+        'Province_State': states,
+        'Country_Region': 'US',
+        'Lat': lat,
+        'Long_': lon,
+        'Combined_Key': counties + ', ' + states + ', US',
+    })
+    dates = pd.date_range(FIRST_DATE, periods=n_days)
+    columns = [f'{d.month}/{d.day}/{d:%y}' for d in dates]
+    counts = pd.DataFrame(cumulative.astype(str), columns=columns)
+    return pd.concat([data, counts], axis=1)
+
+
+parser = argparse.ArgumentParser(description='Write synthetic pipeline inputs')
+parser.add_argument('--scale', default='10k', help=f'Number of cases, or one of {", ".join(SCALES)}')
+parser.add_argument('--seed', type=int, default=0, help='Random seed')
+parser.add_argument('--dirty', type=float, default=0.02, help='Share of line list rows for clean_data to fix or drop')
+parser.add_argument('--outdir', default='.', help='Where to write latestdata.csv and jhu.csv')
+
+
+def main():
+    args = parser.parse_args()
+    n_cases = parse_scale(args.scale)
+    os.makedirs(args.outdir, exist_ok=True)
+    line_list(n_cases // 2, dirty=args.dirty, seed=args.seed).to_csv(
+            os.path.join(args.outdir, 'latestdata.csv'), index=False)
+    jhu_series(n_cases - n_cases // 2, seed=args.seed).to_csv(os.path.join(args.outdir, 'jhu.csv'), index=False)
+
+
+if __name__ == '__main__':
+    main()
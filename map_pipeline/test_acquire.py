@@ -0,0 +1,88 @@
+import unittest
+import os
+import tempfile
+import threading
+import time
+from functools import partial
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import requests
+
+import fetch
+from acquire import Source, acquire
+from get_WHO_data import get_WHO_data
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    '''GET /<seconds>/<name> answers <name> after sleeping <seconds>.'''
+
+    def do_GET(self):
+        _, delay, name = self.path.split('/')
+        time.sleep(float(delay))
+        if name == 'missing':
+            self.send_error(404)
+            return
+        body = name.encode()
+        if name == 'who':
+            body = b'{"features": [{"attributes": {"cum_conf": 10, "ADM0_NAME": "FRANCE"}}]}'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestAcquire(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingServer(('127.0.0.1', 0), SlowHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.session = requests.Session()
+
+    def tearDown(self):
+        self.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+
+    def source(self, name, delay, timeout=10):
+        path = os.path.join(self.tmpdir.name, name)
+        func = partial(fetch.fetch, '{}/{}/{}'.format(self.url, delay, name), path, self.session)
+        return Source(name, func, timeout)
+
+    def test_concurrent(self):
+        sources = [self.source(name, 0.5) for name in ['jhu', 'line_list', 'sheet1', 'sheet2']]
+        start = time.monotonic()
+        results, errors = acquire(sources)
+        elapsed = time.monotonic() - start
+        self.assertEqual(errors, {})
+        self.assertEqual(results, {'jhu': True, 'line_list': True, 'sheet1': True, 'sheet2': True})
+        self.assertLess(elapsed, 1.5)
+        with open(os.path.join(self.tmpdir.name, 'sheet2')) as F:
+            self.assertEqual(F.read(), 'sheet2')
+
+    def test_errors_are_isolated(self):
+        sources = [self.source('jhu', 0), self.source('missing', 0), self.source('slow', 3, timeout=0.5)]
+        start = time.monotonic()
+        results, errors = acquire(sources)
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(results, {'jhu': True})
+        self.assertIsInstance(errors['missing'], requests.HTTPError)
+        self.assertIsInstance(errors['slow'], TimeoutError)
+
+    def test_who(self):
+        func = partial(get_WHO_data, '{}/0/who'.format(self.url), timeout=5)
+        results, errors = acquire([Source('who', func, 5)])
+        self.assertEqual(results['who']['features'][0]['attributes']['ADM0_NAME'], 'FRANCE')
+
+    def test_no_sources(self):
+        self.assertEqual(acquire([]), ({}, {}))
@@ -0,0 +1,222 @@
+import unittest
+import pathlib
+import json
+import os
+from datetime import timedelta
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+import aggregation
+from legacy import legacy_reduce
+
+
+def legacy_animation(full: pd.DataFrame, groupby: str = 'week') -> list:
+    '''Date by date, location by location loop as previously done in functions.animation_formating_geo.'''
+    full = full.copy()
+    full['cases'] = aggregation.case_weights(full)
+    full.fillna('', inplace=True)
+    full['geoid'] = full.apply(lambda s: s['latitude'] + '|' + s['longitude'], axis=1)
+    full['date_confirmation'] = full.date_confirmation.apply(lambda x: x.split('-')[0].strip())
+    full['date'] = pd.to_datetime(full['date_confirmation'], format="%d.%m.%Y")
+    if groupby == 'week':
+        full['date'] = full.date.apply(lambda x : x - timedelta(days=x.weekday()))
+        freq = 'W-MON'
+    else:
+        freq = 'D'
+    drange = pd.date_range(full.date.min(), full.date.max(), freq=freq)
+
+    geoids = full.geoid.unique()
+    counts = full.groupby(['date', 'geoid'])[['cases']].sum()
+    reference = full.drop_duplicates('geoid').set_index('geoid')
+
+    timeline = []
+    has_entry = []
+    latest_counts = {geoid: 0 for geoid in geoids}
+    for d in drange:
+        if d in counts.index:
+            new_cases = counts.loc[d]
+        else:
+            continue
+        for geoid in geoids:
+            if geoid in new_cases.index:
+                N_new = int(new_cases.loc[geoid]['cases'])
+                total = latest_counts[geoid] + N_new
+                latest_counts[geoid] += N_new
+            elif geoid in has_entry:
+                N_new = 0
+                total = latest_counts[geoid]
+            else:
+                continue
+            lat, lon = geoid.split('|')
+            ref = reference.loc[geoid]
+            timeline.append({
+                    "type": "Feature",
+                    "geometry": {"type": "Point", "coordinates": [float(lon), float(lat)]},
+                    "properties": {
+                        "date": d.strftime('%Y-%m-%d'),
+                        "new": N_new,
+                        "total": total,
+                        "city": ref['city'],
+                        "province": ref['province'],
+                        "country": ref['country'],
+                        "geo_resolution" : ref['geo_resolution']
+                    }
+            })
+            if geoid not in has_entry:
+                has_entry.append(geoid)
+    return timeline
+
+
+def legacy_pins(data: pd.DataFrame) -> list:
+    '''
+    Date by date, coordinate by coordinate loop as previously done in
+    functions.animation_formating (with a stable sort by date).
+    '''
+    data = data.copy()
+    data['cases'] = aggregation.case_weights(data)
+    data = data[['latitude', 'longitude', 'date_confirmation', 'cases']]
+    data = data[data.latitude != '#REF!']
+    data = data[data.longitude != '#REF!']
+    data = data[data.date_confirmation != '#REF!']
+    data['date'] = pd.to_datetime(data.date_confirmation, errors='coerce', format='%d.%m.%Y')
+    data['coord'] = data.apply(lambda s: str('{}|{}'.format(s['latitude'], s['longitude'])), axis=1)
+    data = data.dropna()
+    data = data.sort_values(by='date', kind='mergesort')
+
+    sums = {}
+    results = {}
+    for date in data.date.unique():
+        datestr = pd.to_datetime(date).strftime('%Y-%m-%d')
+        results.setdefault(datestr, [])
+        subset = data[data.date == date]
+        for coord in subset.coord.unique():
+            N_cases = int(subset[subset.coord == coord].cases.sum())
+            sums[coord] = sums.get(coord, 0) + N_cases
+            lat, long = coord.split('|')
+            if sums[coord] < 10:
+                pin = 'pin4.svg'
+            elif sums[coord] >= 10 and sums[coord] < 25:
+                pin = 'pin3.svg'
+            elif sums[coord] >= 25 and sums[coord] < 50:
+                pin = 'pin2.svg'
+            else:
+                pin = 'pin1.svg'
+            results[datestr].append({'caseCount': sums[coord], 'latitude': lat,
+                                     'longitude': long, 'pin': pin})
+    return [{d: results[d]} for d in results.keys()]
+
+
+class TestReduceToUnique(unittest.TestCase):
+
+    def setUp(self):
+        cur_dir = pathlib.Path(__file__).parent.absolute()
+        with open(os.path.join(cur_dir, '..', 'map_data', 'full-data.sample.json')) as F:
+            self.sample = pd.DataFrame(json.load(F)['data'])
+
+    def assert_same_as_legacy(self, data):
+        got = aggregation.reduce_to_unique(data)
+        # The previous code had one row per case.
+        if 'cases' in data.columns:
+            data = data.loc[data.index.repeat(data.cases)].drop('cases', axis=1).reset_index(drop=True)
+        want = pd.DataFrame(legacy_reduce(data), columns=aggregation.UNIQUE_COLUMNS)
+        assert_frame_equal(got, want, check_dtype=False)
+
+    def test_sample(self):
+        self.assert_same_as_legacy(self.sample)
+
+    def test_weighted_sample(self):
+        data = self.sample.copy()
+        data['cases'] = [1, 3, 2, 1] * (len(data) // 4) + [1] * (len(data) % 4)
+        self.assert_same_as_legacy(data)
+
+    def test_special_cases(self):
+        data = pd.DataFrame({
+            'latitude': ['1', '1', '1', '2', '2', '3', '3', '3'],
+            'longitude': ['1', '1', '1', '2', '2', '3', '3', '3'],
+            'city': ['B', 'A', 'B', 'Sg', 'Sg', 'Mc', 'X', None],
+            'province': ['P', 'P', 'P', '', '', 'Macau', 'Macau', 'Macau'],
+            'country': ['C', 'C', 'C', 'Singapore', 'Singapore', 'China', 'China', 'China'],
+            'cases': [1, 3, 1, 1, 1, 1, 1, 1],
+        })
+        for c in aggregation.SINGLE_CASE_FIELDS + ['geo_resolution']:
+            data[c] = 'x'
+        self.assert_same_as_legacy(data)
+
+        unique = aggregation.reduce_to_unique(data)
+        self.assertEqual(unique.city.tolist(), ['A', '', ''])
+        self.assertEqual(unique.province.tolist(), ['P', '', 'Macau'])
+        self.assertEqual(unique.cases.tolist(), [5, 2, 3])
+
+    def test_city_ties(self):
+        # Ties go to the first city in alphabetical order, the previous code took the first one of value_counts.
+        data = pd.DataFrame({'latitude': '1', 'longitude': '1', 'city': ['B', 'A', 'B', 'A'], 'province': 'P',
+                             'country': 'C'})
+        self.assertEqual(aggregation.reduce_to_unique(data).city.tolist(), ['A'])
+
+    def test_single_case_fields(self):
+        data = self.sample.groupby(['latitude', 'longitude']).filter(lambda g: len(g) == 1).head(1)
+        unique = aggregation.reduce_to_unique(data)
+        self.assertEqual(unique.date_confirmation.iloc[0], data.date_confirmation.iloc[0])
+        self.assertEqual(unique.source.iloc[0], data.source.iloc[0])
+
+
+class TestAnimation(unittest.TestCase):
+
+    def setUp(self):
+        cur_dir = pathlib.Path(__file__).parent.absolute()
+        with open(os.path.join(cur_dir, '..', 'map_data', 'full-data.sample.json')) as F:
+            self.sample = pd.DataFrame(json.load(F)['data'])
+
+    def animation(self, data, groupby):
+        locations, cells = aggregation.animation_cells(data, groupby)
+        return list(aggregation.animation_features(locations, cells))
+
+    def test_weekly(self):
+        self.assertEqual(self.animation(self.sample, 'week'), legacy_animation(self.sample, 'week'))
+
+    def test_daily(self):
+        self.assertEqual(self.animation(self.sample, 'day'), legacy_animation(self.sample, 'day'))
+
+    def test_weighted(self):
+        data = self.sample.copy()
+        data['cases'] = [2, 1, 5] * (len(data) // 3) + [1] * (len(data) % 3)
+        self.assertEqual(self.animation(data, 'day'), legacy_animation(data, 'day'))
+
+    def test_cells(self):
+        data = pd.DataFrame({
+            'latitude': ['1', '2', '1', '1'],
+            'longitude': ['1', '2', '1', '1'],
+            'date_confirmation': ['01.03.2020', '03.03.2020', '05.03.2020 - 06.03.2020', '05.03.2020'],
+            'cases': [1, 2, 3, 1],
+        })
+        for c in ['city', 'province', 'country', 'geo_resolution']:
+            data[c] = ''
+        locations, cells = aggregation.animation_cells(data, 'day')
+        self.assertEqual(len(locations), 2)
+        self.assertEqual(cells.location.tolist(), [0, 0, 1, 0, 1])
+        self.assertEqual(cells.new.tolist(), [1, 0, 2, 4, 0])
+        self.assertEqual(cells.total.tolist(), [1, 1, 2, 5, 2])
+
+
+class TestDailyPins(unittest.TestCase):
+
+    def setUp(self):
+        cur_dir = pathlib.Path(__file__).parent.absolute()
+        with open(os.path.join(cur_dir, '..', 'map_data', 'full-data.sample.json')) as F:
+            self.sample = pd.DataFrame(json.load(F)['data'])
+
+    def test_sample(self):
+        self.assertEqual(aggregation.daily_pins(self.sample), legacy_pins(self.sample))
+
+    def test_weighted(self):
+        data = self.sample.copy()
+        data['cases'] = [7, 1, 30] * (len(data) // 3) + [1] * (len(data) % 3)
+        data.loc[3, 'latitude'] = '#REF!'
+        self.assertEqual(aggregation.daily_pins(data), legacy_pins(data))
+
+    def test_pins(self):
+        data = pd.DataFrame({'latitude': ['1'] * 4, 'longitude': ['2'] * 4, 'cases': [9, 1, 15, 25],
+                             'date_confirmation': ['01.03.2020', '02.03.2020', '03.03.2020', '04.03.2020']})
+        pins = [d[0]['pin'] for day in aggregation.daily_pins(data) for d in day.values()]
+        self.assertEqual(pins, ['pin4.svg', 'pin3.svg', 'pin2.svg', 'pin1.svg'])
@@ -0,0 +1,69 @@
+import unittest
+import pathlib
+import tempfile
+import json
+import os
+
+import pandas as pd
+
+import aggregation
+import cache
+import jhu
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        cur_dir = pathlib.Path(__file__).parent.absolute()
+        with open(os.path.join(cur_dir, '..', 'map_data', 'full-data.sample.json')) as F:
+            sample = pd.DataFrame(json.load(F)['data'])
+        us_data = jhu.read_jhu(os.path.join(cur_dir, '..', 'map_data', 'jhu_US_timeseries.csv')).iloc[:100]
+        self.data = pd.concat([sample, jhu.jhu_to_weighted(us_data)], ignore_index=True, sort=False)
+        self.data['cases'] = aggregation.case_weights(self.data)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'full-data.cache')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def check_round_trip(self, backend):
+        cache.save_case_table(self.data, self.path, backend=backend)
+        self.assertTrue(cache.is_case_cache(self.path))
+        loaded = cache.load_case_table(self.path)
+
+        self.assertEqual(len(loaded), len(self.data))
+        self.assertIsInstance(loaded.latitude.dtype, pd.CategoricalDtype)
+        self.assertEqual(list(loaded.latitude.astype(object)), list(self.data.latitude))
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(loaded.date_start))
+        self.assertIsInstance(loaded.country.dtype, pd.CategoricalDtype)
+        self.assertEqual(loaded.cases.sum(), self.data.cases.sum())
+        self.assertEqual(list(loaded.date_confirmation.astype(object).fillna('')),
+                         list(self.data.date_confirmation.fillna('')))
+
+        # Same animation from the loaded table as from the text one.
+        want = list(aggregation.animation_features(*aggregation.animation_cells(self.data)))
+        got = list(aggregation.animation_features(*aggregation.animation_cells(loaded)))
+        self.assertEqual(got, want)
+        self.assertEqual(jhu.expand_cases(loaded).ID.tolist(), jhu.expand_cases(self.data).ID.tolist())
+        return loaded
+
+    @unittest.skipIf(cache.pa is None, 'pyarrow not installed')
+    def test_arrow(self):
+        self.check_round_trip('arrow')
+
+    def test_numpy(self):
+        loaded = self.check_round_trip('numpy')
+        self.assertTrue(os.path.isdir(self.path))
+
+    def test_overwrite(self):
+        cache.save_case_table(self.data, self.path, backend='numpy')
+        cache.save_case_table(self.data.head(10), self.path)
+        self.assertEqual(len(cache.load_case_table(self.path)), 10)
+        self.assertEqual(os.listdir(self.tmpdir.name), ['full-data.cache'])
+
+    def test_dates(self):
+        dates = pd.Series(['01.03.2020', '02.03.2020 - 05.03.2020', '- 04.03.2020', None])
+        parsed = cache.to_columnar(pd.DataFrame({'date_confirmation': dates}))
+        self.assertEqual(parsed.date_start.dt.day.tolist()[:2], [1, 2])
+        self.assertEqual(parsed.date_end.dt.day.tolist()[:3], [1, 5, 4])
+        self.assertTrue(parsed.date_start.isnull().tolist()[2:] == [True, True])
@@ -0,0 +1,72 @@
+import unittest
+import pathlib
+import tempfile
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import aggregation
+import clusters
+import tiles
+
+
+def grid_clusters(totals: pd.DataFrame, zoom: int, cell_size: int) -> dict:
+    '''Clusters at one zoom level, straight from the locations : {cell: (cases, locations, largest row)}.'''
+    x, y = tiles.mercator(totals.latitude.astype(float).values, totals.longitude.astype(float).values)
+    n = clusters.cells_per_side(zoom, cell_size)
+    result = {}
+    for i, cell in enumerate(zip(np.floor(x * n).astype(int), np.floor(y * n).astype(int))):
+        cases, count, largest = result.get(cell, (0, 0, None))
+        if largest is None or totals.cases.iloc[i] > totals.cases.iloc[largest]:
+            largest = i
+        result[cell] = (cases + int(totals.cases.iloc[i]), count + 1, largest)
+    return result
+
+
+class TestClusters(unittest.TestCase):
+
+    def setUp(self):
+        cur_dir = pathlib.Path(__file__).parent.absolute()
+        with open(os.path.join(cur_dir, '..', 'map_data', 'full-data.sample.json')) as F:
+            sample = pd.DataFrame(json.load(F)['data'])
+        self.totals = aggregation.reduce_to_unique(sample)
+
+    def test_same_as_grid(self):
+        levels = clusters.cluster_levels(self.totals, 0, 6, 64)
+        self.assertEqual(sorted(levels), list(range(7)))
+        for zoom, level in levels.items():
+            want = grid_clusters(self.totals, zoom, 64)
+            got = {(int(c), l, r) for c, l, r in zip(level.cases, level.locations, level.representative)}
+            self.assertEqual(got, {(c, l, r) for c, l, r in want.values()}, zoom)
+            self.assertEqual(level.cases.sum(), self.totals.cases.sum())
+
+    def test_nearby_points(self):
+        totals = pd.DataFrame({
+            'latitude': ['30.59', '30.60', '45.46'],
+            'longitude': ['114.30', '114.31', '9.19'],
+            'cases': [10, 30, 5],
+        })
+        levels = clusters.cluster_levels(totals, 0, 16, cell_size=256)
+        self.assertEqual(levels[0].cases.tolist(), [45])
+        self.assertEqual(levels[0].locations.tolist(), [3])
+        self.assertEqual(levels[0].representative.tolist(), [1])
+        self.assertEqual(sorted(levels[5].cases.tolist()), [5, 40])
+        self.assertEqual(sorted(levels[16].cases.tolist()), [5, 10, 30])
+
+    def test_cell_size(self):
+        with self.assertRaises(ValueError):
+            clusters.cells_per_side(3, 60)
+        self.assertEqual(clusters.cells_per_side(3, 256), 8)
+
+    def test_write(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            outdir = os.path.join(tmpdir, 'clusters')
+            index = clusters.write_clusters(outdir, self.totals, 0, 3)
+            with open(os.path.join(outdir, '0.geojson')) as F:
+                features = json.load(F)['features']
+            self.assertEqual(len(features), index['clusters']['0'])
+            self.assertEqual(sum(f['properties']['cases'] for f in features), self.totals.cases.sum())
+            self.assertEqual(sum(f['properties']['locations'] for f in features), len(self.totals))
+            self.assertEqual(sorted(os.listdir(outdir)), ['0.geojson', '1.geojson', '2.geojson', '3.geojson', 'index.json'])
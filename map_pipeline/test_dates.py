@@ -0,0 +1,52 @@
+import unittest
+
+import pandas as pd
+from pandas.testing import assert_series_equal
+
+import dates
+
+
+def parse_one(text: str) -> pd.Timestamp:
+    '''Parse a single string, as previously done row by row.'''
+    return pd.to_datetime(text, format='%d.%m.%Y', errors='coerce')
+
+
+class TestDates(unittest.TestCase):
+
+    def setUp(self):
+        self.values = pd.Series(['05.03.2020', '05.03.2020 - 07.03.2020', '- 04.03.2020', '06.03.2020 -',
+                                 None, 'March', '31.02.2020', '05.03.2020', ' 05.03.2020'], index=range(10, 19))
+
+    def test_parse_dates(self):
+        parsed = dates.parse_dates(self.values)
+        want = pd.Series([parse_one(x) if x is not None else pd.NaT for x in self.values],
+                         index=self.values.index, dtype='datetime64[ns]')
+        assert_series_equal(parsed, want)
+
+    def test_parse_ranges(self):
+        parsed = dates.parse_ranges(self.values)
+        self.assertEqual(list(parsed.columns), ['date_start', 'date_end'])
+        self.assertEqual(parsed.date_start.dt.day.fillna(0).astype(int).tolist(), [5, 5, 0, 6, 0, 0, 0, 5, 5])
+        self.assertEqual(parsed.date_end.dt.day.fillna(0).astype(int).tolist(), [5, 7, 4, 0, 0, 0, 0, 5, 5])
+        self.assertEqual(parsed.index.tolist(), self.values.index.tolist())
+
+    def test_categorical(self):
+        assert_series_equal(dates.parse_dates(self.values.astype('category')), dates.parse_dates(self.values))
+        parsed = dates.parse_ranges(self.values.astype('category'))
+        assert_series_equal(parsed.date_end, dates.parse_ranges(self.values).date_end)
+
+    def test_each_value_parsed_once(self):
+        dates._parsed.clear()
+        column = pd.Series(['01.04.2020', '02.04.2020'] * 1000)
+        dates.parse_dates(column)
+        self.assertEqual(len(dates._parsed), 2)
+        dates.parse_dates(pd.Series(['02.04.2020', '03.04.2020']))
+        self.assertEqual(len(dates._parsed), 3)
+
+    def test_format(self):
+        parsed = dates.parse_dates(pd.Series(['1/22/20', '12/3/20']), '%m/%d/%y')
+        self.assertEqual(parsed.dt.strftime('%d.%m.%Y').tolist(), ['22.01.2020', '03.12.2020'])
+
+    def test_empty(self):
+        self.assertEqual(len(dates.parse_dates(pd.Series([], dtype=object))), 0)
+        self.assertTrue(dates.parse_ranges(pd.Series([None, None])).isnull().all().all())
@@ -0,0 +1,100 @@
+import unittest
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import requests
+
+import fetch
+
+
+class Handler(BaseHTTPRequestHandler):
+    '''Serves server.body with an ETag and Last-Modified, and honours conditional requests.'''
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        if server.status != 200:
+            self.send_error(server.status)
+            return
+        etag = '"{}"'.format(server.version)
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', 'Thu, 02 Apr 2020 00:00:00 GMT')
+        self.send_header('Content-Length', str(len(server.body)))
+        self.end_headers()
+        self.wfile.write(server.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestFetch(unittest.TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.server.body = b'a,b\n1,2\n' * 1000
+        self.server.version = 1
+        self.server.status = 200
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = 'http://127.0.0.1:{}/data.csv'.format(self.server.server_port)
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'data.csv')
+        self.session = requests.Session()
+
+    def tearDown(self):
+        self.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+
+    def read(self):
+        with open(self.path, 'rb') as F:
+            return F.read()
+
+    def test_download(self):
+        self.assertTrue(fetch.fetch(self.url, self.path, self.session, chunk_size=100))
+        self.assertEqual(self.read(), self.server.body)
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)), ['data.csv', 'data.csv.http.json'])
+
+    def test_permissions(self):
+        fetch.fetch(self.url, self.path, self.session)
+        with open(os.path.join(self.tmpdir.name, 'plain'), 'w'):
+            pass
+        mode = os.stat(os.path.join(self.tmpdir.name, 'plain')).st_mode & 0o777
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, mode)
+        self.assertEqual(os.stat(fetch.sidecar_path(self.path)).st_mode & 0o777, mode)
+
+    def test_not_modified(self):
+        fetch.fetch(self.url, self.path, self.session)
+        self.assertFalse(fetch.fetch(self.url, self.path, self.session))
+        self.assertEqual(self.server.requests[-1]['If-None-Match'], '"1"')
+        self.assertEqual(self.read(), self.server.body)
+
+        self.server.body = b'a,b\n3,4\n'
+        self.server.version = 2
+        self.assertTrue(fetch.fetch(self.url, self.path, self.session))
+        self.assertEqual(self.read(), b'a,b\n3,4\n')
+
+    def test_missing_file_is_downloaded(self):
+        fetch.fetch(self.url, self.path, self.session)
+        os.remove(self.path)
+        self.assertTrue(fetch.fetch(self.url, self.path, self.session))
+        self.assertNotIn('If-None-Match', self.server.requests[-1])
+
+    def test_error_keeps_previous_file(self):
+        fetch.fetch(self.url, self.path, self.session)
+        self.server.status = 404
+        self.server.version = 2
+        with self.assertRaises(requests.HTTPError):
+            fetch.fetch(self.url, self.path, self.session)
+        self.assertEqual(self.read(), self.server.body)
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)), ['data.csv', 'data.csv.http.json'])
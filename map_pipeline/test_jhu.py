@@ -0,0 +1,147 @@
+import unittest
+import pathlib
+import os
+import tempfile
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+import jhu
+
+
+def legacy_reformat(us_data: pd.DataFrame) -> pd.DataFrame:
+    '''Row by row reformatting as previously done in pipeline.py.'''
+    us_data, date_columns = jhu.rename_date_columns(us_data)
+    entries = []
+    for i, date in enumerate(date_columns):
+        for j, row in us_data.iterrows():
+            if float(row['Lat']) == 0 or float(row['Long_']) == 0:
+                continue
+            if pd.isnull(row['Lat']) or pd.isnull(row['Long_']):
+                continue
+            if i == 0:
+                N = int(row[date])
+            else:
+                N = int(row[date]) - int(row[date_columns[i-1]])
+            entry = {
+                    'latitude': row['Lat'],
+                    'longitude': row['Long_'],
+                    'city': row['Admin2'],
+                    'province': row['Province_State'],
+                    'date_confirmation': date
+            }
+            entries.extend([entry]*N)
+
+    us_reformed = pd.DataFrame(entries, columns=['latitude', 'longitude', 'city', 'province', 'date_confirmation'])
+    us_reformed.insert(0, 'ID', range(1, len(us_reformed) + 1))
+    us_reformed['ID'] = us_reformed['ID'].apply(lambda x : 'JHU' + str(x))
+    us_reformed.insert(5, 'country', 'United States')
+    us_reformed.insert(6, 'age', '')
+    us_reformed.insert(7, 'sex', '')
+    us_reformed.insert(8, 'symptoms', '')
+    us_reformed.insert(9, 'source', 'JHU')
+    us_reformed.insert(11, 'geo_resolution', 'admin2')
+    return us_reformed
+
+
+class TestJHU(unittest.TestCase):
+
+    def setUp(self):
+        cur_dir = pathlib.Path(__file__).parent.absolute()
+        us_data = jhu.read_jhu(os.path.join(cur_dir, '..', 'map_data', 'jhu_US_timeseries.csv'))
+        # A slice with some cases, negative daily differences and 0 coordinates.
+        self.us_data = pd.concat([us_data.iloc[:120], us_data.iloc[3140:3170]])
+
+    def test_rename_date_columns(self):
+        data, date_columns = jhu.rename_date_columns(self.us_data)
+        self.assertEqual(date_columns[0], '22.01.2020')
+        self.assertEqual(date_columns[-1], '02.04.2020')
+        self.assertIn('02.04.2020', data.columns)
+        self.assertNotIn('4/2/20', data.columns)
+
+    def test_same_as_legacy(self):
+        got = jhu.jhu_to_line_list(self.us_data)
+        want = legacy_reformat(self.us_data)
+        self.assertGreater(len(want), 0)
+        assert_frame_equal(got, want, check_dtype=False)
+
+    def test_daily_counts(self):
+        us_data = pd.DataFrame({
+            'Admin2': ['A', 'B'], 'Province_State': ['P', 'P'],
+            'Lat': ['1.5', '0'], 'Long_': ['2.5', '3'],
+            '1/22/20': ['1', '4'], '1/23/20': ['3', '5'], '1/24/20': ['2', '5']})
+        data, date_columns = jhu.rename_date_columns(us_data)
+        counts = jhu.daily_counts(data, date_columns)
+        self.assertEqual(counts.cases.tolist(), [1, 2])
+        self.assertEqual(counts.date_confirmation.tolist(), ['22.01.2020', '23.01.2020'])
+
+    def test_weighted(self):
+        weighted = jhu.jhu_to_weighted(self.us_data)
+        line_list = jhu.jhu_to_line_list(self.us_data)
+        self.assertEqual(weighted.cases.sum(), len(line_list))
+        self.assertEqual(weighted.ID.iloc[1], 'JHU{}'.format(weighted.cases.iloc[0] + 1))
+        assert_frame_equal(jhu.expand_cases(weighted), line_list)
+
+    def test_expand_cases_keeps_line_list_rows(self):
+        data = pd.DataFrame({'ID': ['001-1', 'JHU1', 'JHU4'], 'cases': [None, 3, 1]})
+        expanded = jhu.expand_cases(data)
+        self.assertEqual(expanded.ID.tolist(), ['001-1', 'JHU1', 'JHU2', 'JHU3', 'JHU4'])
+        self.assertNotIn('cases', expanded.columns)
+
+
+class TestIncremental(unittest.TestCase):
+
+    def setUp(self):
+        cur_dir = pathlib.Path(__file__).parent.absolute()
+        us_data = jhu.read_jhu(os.path.join(cur_dir, '..', 'map_data', 'jhu_US_timeseries.csv'))
+        self.us_data = pd.concat([us_data.iloc[:120], us_data.iloc[3140:3170]])
+        # Same file, as it was 5 days earlier.
+        self.earlier = self.us_data.iloc[:, :-5]
+
+    def test_same_as_full_rebuild(self):
+        previous, state = jhu.update_weighted(self.earlier)
+        assert_frame_equal(previous, jhu.jhu_to_weighted(self.earlier))
+        self.assertEqual(state['last_date'], '28.03.2020')
+
+        weighted, state = jhu.update_weighted(self.us_data, previous, state)
+        assert_frame_equal(weighted, jhu.jhu_to_weighted(self.us_data))
+        self.assertEqual(state['last_date'], '02.04.2020')
+        self.assertEqual(state['last_id'], weighted.cases.sum())
+
+    def test_nothing_new(self):
+        previous, state = jhu.update_weighted(self.us_data)
+        weighted, new_state = jhu.update_weighted(self.us_data, previous, state)
+        self.assertIs(weighted, previous)
+        self.assertEqual(new_state, state)
+
+    def test_revised_counts(self):
+        previous, state = jhu.update_weighted(self.earlier)
+        revised = self.us_data.copy()
+        revised.iloc[0, revised.columns.get_loc('3/28/20')] = '1000'
+        weighted, _ = jhu.update_weighted(revised, previous, state)
+        assert_frame_equal(weighted, jhu.jhu_to_weighted(revised))
+
+    def test_revised_earlier_counts(self):
+        # A count corrected before the last processed date, the last one unchanged.
+        previous, state = jhu.update_weighted(self.earlier)
+        revised = self.us_data.copy()
+        last = jhu.located(revised)['3/28/20'].astype(int)
+        last = last[last > 0]
+        row, column = revised.index.get_loc(last.index[0]), revised.columns.get_loc('3/20/20')
+        self.assertLess(int(revised.iloc[row, column]), last.iloc[0])
+        revised.iloc[row, column] = str(last.iloc[0])
+        weighted, state = jhu.update_weighted(revised, previous, state)
+        assert_frame_equal(weighted, jhu.jhu_to_weighted(revised))
+        self.assertEqual(state, jhu.update_weighted(revised)[1])
+
+    def test_files(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            jhu_file = os.path.join(tmpdir, 'jhu.csv')
+            self.earlier.to_csv(jhu_file, index=False)
+            jhu.update_jhu_file(jhu_file)
+            self.assertEqual(jhu.load_state(jhu.state_path(jhu_file))['last_date'], '28.03.2020')
+
+            self.us_data.to_csv(jhu_file, index=False)
+            weighted = jhu.update_jhu_file(jhu_file)
+            assert_frame_equal(weighted, jhu.jhu_to_weighted(self.us_data), check_dtype=False)
+            assert_frame_equal(jhu.load_weighted(jhu.weighted_path(jhu_file)), weighted, check_dtype=False)
@@ -0,0 +1,81 @@
+import unittest
+import tempfile
+import configparser
+import gzip
+import json
+import os
+
+import publish
+
+
+class TestPublish(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmpdir.name, 'dailies.geojson')
+        self.site = os.path.join(self.tmpdir.name, 'site')
+        self.destination = os.path.join(self.site, 'dailies.geojson')
+        self.write_source(b'{"type": "FeatureCollection", "features": []}')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_source(self, data: bytes):
+        with open(self.source, 'wb') as F:
+            F.write(data)
+
+    def read(self, path: str) -> bytes:
+        with open(path, 'rb') as F:
+            return F.read()
+
+    def test_publish(self):
+        changed = publish.publish([(self.source, self.destination)])
+        self.assertEqual(changed, {self.destination: True})
+        self.assertEqual(self.read(self.destination), self.read(self.source))
+        self.assertEqual(gzip.decompress(self.read(self.destination + '.gz')), self.read(self.source))
+        self.assertEqual(os.path.exists(self.destination + '.br'), publish.brotli is not None)
+
+        manifest = publish.load_manifest(self.site)
+        digest = publish.file_hash(self.source)
+        self.assertEqual(manifest, {'dailies.geojson': {
+            'sha256': digest, 'size': os.path.getsize(self.source), 'version': digest[:publish.VERSION_LENGTH]}})
+        self.assertEqual(os.stat(self.destination).st_mode & 0o777, publish.PERMISSIONS)
+        # Only the outputs and the manifest, no temporary files left.
+        self.assertEqual(sorted(os.listdir(self.site)),
+                         sorted(['dailies.geojson', 'manifest.json']
+                                + ['dailies.geojson' + publish.COMPRESSIONS[c]
+                                   for c in publish.available_compressions(publish.COMPRESSIONS)]))
+
+    def test_unchanged(self):
+        publish.publish([(self.source, self.destination)])
+        mtimes = {name: os.stat(os.path.join(self.site, name)).st_mtime_ns for name in os.listdir(self.site)}
+        os.utime(self.source) # touched, same content
+        changed = publish.publish([(self.source, self.destination)])
+        self.assertEqual(changed, {self.destination: False})
+        self.assertEqual({name: os.stat(os.path.join(self.site, name)).st_mtime_ns for name in os.listdir(self.site)},
+                         mtimes)
+
+    def test_changed(self):
+        publish.publish([(self.source, self.destination)])
+        self.write_source(b'{"type": "FeatureCollection", "features": [1]}')
+        changed = publish.publish([(self.source, self.destination)])
+        self.assertEqual(changed, {self.destination: True})
+        self.assertEqual(gzip.decompress(self.read(self.destination + '.gz')), self.read(self.source))
+        self.assertEqual(publish.load_manifest(self.site)['dailies.geojson']['sha256'], publish.file_hash(self.source))
+
+    def test_missing_sibling(self):
+        publish.publish([(self.source, self.destination)])
+        os.remove(self.destination + '.gz')
+        self.assertEqual(publish.publish([(self.source, self.destination)]), {self.destination: True})
+        self.assertTrue(os.path.exists(self.destination + '.gz'))
+
+    def test_deterministic_gzip(self):
+        compressed = [b''.join(publish.compress_chunks([b'abc'] * 3, 'gzip')) for _ in range(2)]
+        self.assertEqual(compressed[0], compressed[1])
+        self.assertEqual(gzip.decompress(compressed[0]), b'abcabcabc')
+
+    def test_html_targets(self):
+        config = configparser.ConfigParser()
+        config.read_string('[HTML]\nGEO_ANIME = /site/dailies.geojson\n')
+        targets = publish.html_targets(config['HTML'], {'GEO_ANIME': self.source, 'GEO_TOTALS': 'totals.geojson'})
+        self.assertEqual(targets, [(self.source, '/site/dailies.geojson')])
@@ -0,0 +1,269 @@
+import unittest
+import pathlib
+import tempfile
+import hashlib
+import json
+import os
+import threading
+import time
+from unittest import mock
+
+import pandas as pd
+
+import cache
+import s3push
+import schema
+from jhu import expand_cases
+
+try:
+    import boto3
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+
+def legacy_exports(df: pd.DataFrame, csvpath: str, jsonpath: str) -> None:
+    '''Whole table exports as previously done in s3push.py.'''
+    df.to_csv(csvpath, index=False)
+    with open(jsonpath, 'w') as F:
+        json.dump(df.to_dict(orient='records'), F, indent=4)
+
+
+def merged_outputs(infile: str, outdir: str) -> tuple:
+    '''
+    full-data.json and the cache as written by pipeline.py, from the rows of
+    infile with some of them weighted.
+    '''
+    with open(infile) as F:
+        df = pd.DataFrame(json.load(F)['data'])
+    df['cases'] = [3 if i % 7 == 0 else 1 for i in range(len(df))]
+    typed = schema.apply_schema(df)
+    jsonpath = os.path.join(outdir, 'full-data.json')
+    with open(jsonpath, 'w') as F:
+        json.dump({'data': schema.as_text(expand_cases(typed)).to_dict(orient='records')}, F)
+    cachefile = os.path.join(outdir, 'full-data.cache')
+    cache.save_case_table(typed, cachefile, 'numpy')
+    return jsonpath, cachefile
+
+
+class TestExports(unittest.TestCase):
+
+    def setUp(self):
+        self.cur_dir = pathlib.Path(__file__).parent.absolute()
+        self.infile = os.path.join(self.cur_dir, '..', 'map_data', 'full-data.sample.json')
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.tmpdir.name, name)
+
+    def assert_same_files(self, a: str, b: str):
+        with open(a, 'rb') as F, open(b, 'rb') as G:
+            self.assertEqual(F.read(), G.read())
+
+    def assert_same_exports(self, chunks, df: pd.DataFrame):
+        n = s3push.write_exports(chunks, self.path('streamed.csv'), self.path('streamed.json'))
+        legacy_exports(df, self.path('legacy.csv'), self.path('legacy.json'))
+        self.assertEqual(n, len(df))
+        self.assert_same_files(self.path('streamed.csv'), self.path('legacy.csv'))
+        self.assert_same_files(self.path('streamed.json'), self.path('legacy.json'))
+
+    def test_json_input(self):
+        with open(self.infile) as F:
+            df = pd.DataFrame(json.load(F)['data'])
+        self.assert_same_exports(s3push.case_chunks(self.infile, chunk_rows=500), df)
+
+    def test_cache_input(self):
+        # The merged table as pipeline.py caches it, and the full-data.json it writes from it.
+        jsonpath, cachefile = merged_outputs(self.infile, self.tmpdir.name)
+        s3push.write_exports(s3push.case_chunks(jsonpath, chunk_rows=500), self.path('json.csv'), self.path('json.json'))
+        for backend in ['numpy', 'arrow']:
+            if backend == 'arrow' and cache.pa is None:
+                continue
+            cache.save_case_table(cache.load_case_table(cachefile), cachefile, backend)
+            n = s3push.write_exports(s3push.case_chunks(jsonpath, cachefile, chunk_rows=100),
+                                     self.path('cache.csv'), self.path('cache.json'))
+            self.assertEqual(n, len(s3push.load_table(jsonpath)))
+            self.assert_same_files(self.path('cache.csv'), self.path('json.csv'))
+            self.assert_same_files(self.path('cache.json'), self.path('json.json'))
+
+    def test_empty(self):
+        n = s3push.write_exports(iter([]), self.path('streamed.csv'), self.path('streamed.json'))
+        self.assertEqual(n, 0)
+        with open(self.path('streamed.json')) as F:
+            self.assertEqual(json.load(F), [])
+
+    def test_local_etag(self):
+        path = self.path('data')
+        data = os.urandom(2500)
+        with open(path, 'wb') as F:
+            F.write(data)
+        self.assertEqual(s3push.local_etag(path, 4096), hashlib.md5(data).hexdigest())
+        parts = b''.join(hashlib.md5(data[i:i + 1000]).digest() for i in range(0, 2500, 1000))
+        self.assertEqual(s3push.local_etag(path, 1000), hashlib.md5(parts).hexdigest() + '-3')
+
+
+@unittest.skipIf(mock_aws is None, 'boto3 and moto not installed')
+class TestPush(unittest.TestCase):
+
+    PART_SIZE = 5 * 2**20 # S3 minimum
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.mock = mock_aws()
+        self.mock.start()
+        self.client = boto3.client('s3', region_name='us-east-1')
+        self.client.create_bucket(Bucket='bucket')
+        self.small = os.path.join(self.tmpdir.name, 'small.csv')
+        self.large = os.path.join(self.tmpdir.name, 'large.json')
+        with open(self.small, 'wb') as F:
+            F.write(b'a,b\n1,2\n')
+        with open(self.large, 'wb') as F:
+            F.write(os.urandom(self.PART_SIZE + 1000))
+
+    def tearDown(self):
+        self.mock.stop()
+        self.tmpdir.cleanup()
+
+    def push(self):
+        return s3push.push(self.client, [self.small, self.large], 'bucket', self.PART_SIZE, 2)
+
+    def test_push(self):
+        self.assertEqual(self.push(), {self.small: True, self.large: True})
+        for path in [self.small, self.large]:
+            body = self.client.get_object(Bucket='bucket', Key=os.path.basename(path))['Body'].read()
+            with open(path, 'rb') as F:
+                self.assertEqual(body, F.read())
+        # The large file went up in 2 parts.
+        self.assertTrue(s3push.remote_etag(self.client, 'bucket', 'large.json').endswith('-2'))
+
+    def test_unchanged(self):
+        self.push()
+        self.assertEqual(self.push(), {self.small: False, self.large: False})
+        with open(self.small, 'ab') as F:
+            F.write(b'3,4\n')
+        self.assertEqual(self.push(), {self.small: True, self.large: False})
+
+    def test_max_workers(self):
+        lock = threading.Lock()
+        running = [0, 0] # now, most at once
+
+        def upload(*args):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            return True
+
+        paths = [os.path.join(self.tmpdir.name, '{}.csv'.format(i)) for i in range(20)]
+        with mock.patch('s3push.upload_if_changed', upload):
+            uploaded = s3push.push(self.client, paths, 'bucket', max_workers=3)
+        self.assertEqual(uploaded, dict.fromkeys(paths, True))
+        self.assertLessEqual(running[1], 3)
+
+    def test_delete_keys(self):
+        keys = ['{}.csv'.format(i) for i in range(5)]
+        for key in keys:
+            self.client.upload_file(self.small, 'bucket', key)
+        with mock.patch.object(self.client, 'delete_objects', wraps=self.client.delete_objects) as delete:
+            s3push.delete_keys(self.client, 'bucket', keys[:4], batch_size=3)
+        self.assertEqual(delete.call_count, 2)
+        keys = [o['Key'] for o in self.client.list_objects_v2(Bucket='bucket')['Contents']]
+        self.assertEqual(keys, ['4.csv'])
+
+    def test_delete_errors(self):
+        errors = {'Errors': [{'Key': 'a.csv', 'Code': 'AccessDenied', 'Message': 'Access Denied'}]}
+        with mock.patch.object(self.client, 'delete_objects', return_value=errors):
+            with self.assertRaisesRegex(RuntimeError, 'a.csv'):
+                s3push.delete_keys(self.client, 'bucket', ['a.csv'])
+
+    def test_missing_object(self):
+        self.assertIsNone(s3push.remote_etag(self.client, 'bucket', 'missing.csv'))
+
+
+class TestPartitions(unittest.TestCase):
+
+    def setUp(self):
+        cur_dir = pathlib.Path(__file__).parent.absolute()
+        self.infile = os.path.join(cur_dir, '..', 'map_data', 'full-data.sample.json')
+        self.table = s3push.load_table(self.infile)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.outdir = os.path.join(self.tmpdir.name, 'export')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read_partitions(self) -> pd.DataFrame:
+        manifest = s3push.load_manifest(self.outdir)
+        parts = [pd.read_csv(os.path.join(self.outdir, name, s3push.PART_NAME), dtype=str, keep_default_na=False)
+                 for name in sorted(manifest['partitions'])]
+        return pd.concat(parts, ignore_index=True)
+
+    def test_partitions(self):
+        changed, removed = s3push.export_partitions(self.table, self.outdir)
+        names = s3push.partition_names(self.table)
+        self.assertEqual(len(changed), names.nunique())
+        self.assertEqual(removed, [])
+        manifest = s3push.load_manifest(self.outdir)
+        self.assertEqual(sorted(manifest['partitions']), sorted(names.unique()))
+        self.assertEqual(sum(p['rows'] for p in manifest['partitions'].values()), len(self.table))
+
+        # Every row once, in its date's partition.
+        self.assertEqual(sorted(self.read_partitions().ID), sorted(self.table.ID))
+        for name in manifest['partitions']:
+            part = pd.read_csv(os.path.join(self.outdir, name, s3push.PART_NAME), dtype=str, keep_default_na=False)
+            self.assertEqual(set(s3push.partition_names(part)), {name})
+
+    def test_incremental(self):
+        s3push.export_partitions(self.table, self.outdir)
+        self.assertEqual(s3push.export_partitions(self.table, self.outdir), ([], []))
+
+        # A new case on one date, and a date that went away.
+        last = self.table.iloc[[0]].assign(ID='new')
+        name = s3push.partition_names(last).iloc[0]
+        names = s3push.partition_names(self.table)
+        gone = [n for n in names.unique() if n != name][0]
+        table = pd.concat([self.table[(names != gone).values], last], ignore_index=True)
+        changed, removed = s3push.export_partitions(table, self.outdir)
+        self.assertEqual(changed, [os.path.join(self.outdir, name, s3push.PART_NAME)])
+        self.assertEqual(removed, [os.path.join(self.outdir, gone, s3push.PART_NAME)])
+        self.assertFalse(os.path.exists(os.path.join(self.outdir, gone)))
+        self.assertNotIn(gone, s3push.load_manifest(self.outdir)['partitions'])
+
+    def test_cache_input(self):
+        jsonpath, cachefile = merged_outputs(self.infile, self.tmpdir.name)
+        s3push.export_partitions(s3push.load_table(jsonpath), self.outdir)
+        from_json = s3push.load_manifest(self.outdir)
+        s3push.export_partitions(s3push.load_table(jsonpath, cachefile), self.outdir)
+        self.assertEqual(s3push.load_manifest(self.outdir), from_json)
+
+    def test_weighted(self):
+        table = self.table.iloc[:20].assign(cases=2)
+        s3push.export_partitions(table, self.outdir)
+        self.assertEqual(len(self.read_partitions()), 40)
+
+    def test_undated(self):
+        table = self.table.iloc[:3].assign(date_confirmation=['05.03.2020 - 07.03.2020', '06.03.2020 -', ''])
+        self.assertEqual(s3push.partition_names(table).tolist(),
+                         ['date_confirmation=2020-03-07', 'date_confirmation=2020-03-06', 'date_confirmation=unknown'])
+
+    @unittest.skipIf(mock_aws is None, 'boto3 and moto not installed')
+    def test_push(self):
+        with mock_aws():
+            client = boto3.client('s3', region_name='us-east-1')
+            client.create_bucket(Bucket='bucket')
+            s3push.export_partitions(self.table, self.outdir, client, 'bucket')
+            keys = {o['Key'] for o in client.list_objects_v2(Bucket='bucket')['Contents']}
+            names = s3push.partition_names(self.table).unique()
+            self.assertEqual(keys, {'export/{}/{}'.format(n, s3push.PART_NAME) for n in names} | {'export/manifest.json'})
+
+            gone = names[0]
+            s3push.export_partitions(self.table[(s3push.partition_names(self.table) != gone).values],
+                                     self.outdir, client, 'bucket')
+            keys = {o['Key'] for o in client.list_objects_v2(Bucket='bucket')['Contents']}
+            self.assertNotIn('export/{}/{}'.format(gone, s3push.PART_NAME), keys)
+            self.assertEqual(len(keys), len(names))
@@ -0,0 +1,95 @@
+import unittest
+import pathlib
+import tempfile
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+import aggregation
+import cache
+import jhu
+import schema
+import synthetic
+import writers
+
+
+class TestSchema(unittest.TestCase):
+
+    def setUp(self):
+        self.data = pd.DataFrame({
+            'ID': ['000-1', '000-2', None, 'JHU4'],
+            'latitude': ['34.30828379', '#REF!', '-14.270999999999999', '28'],
+            'longitude': ['-118.22824109999999', '2.5', '-170.132', '-2'],
+            'country': ['United States', 'France', None, 'United States'],
+            'date_confirmation': ['01.03.2020', '02.03.2020 - 05.03.2020', 'NA', '05.03.2020'],
+        })
+
+    def test_apply_schema(self):
+        typed = schema.apply_schema(self.data)
+        self.assertTrue(schema.is_typed(typed))
+        self.assertFalse(schema.is_typed(self.data))
+        self.assertIsInstance(typed.latitude.dtype, pd.CategoricalDtype)
+        self.assertIsInstance(typed.country.dtype, pd.CategoricalDtype)
+        self.assertEqual(typed.date_end.dt.day.tolist()[:2], [1, 5])
+        self.assertTrue(typed.date_start.isnull()[2])
+
+        # Coordinates keep their text.
+        self.assertEqual(list(typed.longitude.astype(object)), list(self.data.longitude))
+        assert_frame_equal(schema.apply_schema(typed), typed)
+
+    def test_as_text(self):
+        text = schema.as_text(schema.apply_schema(self.data))
+        self.assertEqual(list(text.columns), list(self.data.columns))
+        self.assertEqual(text.latitude.tolist(), ['34.30828379', '#REF!', '-14.270999999999999', '28'])
+        self.assertTrue(pd.isnull(text.ID[2]))
+        self.assertEqual(text.country.dtype, object)
+
+    def test_memory(self):
+        data = synthetic.line_list(50000)
+        typed = schema.apply_schema(data)
+        self.assertLess(typed.memory_usage(deep=True).sum() * 3, data.memory_usage(deep=True).sum())
+
+    def check_same_outputs(self, data: pd.DataFrame, typed: pd.DataFrame):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            def output(name, features):
+                path = os.path.join(tmpdir, name)
+                writers.write_feature_collection(features, path)
+                with open(path, 'rb') as F:
+                    return F.read()
+
+            for groupby in ['week', 'day']:
+                self.assertEqual(
+                    output('typed.geojson', writers.encode_animation_features(*aggregation.animation_cells(typed, groupby))),
+                    output('text.geojson', writers.encode_animation_features(*aggregation.animation_cells(data, groupby))))
+            self.assertEqual(output('typed.geojson', aggregation.totals_features(aggregation.reduce_to_unique(typed))),
+                             output('text.geojson', aggregation.totals_features(aggregation.reduce_to_unique(data))))
+        self.assertEqual(json.dumps(schema.as_text(jhu.expand_cases(typed)).to_dict(orient='records')),
+                         json.dumps(jhu.expand_cases(data).to_dict(orient='records')))
+
+    def test_same_outputs(self):
+        # Sample line list and JHU rows, missing values as NaN (as read back from the work directory).
+        cur_dir = pathlib.Path(__file__).parent.absolute()
+        with open(os.path.join(cur_dir, '..', 'map_data', 'full-data.sample.json')) as F:
+            sample = pd.DataFrame(json.load(F)['data'])
+        us_data = jhu.read_jhu(os.path.join(cur_dir, '..', 'map_data', 'jhu_US_timeseries.csv')).iloc[:100]
+        data = pd.concat([sample, jhu.jhu_to_weighted(us_data)], ignore_index=True, sort=False)
+        data = data.where(data.notnull(), np.nan)
+        # The same point written two ways stays two locations, 28 isn't written 28.0.
+        extra = data.iloc[:3].assign(latitude=['19.43333', '19.4333300', '28'], longitude=['-99.13333', '-99.13333', '-2'])
+        data = pd.concat([data, extra], ignore_index=True)
+        data['cases'] = aggregation.case_weights(data)
+
+        typed = schema.apply_schema(data)
+        self.check_same_outputs(data, typed)
+        # Categories of a table read back from the cache aren't sorted.
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'merged.cache')
+            cache.save_case_table(typed, path, backend='numpy')
+            self.check_same_outputs(data, cache.load_case_table(path))
+
+    def test_synthetic_outputs(self):
+        data = synthetic.line_list(20000, n_locations=500, n_days=30, seed=3)
+        self.check_same_outputs(data, schema.apply_schema(data))
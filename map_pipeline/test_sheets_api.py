@@ -0,0 +1,44 @@
+import unittest
+import json
+import threading
+
+from googleapiclient.http import HttpMockSequence
+
+from sheets_api import SheetsSession
+
+
+def values_response(values):
+    return ({'status': '200'}, json.dumps({'range': 'sheet!A1:V3', 'majorDimension': 'ROWS', 'values': values}))
+
+
+class TestSheetsSession(unittest.TestCase):
+
+    def test_no_discovery_request(self):
+        # Any discovery request would be answered with the first sheet's values.
+        http = HttpMockSequence([
+            values_response([['ID', 'latitude'], ['1', '2.5']]),
+            values_response([['ID', 'latitude'], ['2', '3.5']]),
+        ])
+        session = SheetsSession(http=http)
+        self.assertEqual(session.values('sid1', 'outside_Hubei!A:V'), [['ID', 'latitude'], ['1', '2.5']])
+        self.assertEqual(session.values('sid2', 'Hubei!A:V'), [['ID', 'latitude'], ['2', '3.5']])
+
+    def test_request(self):
+        http = HttpMockSequence([({'status': '200'}, 'echo_request_uri')])
+        session = SheetsSession(http=http)
+        request = session.service.spreadsheets().values().get(spreadsheetId='sid', range='Hubei!A:V')
+        uri = request.execute(http=session.http())
+        self.assertTrue(uri.startswith('https://sheets.googleapis.com/v4/spreadsheets/sid/values/Hubei%21A%3AV'))
+
+    def test_empty_sheet(self):
+        http = HttpMockSequence([({'status': '200'}, json.dumps({'range': 'sheet!A1:V1'}))])
+        self.assertEqual(SheetsSession(http=http).values('sid', 'sheet!A:V'), [])
+
+    def test_transport_per_thread(self):
+        session = SheetsSession(credentials=object())
+        transports = []
+        thread = threading.Thread(target=lambda: transports.append(session.http()))
+        thread.start()
+        thread.join()
+        self.assertIs(session.http(), session.http())
+        self.assertIsNot(transports[0], session.http())
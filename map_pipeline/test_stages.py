@@ -0,0 +1,144 @@
+import unittest
+import tempfile
+import os
+
+import stages
+from pipeline_common import metrics
+from stages import Stage
+
+
+class TestStages(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.state = os.path.join(self.tmpdir.name, 'work', 'stages.json')
+        self.source = self.path('source.txt')
+        self.write(self.source, 'a b c')
+        self.calls = []
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.tmpdir.name, name)
+
+    def write(self, path: str, text: str):
+        with open(path, 'w') as F:
+            F.write(text)
+
+    def read(self, path: str) -> str:
+        with open(path) as F:
+            return F.read()
+
+    def step(self, name: str, func, inputs: list, output: str) -> Stage:
+        def run():
+            self.calls.append(name)
+            self.write(output, func(*[self.read(p) for p in inputs]))
+        return Stage(name, run, inputs, [output])
+
+    def pipeline(self, fail: str = None) -> list:
+        def upper(text):
+            if fail == 'upper':
+                raise RuntimeError('upper failed')
+            return text.upper()
+        # Declared out of order, count depends on upper.
+        return [
+            self.step('count', lambda text: str(len(text.split())), [self.path('upper.txt')], self.path('count.txt')),
+            self.step('upper', upper, [self.source], self.path('upper.txt')),
+            self.step('first', lambda text: text.split()[0], [self.source], self.path('first.txt')),
+        ]
+
+    def test_order(self):
+        ordered = stages.order_stages(self.pipeline())
+        self.assertEqual([s.name for s in ordered], ['upper', 'count', 'first'])
+
+    def test_cycle(self):
+        a = Stage('a', None, ['b.txt'], ['a.txt'])
+        b = Stage('b', None, ['a.txt'], ['b.txt'])
+        with self.assertRaises(ValueError):
+            stages.order_stages([a, b])
+        with self.assertRaises(ValueError):
+            stages.order_stages([a, Stage('c', None, [], ['a.txt'])])
+
+    def test_skip_unchanged(self):
+        status = stages.run_stages(self.pipeline(), self.state)
+        self.assertEqual(status, {'upper': stages.RAN, 'count': stages.RAN, 'first': stages.RAN})
+        self.assertEqual(self.read(self.path('count.txt')), '3')
+
+        self.calls = []
+        os.utime(self.source) # touched, same content
+        status = stages.run_stages(self.pipeline(), self.state)
+        self.assertEqual(set(status.values()), {stages.SKIPPED})
+        self.assertEqual(self.calls, [])
+
+    def test_changed_input(self):
+        stages.run_stages(self.pipeline(), self.state)
+        self.calls = []
+        # Every stage depending on the source runs again.
+        self.write(self.source, 'a b d')
+        status = stages.run_stages(self.pipeline(), self.state)
+        self.assertEqual(status, {'upper': stages.RAN, 'count': stages.RAN, 'first': stages.RAN})
+        self.assertEqual(self.read(self.path('upper.txt')), 'A B D')
+
+        # Same content after upper : count is skipped.
+        self.calls = []
+        self.write(self.source, 'A B D')
+        status = stages.run_stages(self.pipeline(), self.state)
+        self.assertEqual(self.calls, ['upper', 'first'])
+        self.assertEqual(status['count'], stages.SKIPPED)
+
+    def test_missing_output(self):
+        stages.run_stages(self.pipeline(), self.state)
+        self.calls = []
+        os.remove(self.path('first.txt'))
+        stages.run_stages(self.pipeline(), self.state)
+        self.assertEqual(self.calls, ['first'])
+
+    def test_force(self):
+        stages.run_stages(self.pipeline(), self.state)
+        self.calls = []
+        stages.run_stages(self.pipeline(), self.state, force=['count'])
+        self.assertEqual(self.calls, ['count'])
+
+    def test_resume(self):
+        stages.run_stages(self.pipeline(), self.state)
+        self.write(self.source, 'x y')
+        self.calls = []
+        with self.assertRaises(RuntimeError):
+            stages.run_stages(self.pipeline(fail='upper'), self.state)
+        self.assertEqual(stages.load_state(self.state)['failed'], 'upper')
+        self.assertNotIn('upper', stages.load_state(self.state)['stages'])
+
+        # Resumed : upper and what depends on it run, even though nothing changed since the failure.
+        self.calls = []
+        stages.run_stages(self.pipeline(), self.state)
+        self.assertEqual(self.calls, ['upper', 'count', 'first'])
+        self.assertEqual(self.read(self.path('count.txt')), '2')
+        self.assertIsNone(stages.load_state(self.state)['failed'])
+
+    def test_directory_hash(self):
+        directory = self.path('tiles')
+        os.makedirs(os.path.join(directory, '0'))
+        self.write(os.path.join(directory, '0', '0.json'), '{}')
+        digest = stages.path_hash(directory)
+        self.assertEqual(stages.path_hash(directory), digest)
+        self.write(os.path.join(directory, '0', '1.json'), '{}')
+        self.assertNotEqual(stages.path_hash(directory), digest)
+        self.assertIsNone(stages.path_hash(self.path('missing')))
+
+    def test_metrics(self):
+        run = metrics.RunMetrics('test')
+        stages.run_stages(self.pipeline(), self.state, metrics=run)
+        stages.run_stages(self.pipeline(), self.state, metrics=run)
+        self.assertEqual([(s['stage'], s['status']) for s in run.stages],
+                         [('upper', metrics.OK), ('count', metrics.OK), ('first', metrics.OK),
+                          ('upper', metrics.SKIPPED), ('count', metrics.SKIPPED), ('first', metrics.SKIPPED)])
+
+    def test_lock(self):
+        lock = self.path('pipeline.lock')
+        with stages.run_lock(lock):
+            with self.assertRaises(stages.PipelineLocked):
+                with stages.run_lock(lock):
+                    pass
+        with stages.run_lock(lock):
+            pass
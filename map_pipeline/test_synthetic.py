@@ -0,0 +1,64 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import benchmark
+import jhu
+import synthetic
+from validation import validate_cases
+
+
+class TestSynthetic(unittest.TestCase):
+
+    def test_line_list(self):
+        data = synthetic.line_list(20000, dirty=0.02, seed=1)
+        self.assertEqual(len(data), 20000)
+        self.assertTrue(data.equals(synthetic.line_list(20000, dirty=0.02, seed=1)))
+        self.assertFalse(data.equals(synthetic.line_list(20000, dirty=0.02, seed=2)))
+        self.assertTrue(data['ID'].is_unique)
+        self.assertTrue(all(isinstance(v, str) for v in data.iloc[0]))
+
+        # About 2% of the rows don't validate (half of them for their coordinates, half for their date).
+        valid, rejected = validate_cases(data)
+        self.assertAlmostEqual(1 - valid.mean(), 0.02, delta=0.004)
+        self.assertEqual(set(rejected), {'latitude/longitude', 'date format'})
+        clean = synthetic.line_list(1000)
+        self.assertTrue(pd.to_numeric(clean.latitude).notnull().all())
+        self.assertTrue(clean.date_confirmation.str.match(r'\d{2}\.\d{2}\.\d{4}$').all())
+
+    def test_jhu_series(self):
+        us_data = synthetic.jhu_series(50000, n_locations=500, n_days=30, unlocated=0)
+        self.assertEqual(len(us_data), 500)
+        _, date_columns = jhu.rename_date_columns(us_data)
+        self.assertEqual(len(date_columns), 30)
+        cumulative = us_data[us_data.columns[-30:]].values.astype(int)
+        self.assertTrue((np.diff(cumulative, axis=1) >= 0).all())
+        self.assertEqual(jhu.jhu_to_weighted(us_data)['cases'].sum(), 50000)
+
+        # Cases of counties without coordinates aren't mapped.
+        us_data = synthetic.jhu_series(50000, n_locations=500, n_days=30, unlocated=0.1)
+        self.assertLess(jhu.jhu_to_weighted(us_data)['cases'].sum(), 50000)
+
+    def test_parse_scale(self):
+        self.assertEqual(synthetic.parse_scale('10k'), 10000)
+        self.assertEqual(synthetic.parse_scale('10M'), 10000000)
+        self.assertEqual(synthetic.parse_scale('2500'), 2500)
+
+
+class TestBenchmarkCompare(unittest.TestCase):
+
+    def results(self, **seconds) -> dict:
+        return {'cases': 10000, 'seed': 0, 'steps': {name: {'seconds': s} for name, s in seconds.items()}}
+
+    def test_compare(self):
+        baseline = self.results(clean_data=1.0, reduceToUnique=0.5, tiny=0.001)
+        results = self.results(clean_data=1.2, reduceToUnique=0.8, tiny=0.005, new_step=3.0)
+        self.assertEqual(benchmark.compare(results, baseline, threshold=0.25), [('reduceToUnique', 0.5, 0.8)])
+        self.assertEqual(len(benchmark.compare(results, baseline, threshold=0.1)), 2)
+
+    def test_other_data(self):
+        baseline = self.results(clean_data=1.0)
+        baseline['cases'] = 1000000
+        with self.assertRaises(ValueError):
+            benchmark.compare(self.results(clean_data=1.0), baseline)
@@ -0,0 +1,78 @@
+import unittest
+import pathlib
+import tempfile
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import aggregation
+import tiles
+
+
+class TestTiles(unittest.TestCase):
+
+    def setUp(self):
+        cur_dir = pathlib.Path(__file__).parent.absolute()
+        with open(os.path.join(cur_dir, '..', 'map_data', 'full-data.sample.json')) as F:
+            self.sample = pd.DataFrame(json.load(F)['data'])
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.outdir = os.path.join(self.tmpdir.name, 'tiles')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read(self, layer, tile):
+        with open(os.path.join(self.outdir, layer, tile + '.geojson')) as F:
+            return json.load(F)['features']
+
+    def test_tile_xy(self):
+        # Known tiles : Boston at zoom 10 is 309/378, Sydney at zoom 5 is 29/19.
+        x, y = tiles.tile_xy(np.array([42.36, -33.87]), np.array([-71.06, 151.21]), 10)
+        self.assertEqual((x[0], y[0]), (309, 378))
+        x, y = tiles.tile_xy(np.array([-33.87]), np.array([151.21]), 5)
+        self.assertEqual((x[0], y[0]), (29, 19))
+        x, y = tiles.tile_xy(np.array([90.0, -90.0]), np.array([180.0, -180.0]), 3)
+        self.assertEqual(x.tolist(), [7, 0])
+        self.assertEqual(y.tolist(), [0, 7])
+
+    def test_totals(self):
+        totals = aggregation.reduce_to_unique(self.sample)
+        index = tiles.write_tiles(self.outdir, totals=totals, min_zoom=0, max_zoom=3)
+        with open(os.path.join(self.outdir, 'index.json')) as F:
+            self.assertEqual(json.load(F), index)
+
+        layer = index['layers']['totals']
+        self.assertEqual(layer['0/0/0'], len(totals))
+        for z in range(4):
+            counts = [n for tile, n in layer.items() if tile.startswith('{}/'.format(z))]
+            self.assertEqual(sum(counts), len(totals))
+
+        # Same features as the full output, in the same order.
+        features = list(aggregation.totals_features(totals))
+        self.assertEqual(self.read('totals', '0/0/0'), features)
+        tile = max(layer, key=lambda t: (t.startswith('3/'), layer[t]))
+        z, x, y = map(int, tile.split('/'))
+        tx, ty = tiles.tile_xy(totals.latitude.astype(float).values, totals.longitude.astype(float).values, z)
+        want = [f for f, i, j in zip(features, tx, ty) if (i, j) == (x, y)]
+        self.assertEqual(self.read('totals', tile), want)
+
+    def test_animation(self):
+        locations, cells = aggregation.animation_cells(self.sample)
+        index = tiles.write_tiles(self.outdir, animation=(locations, cells), min_zoom=2, max_zoom=2)
+        layer = index['layers']['animation']
+        self.assertEqual(sum(layer.values()), len(cells))
+        self.assertNotIn('totals', index['layers'])
+        tile = max(layer, key=layer.get)
+        features = self.read('animation', tile)
+        self.assertEqual(len(features), layer[tile])
+        dates = [f['properties']['date'] for f in features]
+        self.assertEqual(dates, sorted(dates))
+
+    def test_replaces_previous_tiles(self):
+        totals = aggregation.reduce_to_unique(self.sample)
+        tiles.write_tiles(self.outdir, totals=totals, min_zoom=0, max_zoom=4)
+        tiles.write_tiles(self.outdir, totals=totals.iloc[:1], min_zoom=0, max_zoom=0)
+        self.assertEqual(os.listdir(self.outdir + '/totals'), ['0'])
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)), ['tiles'])
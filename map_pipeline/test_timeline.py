@@ -0,0 +1,104 @@
+import unittest
+import pathlib
+import tempfile
+import json
+import os
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+import aggregation
+import timeline
+import writers
+
+
+class TestTimeline(unittest.TestCase):
+
+    def setUp(self):
+        cur_dir = pathlib.Path(__file__).parent.absolute()
+        with open(os.path.join(cur_dir, '..', 'map_data', 'full-data.sample.json')) as F:
+            self.sample = pd.DataFrame(json.load(F)['data'])
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def assert_round_trip(self, locations, cells, decoded):
+        decoded_locations, decoded_cells = decoded
+        assert_frame_equal(decoded_locations, locations, check_index_type=False)
+        assert_frame_equal(decoded_cells, cells.reset_index(drop=True), check_dtype=False)
+
+    def test_round_trip(self):
+        for groupby in ['week', 'day']:
+            locations, cells = aggregation.animation_cells(self.sample, groupby)
+            self.assert_round_trip(locations, cells, timeline.decode_timeline(timeline.encode_timeline(locations, cells)))
+
+    def test_files(self):
+        locations, cells = aggregation.animation_cells(self.sample)
+        path = os.path.join(self.tmpdir.name, 'dailies.bin')
+        sizes = timeline.write_timeline(locations, cells, path)
+        self.assertIn(path + '.gz', sizes)
+        self.assertEqual(sizes[path], os.path.getsize(path))
+        for p in sizes:
+            self.assert_round_trip(locations, cells, timeline.read_timeline(p))
+
+        # Much smaller than the GeoJSON of the same cells.
+        geojson = os.path.join(self.tmpdir.name, 'dailies.geojson')
+        writers.write_feature_collection(writers.encode_animation_features(locations, cells), geojson)
+        self.assertLess(sizes[path] * 5, os.path.getsize(geojson))
+
+    def test_permissions(self):
+        locations, cells = aggregation.animation_cells(self.sample)
+        sizes = timeline.write_timeline(locations, cells, os.path.join(self.tmpdir.name, 'dailies.bin'))
+        sizes.update(timeline.write_timeline_json(locations, cells, os.path.join(self.tmpdir.name, 'dailies.json')))
+        self.assertIn(os.path.join(self.tmpdir.name, 'dailies.json.gz'), sizes)
+        for p in sizes:
+            self.assertEqual(os.stat(p).st_mode & 0o777, 0o644, p)
+
+    def test_empty(self):
+        locations, cells = aggregation.animation_cells(self.sample.iloc[:0])
+        decoded_locations, decoded_cells = timeline.decode_timeline(timeline.encode_timeline(locations, cells))
+        self.assertEqual(len(decoded_locations), 0)
+        self.assertEqual(len(decoded_cells), 0)
+        self.assertEqual(list(decoded_cells.columns), ['date', 'location', 'new', 'total'])
+
+    def test_bad_magic(self):
+        with self.assertRaises(ValueError):
+            timeline.decode_timeline(b'GEOJ' + bytes(12))
+
+
+class TestTimelineJSON(unittest.TestCase):
+
+    def setUp(self):
+        cur_dir = pathlib.Path(__file__).parent.absolute()
+        with open(os.path.join(cur_dir, '..', 'map_data', 'full-data.sample.json')) as F:
+            self.sample = pd.DataFrame(json.load(F)['data'])
+        self.locations, self.cells = aggregation.animation_cells(self.sample)
+
+    def test_same_features(self):
+        normalized = timeline.timeline_json(self.locations, self.cells, precision=None)
+        self.assertEqual(list(timeline.timeline_features(normalized)),
+                         list(aggregation.animation_features(self.locations, self.cells)))
+
+    def test_precision(self):
+        normalized = timeline.timeline_json(self.locations, self.cells, precision=2)
+        features = list(aggregation.animation_features(self.locations, self.cells))
+        converted = list(timeline.timeline_features(normalized))
+        for feature in features:
+            feature['geometry']['coordinates'] = [round(x, 2) for x in feature['geometry']['coordinates']]
+        self.assertEqual(converted, features)
+
+    def test_layout(self):
+        normalized = timeline.timeline_json(self.locations, self.cells)
+        self.assertEqual(len(normalized['locations']), len(self.locations))
+        self.assertEqual([d['date'] for d in normalized['dates']],
+                         sorted(self.cells.date.dt.strftime('%Y-%m-%d').unique()))
+        self.assertEqual(sum(len(d['locations']) for d in normalized['dates']), len(self.cells))
+
+    def test_files(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'dailies.json')
+            sizes = timeline.write_timeline_json(self.locations, self.cells, path)
+            expected = timeline.timeline_json(self.locations, self.cells)
+            for p in sizes:
+                self.assertEqual(timeline.read_timeline_json(p), expected)
@@ -0,0 +1,125 @@
+import unittest
+import pathlib
+import json
+import os
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+import validation
+
+
+def legacy_sheet_rows(columns: list, rows: list) -> pd.DataFrame:
+    '''Row by row validation as previously done in functions.load_sheet.'''
+    n    = len(columns)
+    ilat = columns.index('latitude')
+    ilon = columns.index('longitude')
+    idate = columns.index('date_confirmation')
+    keep = []
+    for row in rows:
+        d = row.copy()
+        try:
+            if len(d) < n:
+                d.extend([''] * (n - len(d)))
+            assert len(d) == n
+            float(d[ilat])
+            float(d[ilon])
+            date = d[idate]
+            if date == '':
+                continue
+            elif '-' in d[idate]:
+                date = d[idate].split('-')[-1]
+            pd.to_datetime(date, format='%d.%m.%Y', exact=True)
+            keep.append(d)
+        except Exception:
+            continue
+    return pd.DataFrame(data=keep, columns=columns)
+
+
+def legacy_case_filter(df: pd.DataFrame) -> pd.DataFrame:
+    '''Lat/long and date filters as previously done in functions.clean_data.'''
+    lat, lon    = df.latitude, df.longitude
+    invalid_lat = lat.str.contains('#REF') | lat.str.contains('N/A') | lat.isnull() | (lat == '')
+    invalid_lon = lon.str.contains('#REF') | lon.str.contains('N/A') | lon.isnull() | (lon == '')
+    df = df[~(invalid_lat | invalid_lon)].copy()
+    df['date_confirmation'] = df['date_confirmation'].str.strip()
+    dc = df.date_confirmation.fillna('')
+    dc = dc.apply(lambda x: x.split('-')[1].strip() if '-' in x else x.strip())
+    valid_date = (dc != '') & ~(dc.isnull()) & dc.str.match(r'.*\d{2}\.\d{2}\.\d{4}.*')
+    return df[valid_date]
+
+
+COLUMNS = ['ID', 'latitude', 'longitude', 'city', 'date_confirmation', 'source']
+
+ROWS = [
+    ['1', '1.5', '2.5', 'A', '05.03.2020', 's'],
+    ['2', '1.5', '2.5', 'A', '05.03.2020'], # trailing empty cell
+    ['3', '1.5', '2.5'], # no date
+    ['4', '1.5', '2.5', 'A', '05.03.2020', 's', 'extra'],
+    ['5', '#REF!', '2.5', 'A', '05.03.2020', 's'],
+    ['6', '', '2.5', 'A', '05.03.2020', 's'],
+    ['7', 'nan', ' 2.5 ', 'A', '05.03.2020', 's'], # float() accepts both
+    ['8', '1_000', '1e3', 'A', '05.03.2020', 's'],
+    ['9', '1.5', '2.5', 'A', '05.03.2020-06.03.2020', 's'],
+    ['10', '1.5', '2.5', 'A', '05.03.2020 - 06.03.2020', 's'], # leading space in the last date
+    ['11', '1.5', '2.5', 'A', '2020-03-05', 's'],
+    ['12', '1.5', '2.5', 'A', '31.02.2020', 's'],
+    ['13', '1.5', '2.5', 'A', '5.3.2020', 's'],
+    ['14', '1.5', '2.5', 'A', 'March', 's'],
+    [],
+]
+
+
+class TestSheetRows(unittest.TestCase):
+
+    def test_same_as_legacy(self):
+        data, rejected = validation.validate_sheet_rows(COLUMNS, ROWS)
+        assert_frame_equal(data, legacy_sheet_rows(COLUMNS, ROWS))
+        self.assertEqual(sum(rejected.values()) + len(data), len(ROWS))
+
+    def test_rejections(self):
+        data, rejected = validation.validate_sheet_rows(COLUMNS, ROWS)
+        self.assertEqual(data.ID.tolist(), ['1', '2', '7', '8', '9', '13'])
+        self.assertEqual(data.source.tolist()[1], '')
+        self.assertEqual(rejected, {validation.LENGTH: 1, validation.COORDINATES: 3,
+                                    validation.NO_DATE: 1, validation.DATE: 4})
+
+    def test_sample(self):
+        cur_dir = pathlib.Path(__file__).parent.absolute()
+        with open(os.path.join(cur_dir, '..', 'map_data', 'full-data.sample.json')) as F:
+            sample = pd.DataFrame(json.load(F)['data'])
+        columns = list(sample.columns)
+        rows = [[str(x) for x in row if x is not None] for row in sample.values.tolist()]
+        data, _ = validation.validate_sheet_rows(columns, rows)
+        assert_frame_equal(data, legacy_sheet_rows(columns, rows))
+
+    def test_no_rows(self):
+        data, rejected = validation.validate_sheet_rows(COLUMNS, [])
+        self.assertEqual(list(data.columns), COLUMNS)
+        self.assertEqual(len(data), 0)
+        self.assertEqual(rejected, {})
+
+
+class TestCases(unittest.TestCase):
+
+    def test_same_as_legacy(self):
+        df = pd.DataFrame({
+            'latitude': ['1', '#REF!', None, '', 'N/A', '1', '1', '1', '1', '1', '1'],
+            'longitude': ['2', '2', '2', '2', '2', '#REF', '2', '2', '2', '2', '2'],
+            'date_confirmation': ['05.03.2020', '05.03.2020', '05.03.2020', '05.03.2020', '05.03.2020', '05.03.2020',
+                                  ' 05.03.2020 - 06.03.2020 ', '05.03.2020-', None, 'x 05.03.2020', '5.3.2020'],
+        })
+        valid, rejected = validation.validate_cases(df)
+        assert_frame_equal(df[valid].assign(date_confirmation=lambda d: d.date_confirmation.str.strip()),
+                           legacy_case_filter(df))
+        self.assertEqual(rejected, {validation.COORDINATES: 5, validation.DATE: 3})
+
+    def test_no_ranges(self):
+        df = pd.DataFrame({'latitude': ['1', '1'], 'longitude': ['2', '2'], 'date_confirmation': ['05.03.2020', 'NA']})
+        valid, rejected = validation.validate_cases(df)
+        self.assertEqual(valid.tolist(), [True, False])
+        self.assertEqual(rejected, {validation.DATE: 1})
+
+    def test_format_rejections(self):
+        rejected = validation.Counter({validation.DATE: 1, validation.COORDINATES: 3})
+        self.assertEqual(validation.format_rejections(rejected), 'date format : 1, latitude/longitude : 3')
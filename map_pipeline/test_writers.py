@@ -0,0 +1,46 @@
+import unittest
+import pathlib
+import tempfile
+import json
+import os
+
+import pandas as pd
+
+import aggregation
+import writers
+
+
+class TestWriters(unittest.TestCase):
+
+    def setUp(self):
+        cur_dir = pathlib.Path(__file__).parent.absolute()
+        with open(os.path.join(cur_dir, '..', 'map_data', 'full-data.sample.json')) as F:
+            self.sample = pd.DataFrame(json.load(F)['data'])
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def assert_same_as_json_dump(self, features):
+        streamed = os.path.join(self.tmpdir.name, 'streamed.geojson')
+        dumped = os.path.join(self.tmpdir.name, 'dumped.geojson')
+        n = writers.write_feature_collection(iter(features), streamed, buffering=64)
+        with open(dumped, 'w') as F:
+            json.dump({'type': 'FeatureCollection', 'features': list(features)}, F)
+        with open(streamed, 'rb') as F, open(dumped, 'rb') as G:
+            self.assertEqual(F.read(), G.read())
+        self.assertEqual(n, len(features))
+
+    def test_empty(self):
+        self.assert_same_as_json_dump([])
+
+    def test_animation(self):
+        locations, cells = aggregation.animation_cells(self.sample)
+        features = list(aggregation.animation_features(locations, cells))
+        self.assert_same_as_json_dump(features)
+
+    def test_encoded_animation(self):
+        locations, cells = aggregation.animation_cells(self.sample, 'day')
+        encoded = list(writers.encode_animation_features(locations, cells))
+        features = aggregation.animation_features(locations, cells)
+        self.assertEqual(encoded, [json.dumps(f) for f in features])
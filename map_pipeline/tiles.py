@@ -0,0 +1,142 @@
+'''
+Pre-tiled map outputs : the totals and animation features split into
+slippy map tiles (Web Mercator z/x/y, as used by Leaflet/Mapbox), for a
+range of zoom levels.
+
+    <outdir>/index.json
+    <outdir>/totals/<z>/<x>/<y>.geojson
+    <outdir>/animation/<z>/<x>/<y>.geojson
+
+Each tile is a FeatureCollection with only the features located in it, in
+the same order as in the full outputs. index.json lists the tiles of each
+layer with their number of features, so the front end only requests tiles
+that exist and are visible.
+'''
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from aggregation import totals_features
+from writers import encode_animation_features, write_feature_collection
+
+
+MIN_ZOOM = 0
+MAX_ZOOM = 8
+MAX_LATITUDE = 85.0511287798 # Web Mercator bounds
+TILE_PATH = '{z}/{x}/{y}.geojson'
+
+
+def mercator(latitude: np.ndarray, longitude: np.ndarray):
+    '''Web Mercator coordinates of each point, in [0, 1) from the top left corner.'''
+    lat = np.radians(np.clip(latitude, -MAX_LATITUDE, MAX_LATITUDE))
+    x = (np.asarray(longitude) + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0
+    below_one = np.nextafter(1, 0)
+    return np.clip(x, 0, below_one), np.clip(y, 0, below_one)
+
+
+def tile_xy(latitude: np.ndarray, longitude: np.ndarray, zoom: int):
+    '''
+    Tile of each point at a zoom level.
+
+    Returns :
+        x, y (np.ndarray) : tile column (from longitude -180) and row (from
+        latitude 85.05), in [0, 2**zoom).
+    '''
+    x, y = mercator(latitude, longitude)
+    n = 2 ** zoom
+    return np.floor(x * n).astype(np.int64), np.floor(y * n).astype(np.int64)
+
+
+def replace_directory(tmp: str, outdir: str) -> None:
+    '''
+    Move the directory tmp to outdir, the previous outdir is only removed
+    once the new one is in place.
+    '''
+    parent = os.path.dirname(os.path.abspath(outdir))
+    old = None
+    if os.path.exists(outdir):
+        old = tempfile.mkdtemp(dir=parent, prefix='.old-')
+        os.replace(outdir, os.path.join(old, os.path.basename(outdir)))
+    os.replace(tmp, outdir)
+    if old is not None:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def write_layer(features: list, latitude: np.ndarray, longitude: np.ndarray, outdir: str, zooms) -> dict:
+    '''
+    Write the tiles of one layer.
+
+    Args :
+        features (list) : JSON encoded features.
+        latitude, longitude (np.ndarray) : location of each feature.
+        outdir (str) : layer directory.
+        zooms (iterable) : zoom levels.
+
+    Returns :
+        tiles (dict) : number of features by tile ("z/x/y").
+    '''
+    features = np.asarray(features, dtype=object)
+    tiles = {}
+    for z in zooms:
+        x, y = tile_xy(latitude, longitude, z)
+        key = x * 2 ** z + y
+        # Stable sort : features keep their order within each tile.
+        order = np.argsort(key, kind='mergesort')
+        keys, starts, counts = np.unique(key[order], return_index=True, return_counts=True)
+        for k, start, count in zip(keys.tolist(), starts.tolist(), counts.tolist()):
+            tx, ty = divmod(k, 2 ** z)
+            path = os.path.join(outdir, TILE_PATH.format(z=z, x=tx, y=ty))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_feature_collection(features[order[start:start + count]], path)
+            tiles['{}/{}/{}'.format(z, tx, ty)] = count
+    return tiles
+
+
+def write_tiles(outdir: str, totals: pd.DataFrame = None, animation: tuple = None,
+                min_zoom: int = MIN_ZOOM, max_zoom: int = MAX_ZOOM) -> dict:
+    '''
+    Write the tiled outputs and their index, replacing outdir atomically
+    (the tiles are written to a temporary directory first).
+
+    Args :
+        outdir (str) : output directory.
+        totals (pd.DataFrame) : one row per location, see aggregation.reduce_to_unique.
+        animation (tuple) : locations and cells, see aggregation.animation_cells.
+        min_zoom, max_zoom (int) : zoom levels to tile (included).
+
+    Returns :
+        index (dict) : content of index.json.
+    '''
+    zooms = range(min_zoom, max_zoom + 1)
+    index = {'minzoom': min_zoom, 'maxzoom': max_zoom, 'path': TILE_PATH, 'layers': {}}
+
+    parent = os.path.dirname(os.path.abspath(outdir))
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, prefix='.tiles-')
+    os.chmod(tmp, 0o755) # served as is
+    try:
+        if totals is not None:
+            features = [json.dumps(f) for f in totals_features(totals)]
+            index['layers']['totals'] = write_layer(
+                    features, totals.latitude.astype(float).values, totals.longitude.astype(float).values,
+                    os.path.join(tmp, 'totals'), zooms)
+        if animation is not None:
+            locations, cells = animation
+            features = list(encode_animation_features(locations, cells))
+            location = cells.location.values
+            index['layers']['animation'] = write_layer(
+                    features, locations.latitude.astype(float).loc[location].values,
+                    locations.longitude.astype(float).loc[location].values,
+                    os.path.join(tmp, 'animation'), zooms)
+        with open(os.path.join(tmp, 'index.json'), 'w') as F:
+            json.dump(index, F)
+
+        replace_directory(tmp, outdir)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return index
@@ -0,0 +1,257 @@
+'''
+Compact encodings of the animation timeline, binary and JSON.
+
+The animation GeoJSON repeats the geometry, the location names and the date
+in every feature. This format stores each of them once :
+
+    header   : magic b'GDHT', version, metadata length, number of cells
+               (4 uint32, little-endian)
+    metadata : JSON (utf-8, space padded to a multiple of 4 bytes) with the
+               date table (yyyy-mm-dd) and the location table (id, latitude,
+               longitude, city, province, country, geo_resolution columns)
+    cells    : 4 int32 little-endian arrays of n cells, in the order of
+               aggregation.animation_cells (date then location) :
+               - location id, delta from the previous cell
+               - date number in the date table, delta from the previous cell
+               - new cases
+               - total cases, delta from the previous cell of the same location
+
+The deltas are mostly 0 and 1, so the cells compress well : a gzip (and
+brotli, when installed) copy can be written next to the file, for servers
+that send precompressed files (e.g. nginx gzip_static).
+
+For clients that stay on JSON, timeline_json is the same normalized layout :
+
+    {"locations": [{"coordinates": [lon, lat], "city": ..., "province": ...,
+                    "country": ..., "geo_resolution": ...}, ...],
+     "dates": [{"date": "yyyy-mm-dd", "locations": [i, ...], "new": [...],
+                "total": [...]}, ...]}
+
+with the coordinates rounded to COORDINATE_PRECISION decimals, and the
+location indexes pointing in the locations array. timeline_features turns
+it back into the animation GeoJSON features.
+'''
+import gzip
+import json
+import struct
+
+import numpy as np
+import pandas as pd
+
+from pipeline_common.files import atomic_write
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+MAGIC = b'GDHT'
+VERSION = 1
+HEADER = struct.Struct('<4sIII')
+CELL_DTYPE = np.dtype('<i4')
+CELL_ARRAYS = ['location', 'date', 'new', 'total']
+LOCATION_COLUMNS = ['latitude', 'longitude', 'city', 'province', 'country', 'geo_resolution']
+DATE_FORMAT = '%Y-%m-%d'
+COORDINATE_PRECISION = 4 # decimals, about 10m
+PERMISSIONS = 0o644 # served as is
+
+# Precompressed copies : extension, compress function.
+COMPRESSIONS = {
+    'gzip': ('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)),
+    'br': ('.br', lambda data: brotli.compress(data)),
+}
+
+
+def _delta(values: np.ndarray) -> np.ndarray:
+    return np.diff(values, prepend=0)
+
+
+def _as_int32(values: np.ndarray) -> np.ndarray:
+    info = np.iinfo(CELL_DTYPE)
+    if len(values) and (values.min() < info.min or values.max() > info.max):
+        raise ValueError('timeline values out of the int32 range')
+    return values.astype(CELL_DTYPE)
+
+
+def encode_timeline(locations: pd.DataFrame, cells: pd.DataFrame) -> bytes:
+    '''
+    Binary timeline of the animation cells.
+
+    Args :
+        locations, cells (pd.DataFrame) : see aggregation.animation_cells.
+    '''
+    dates, date = np.unique(cells.date.values, return_inverse=True)
+    location = cells.location.values.astype(np.int64)
+    total = cells.total.values.astype(np.int64)
+
+    # Previous total of the same location, cells of a location are in date order.
+    order = np.argsort(location, kind='mergesort')
+    previous = np.zeros(len(total), dtype=np.int64)
+    same = location[order][1:] == location[order][:-1]
+    previous[order[1:][same]] = total[order[:-1][same]]
+
+    meta = {
+        'dates': pd.DatetimeIndex(dates).strftime(DATE_FORMAT).tolist(),
+        'locations': dict({'id': locations.index.tolist()},
+                          **{c: locations[c].tolist() for c in LOCATION_COLUMNS}),
+    }
+    meta = json.dumps(meta, separators=(',', ':')).encode('utf-8')
+    meta += b' ' * (-len(meta) % 4)
+
+    arrays = [_delta(location), _delta(date), cells.new.values.astype(np.int64), total - previous]
+    return b''.join([HEADER.pack(MAGIC, VERSION, len(meta), len(cells)), meta]
+                    + [_as_int32(a).tobytes() for a in arrays])
+
+
+def decode_timeline(data: bytes):
+    '''
+    Locations and cells of a binary timeline, as returned by
+    aggregation.animation_cells.
+    '''
+    magic, version, meta_length, n = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('not a version {} timeline'.format(VERSION))
+    offset = HEADER.size
+    meta = json.loads(data[offset:offset + meta_length].decode('utf-8'))
+    offset += meta_length
+    arrays = np.frombuffer(data, dtype=CELL_DTYPE, count=4 * n, offset=offset).reshape(4, n).astype(np.int64)
+    location_delta, date_delta, new, total_delta = arrays
+
+    location = np.cumsum(location_delta)
+    total = pd.Series(total_delta).groupby(location).cumsum().values
+    table = meta['locations']
+    locations = pd.DataFrame({c: table[c] for c in LOCATION_COLUMNS},
+                             index=pd.Index(table['id'], dtype=np.int64), columns=LOCATION_COLUMNS)
+    dates = pd.to_datetime(meta['dates'], format=DATE_FORMAT).values
+    cells = pd.DataFrame({
+        'date': dates[np.cumsum(date_delta)] if n else dates[:0],
+        'location': location,
+        'new': new,
+        'total': total,
+    })
+    return locations, cells
+
+
+def write_with_copies(data: bytes, path: str, compress=('gzip', 'br')) -> dict:
+    '''
+    Write data to path, and its precompressed copies (path.gz, path.br) for
+    the given compressions. Brotli is skipped when the brotli module isn't
+    installed.
+
+    Returns :
+        sizes (dict) : bytes written by file.
+    '''
+    atomic_write(path, [data], permissions=PERMISSIONS)
+    sizes = {path: len(data)}
+    for name in compress:
+        if name == 'br' and brotli is None:
+            continue
+        extension, func = COMPRESSIONS[name]
+        compressed = func(data)
+        atomic_write(path + extension, [compressed], permissions=PERMISSIONS)
+        sizes[path + extension] = len(compressed)
+    return sizes
+
+
+def write_timeline(locations: pd.DataFrame, cells: pd.DataFrame, path: str, compress=('gzip', 'br')) -> dict:
+    '''
+    Write the binary timeline to path, and its precompressed copies (see
+    write_with_copies).
+    '''
+    return write_with_copies(encode_timeline(locations, cells), path, compress)
+
+
+def _decompress(data: bytes, path: str) -> bytes:
+    if path.endswith('.gz'):
+        return gzip.decompress(data)
+    if path.endswith('.br'):
+        return brotli.decompress(data)
+    return data
+
+
+def read_timeline(path: str):
+    '''
+    Locations and cells of a timeline file, .gz and .br copies are
+    decompressed.
+    '''
+    with open(path, 'rb') as F:
+        return decode_timeline(_decompress(F.read(), path))
+
+
+def timeline_json(locations: pd.DataFrame, cells: pd.DataFrame, precision: int = COORDINATE_PRECISION) -> dict:
+    '''
+    Normalized JSON timeline of the animation cells (see above).
+
+    Args :
+        locations, cells (pd.DataFrame) : see aggregation.animation_cells.
+        precision (int) : decimals kept in the coordinates, None to keep
+                          them as they are.
+    '''
+    lat = locations.latitude.astype(float).values
+    lon = locations.longitude.astype(float).values
+    if precision is not None:
+        lat, lon = np.round(lat, precision), np.round(lon, precision)
+    lat, lon = lat.tolist(), lon.tolist()
+    table = [{
+                'coordinates': [x, y],
+                'city': row.city,
+                'province': row.province,
+                'country': row.country,
+                'geo_resolution': row.geo_resolution
+             } for x, y, row in zip(lon, lat, locations.itertuples())]
+
+    # Cells are sorted by date, each date is a slice of the arrays.
+    dates, starts = np.unique(cells.date.values, return_index=True)
+    position = locations.index.get_indexer(cells.location.values)
+    columns = [np.split(values, starts[1:]) for values in
+               [position, cells.new.values.astype(np.int64), cells.total.values.astype(np.int64)]]
+    datestr = pd.DatetimeIndex(dates).strftime(DATE_FORMAT).tolist()
+    return {
+        'locations': table,
+        'dates': [{'date': d, 'locations': i.tolist(), 'new': new.tolist(), 'total': total.tolist()}
+                  for d, i, new, total in zip(datestr, *columns)],
+    }
+
+
+def timeline_features(timeline: dict):
+    '''
+    Animation GeoJSON features of a JSON timeline, in the order of
+    aggregation.animation_features.
+    '''
+    locations = timeline['locations']
+    for day in timeline['dates']:
+        for i, N_new, total in zip(day['locations'], day['new'], day['total']):
+            location = locations[i]
+            yield {
+                    "type": "Feature",
+                    "geometry": {
+                        "type": "Point",
+                        "coordinates": location['coordinates']
+                    },
+                    "properties": {
+                        "date": day['date'],
+                        "new": N_new,
+                        "total": total,
+                        "city": location['city'],
+                        "province": location['province'],
+                        "country": location['country'],
+                        "geo_resolution" : location['geo_resolution']
+                    }
+            }
+
+
+def write_timeline_json(locations: pd.DataFrame, cells: pd.DataFrame, path: str,
+                        precision: int = COORDINATE_PRECISION, compress=('gzip', 'br')) -> dict:
+    '''
+    Write the JSON timeline to path, and its precompressed copies (see
+    write_with_copies).
+    '''
+    data = json.dumps(timeline_json(locations, cells, precision), separators=(',', ':')).encode('utf-8')
+    return write_with_copies(data, path, compress)
+
+
+def read_timeline_json(path: str) -> dict:
+    '''JSON timeline of a file, .gz and .br copies are decompressed.'''
+    with open(path, 'rb') as F:
+        return json.loads(_decompress(F.read(), path).decode('utf-8'))
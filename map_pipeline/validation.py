@@ -0,0 +1,132 @@
+'''
+Validation of the sheet rows (load_sheet) and of the case table (clean_data),
+done on whole columns.
+
+Each function keeps exactly the rows the previous row by row checks kept,
+and counts the rejected rows by reason so that they can be logged.
+'''
+from collections import Counter
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+from dates import DATE_FORMAT, parse_dates
+
+
+# Rejection reasons
+LENGTH = 'row length'
+COORDINATES = 'latitude/longitude'
+NO_DATE = 'no date'
+DATE = 'date format'
+
+
+def parses_as_float(values: pd.Series) -> np.ndarray:
+    '''
+    Whether float(x) succeeds for each value. pd.to_numeric handles the bulk,
+    the few distinct values it rejects are tried with float() (e.g. "nan",
+    "1_000" are accepted by float).
+    '''
+    numeric = pd.to_numeric(values, errors='coerce').notnull().values
+    accepted = set()
+    for value in pd.unique(values[~numeric]):
+        try:
+            float(value)
+            accepted.add(value)
+        except (TypeError, ValueError):
+            pass
+    if not accepted:
+        return numeric
+    return numeric | values.isin(accepted).values
+
+
+def parses_as_date(values: pd.Series, date_format: str = DATE_FORMAT) -> np.ndarray:
+    '''
+    Whether each value parses exactly with date_format (see dates.parse_dates).
+    '''
+    return parse_dates(values, date_format).notnull().values
+
+
+def pad_rows(rows: list, n: int) -> Tuple[pd.DataFrame, np.ndarray]:
+    '''
+    Rows of sheet values as a frame of n columns, short rows (trailing empty
+    cells aren't returned by the API) are padded with empty strings.
+
+    Returns :
+        frame (pd.DataFrame) : padded rows, columns 0 to n-1.
+        too_long (np.ndarray) : rows with more than n values.
+    '''
+    lengths = np.fromiter((len(row) for row in rows), dtype=np.int64, count=len(rows))
+    frame = pd.DataFrame(rows, dtype=object).reindex(columns=range(n)).fillna('').astype(object)
+    return frame, lengths > n
+
+
+def validate_sheet_rows(columns: list, rows: list) -> Tuple[pd.DataFrame, Counter]:
+    '''
+    Keep the sheet rows with the expected length, float coordinates and an
+    exact dd.mm.yyyy date_confirmation (last date of a range "a-b"). Rows
+    without a date are left out.
+
+    Args :
+        columns (list) : header row.
+        rows (list) : rows of values (lists of strings).
+
+    Returns :
+        data (pd.DataFrame) : rows kept, with columns as header.
+        rejected (Counter) : number of rows left out by reason.
+    '''
+    n = len(columns)
+    frame, too_long = pad_rows(rows, n)
+    lat = frame[columns.index('latitude')]
+    lon = frame[columns.index('longitude')]
+    date = frame[columns.index('date_confirmation')]
+
+    # Same order as the checks they replace, a row is rejected for the first one it fails.
+    length_ok = ~too_long
+    coordinates_ok = length_ok & parses_as_float(lat) & parses_as_float(lon)
+    has_date = coordinates_ok & (date != '').values
+    last_date = date.str.split('-').str[-1]
+    date_ok = has_date & parses_as_date(last_date)
+
+    rejected = Counter({
+        LENGTH: int((~length_ok).sum()),
+        COORDINATES: int((length_ok & ~coordinates_ok).sum()),
+        NO_DATE: int((coordinates_ok & ~has_date).sum()),
+        DATE: int((has_date & ~date_ok).sum()),
+    })
+    data = frame[date_ok]
+    data.columns = columns
+    return data.reset_index(drop=True), +rejected
+
+
+def validate_cases(df: pd.DataFrame) -> Tuple[np.ndarray, Counter]:
+    '''
+    Rows of the case table with coordinates (not empty, #REF or N/A) and a
+    dd.mm.yyyy date in date_confirmation (second date of a range "a-b").
+
+    Returns :
+        valid (np.ndarray) : boolean mask of the rows to keep.
+        rejected (Counter) : number of rows left out by reason.
+    '''
+    invalid = np.zeros(len(df), dtype=bool)
+    for column in [df.latitude, df.longitude]:
+        invalid |= (column.isnull() | (column == '') | (column.str.contains('#REF|N/A') == True)).values
+    coordinates_ok = ~invalid
+
+    dc = df.date_confirmation.str.strip().fillna('')
+    ranges = dc.str.contains('-').values
+    if ranges.any(): # without any range, the second parts are all NaN (float)
+        dc = dc.where(~ranges, dc.str.split('-').str[1].str.strip())
+    date_ok = (dc != '').values & (dc.str.match(r'.*\d{2}\.\d{2}\.\d{4}.*') == True).values
+
+    valid = coordinates_ok & date_ok
+    rejected = Counter({
+        COORDINATES: int((~coordinates_ok).sum()),
+        DATE: int((coordinates_ok & ~date_ok).sum()),
+    })
+    return valid, +rejected
+
+
+def format_rejections(rejected: Counter) -> str:
+    '''Rejection counts for the log, e.g. "date format : 1, latitude/longitude : 3".'''
+    return ', '.join(f'{reason} : {count}' for reason, count in sorted(rejected.items()))
@@ -0,0 +1,70 @@
+'''
+Streaming writers for the map outputs.
+
+Features are written to the output file one at a time, through a buffered
+file, instead of building the whole FeatureCollection in memory. The bytes
+written are identical to json.dump of the full FeatureCollection, so the
+front end at healthmap.org doesn't see any difference.
+'''
+import json
+
+import pandas as pd
+
+
+BUFFER_SIZE = 1 << 20 # 1MB
+
+# json.dump({"type": "FeatureCollection", "features": [...]}) around the features.
+HEADER = '{"type": "FeatureCollection", "features": ['
+SEPARATOR = ', '
+FOOTER = ']}'
+
+
+def write_feature_collection(features, outfile: str, buffering: int = BUFFER_SIZE) -> int:
+    '''
+    Write a FeatureCollection to outfile, one feature at a time.
+
+    Args :
+        features (iterable) : features as dicts, or as JSON encoded strings.
+        outfile (str) : output path.
+        buffering (int) : buffer size of the output file.
+
+    Returns :
+        n (int) : number of features written.
+    '''
+    n = 0
+    with open(outfile, 'w', buffering=buffering) as F:
+        F.write(HEADER)
+        for feature in features:
+            if n:
+                F.write(SEPARATOR)
+            if not isinstance(feature, str):
+                feature = json.dumps(feature)
+            F.write(feature)
+            n += 1
+        F.write(FOOTER)
+    return n
+
+
+def encode_animation_features(locations: pd.DataFrame, cells: pd.DataFrame):
+    '''
+    JSON encoded animation features, same as json.dumps of each feature from
+    aggregation.animation_features. Everything that only depends on the
+    location (geometry, names) is encoded once per location.
+
+    Args :
+        locations, cells (pd.DataFrame) : see aggregation.animation_cells.
+    '''
+    lat = locations.latitude.astype(float).tolist()
+    lon = locations.longitude.astype(float).tolist()
+    prefix = {}
+    suffix = {}
+    for i, x, y, row in zip(locations.index, lon, lat, locations.itertuples()):
+        prefix[i] = '{"type": "Feature", "geometry": {"type": "Point", "coordinates": %s}, "properties": {"date": ' % json.dumps([x, y])
+        suffix[i] = ', "city": {}, "province": {}, "country": {}, "geo_resolution": {}}}}}'.format(
+                json.dumps(row.city), json.dumps(row.province), json.dumps(row.country), json.dumps(row.geo_resolution))
+
+    dates = pd.Series(cells.date.unique())
+    datestr = dict(zip(dates, dates.dt.strftime('"%Y-%m-%d"')))
+
+    for d, i, N_new, total in zip(cells.date, cells.location.tolist(), cells.new.tolist(), cells.total.tolist()):
+        yield '%s%s, "new": %d, "total": %d%s' % (prefix[i], datestr[d], N_new, total, suffix[i])
@@ -0,0 +1,8 @@
+'''
+Code shared by map_pipeline and sheet_cleaner : run metrics (metrics.py)
+and atomic file writes (files.py).
+
+Installed with the requirements (pip install -r requirements.txt installs
+this repository in editable mode), so both pipelines import it as
+pipeline_common whatever their working directory.
+'''
@@ -0,0 +1,31 @@
+'''
+Atomic file writes : a reader (web server, node_exporter, the next stage)
+sees the previous file or the new one, never a partial file.
+'''
+import os
+import tempfile
+
+
+# Mode of the files created by open(), mkstemp ignores the umask.
+_umask = os.umask(0)
+os.umask(_umask)
+DEFAULT_PERMISSIONS = 0o666 & ~_umask
+
+
+def atomic_write(path: str, chunks, mode: str = 'wb', permissions: int = None) -> None:
+    '''
+    Write chunks to a temporary file in the same directory as path, then
+    rename it over path. The file gets the permissions given (e.g. 0o644),
+    or by default the mode open() would give it under the umask.
+    '''
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmppath = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, mode) as F:
+            for chunk in chunks:
+                F.write(chunk)
+        os.chmod(tmppath, DEFAULT_PERMISSIONS if permissions is None else permissions)
+        os.replace(tmppath, path)
+    except BaseException:
+        os.remove(tmppath)
+        raise
@@ -0,0 +1,206 @@
+'''
+Run metrics : wall time, CPU time, memory and row counts of each stage of a
+run, written at the end of the run as JSON and as a Prometheus textfile (for
+node_exporter's textfile collector).
+
+    metrics = RunMetrics('map_pipeline')
+    with metrics.stage('clean'):
+        ...
+        metrics.count(rows_in=len(df), rows_out=len(clean))
+    metrics.write(json_path, prom_path)
+
+Code that isn't wrapped in blocks calls metrics.start(name) at the start of
+each stage, and metrics.finish() after the last one (failed=True on errors).
+
+Memory is the peak RSS of the process at the end of the stage (a high-water
+mark, it never goes down), and with trace_memory the peak of the Python
+allocations during the stage (tracemalloc, which slows the stage down).
+'''
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from pipeline_common.files import atomic_write
+
+
+# Stage status
+OK = 'ok'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+PREFIX = 'pipeline'
+
+# Prometheus gauges : field, help.
+STAGE_GAUGES = [
+    ('wall_seconds', 'Wall time of the stage.'),
+    ('cpu_seconds', 'CPU time (user + system) of the stage.'),
+    ('peak_rss_bytes', 'Peak resident memory of the process at the end of the stage.'),
+    ('traced_peak_bytes', 'Peak of the Python allocations during the stage (tracemalloc).'),
+    ('rows_in', 'Rows read by the stage.'),
+    ('rows_out', 'Rows written by the stage.'),
+]
+
+
+def peak_rss() -> int:
+    '''Peak resident memory of the process, in bytes.'''
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024 # kB on Linux
+
+
+class RunMetrics(object):
+    '''
+    Metrics of the stages of one run, in the order they ran.
+
+    Args :
+        job (str) : name of the pipeline, used as Prometheus label.
+        trace_memory (bool) : trace Python allocations with tracemalloc.
+    '''
+
+    def __init__(self, job: str, trace_memory: bool = False):
+        self.job = job
+        self.trace_memory = trace_memory
+        self.started = time.time()
+        self.stages = []
+        self.current = None
+        self._clocks = None
+
+    @contextmanager
+    def stage(self, name: str):
+        '''Record the stage run in the block, exceptions mark it as failed.'''
+        record = self.start(name)
+        try:
+            yield record
+        except BaseException:
+            self.finish(failed=True)
+            raise
+        finally:
+            self.finish()
+
+    def start(self, name: str) -> dict:
+        '''
+        Start recording a stage, for code that isn't wrapped in stage() : the
+        stage ends at the next start() or finish().
+        '''
+        self.finish()
+        record = {'stage': name, 'status': OK}
+        self.stages.append(record)
+        self.current = record
+        if self.trace_memory:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop() # to reset the peak
+            tracemalloc.start()
+        self._clocks = time.perf_counter(), time.process_time()
+        return record
+
+    def finish(self, failed: bool = False) -> None:
+        '''End the stage being recorded, if any.'''
+        record = self.current
+        if record is None:
+            return
+        if failed:
+            record['status'] = FAILED
+        wall, cpu = self._clocks
+        record['wall_seconds'] = time.perf_counter() - wall
+        record['cpu_seconds'] = time.process_time() - cpu
+        record['peak_rss_bytes'] = peak_rss()
+        if self.trace_memory:
+            record['traced_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.current = None
+
+    def skipped(self, name: str) -> None:
+        '''Record a stage that didn't need to run.'''
+        self.stages.append({'stage': name, 'status': SKIPPED})
+
+    def count(self, rows_in: int = None, rows_out: int = None, **rows) -> None:
+        '''
+        Row counts of the stage being recorded, ignored outside of a stage.
+        Other counts are given by name (e.g. geocoded=n) and recorded as
+        rows_<name>.
+        '''
+        if self.current is None:
+            return
+        counts = {'in': rows_in, 'out': rows_out}
+        counts.update(rows)
+        for name, n in counts.items():
+            if n is not None:
+                self.current['rows_' + name] = int(n)
+
+    @property
+    def success(self) -> bool:
+        return all(s['status'] != FAILED for s in self.stages)
+
+    def to_dict(self) -> dict:
+        return {
+            'job': self.job,
+            'started': self.started,
+            'wall_seconds': time.time() - self.started,
+            'success': self.success,
+            'stages': self.stages,
+        }
+
+    def prometheus(self, now: float = None) -> str:
+        '''Metrics in the Prometheus text format.'''
+        job = _label(self.job)
+        lines = []
+
+        def gauge(name, help_, samples):
+            lines.append(f'# HELP {PREFIX}_{name} {help_}')
+            lines.append(f'# TYPE {PREFIX}_{name} gauge')
+            lines.extend(f'{PREFIX}_{name}{{{labels}}} {value!r}' for labels, value in samples)
+
+        fields = dict(STAGE_GAUGES)
+        for s in self.stages:
+            for field in s:
+                if field.startswith('rows_') and field not in fields:
+                    fields[field] = 'Rows {} by the stage.'.format(field[len('rows_'):])
+        for field, help_ in fields.items():
+            samples = [(f'job="{job}",stage="{_label(s["stage"])}"', s[field]) for s in self.stages if field in s]
+            if samples:
+                gauge(f'stage_{field}', help_, samples)
+        gauge('stage_skipped', 'Whether the stage was skipped (inputs unchanged).',
+              [(f'job="{job}",stage="{_label(s["stage"])}"', int(s['status'] == SKIPPED)) for s in self.stages])
+        gauge('run_success', 'Whether the last run went through.', [(f'job="{job}"', int(self.success))])
+        gauge('run_wall_seconds', 'Wall time of the last run.', [(f'job="{job}"', time.time() - self.started)])
+        gauge('run_timestamp_seconds', 'End of the last run.', [(f'job="{job}"', now or time.time())])
+        return '\n'.join(lines) + '\n'
+
+    def write(self, json_path: str = None, prom_path: str = None) -> None:
+        '''
+        Write the metrics files, each one atomically (the textfile collector
+        must never read a partial file).
+        '''
+        if json_path:
+            _write(json_path, json.dumps(self.to_dict(), indent=1))
+        if prom_path:
+            _write(prom_path, self.prometheus())
+
+
+class NoMetrics(RunMetrics):
+    '''RunMetrics that records nothing, for callers that don't collect metrics.'''
+
+    def __init__(self):
+        super().__init__('none')
+
+    def start(self, name: str) -> dict:
+        return {'stage': name, 'status': OK}
+
+    def skipped(self, name: str) -> None:
+        pass
+
+    def write(self, json_path: str = None, prom_path: str = None) -> None:
+        pass
+
+
+def _label(value: str) -> str:
+    '''Escape a Prometheus label value.'''
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _write(path: str, text: str) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    atomic_write(path, [text], mode='w', permissions=0o644) # read by node_exporter
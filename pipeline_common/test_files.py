@@ -0,0 +1,47 @@
+import unittest
+import tempfile
+import os
+
+from pipeline_common import files
+
+
+class TestAtomicWrite(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'data.txt')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def mode(self, path: str) -> int:
+        return os.stat(path).st_mode & 0o777
+
+    def test_write(self):
+        files.atomic_write(self.path, ['a', 'b'], mode='w')
+        files.atomic_write(self.path, [b'c'])
+        with open(self.path, 'rb') as F:
+            self.assertEqual(F.read(), b'c')
+        self.assertEqual(os.listdir(self.tmpdir.name), ['data.txt'])
+
+    def test_permissions(self):
+        # As open() would create it, unless given.
+        plain = os.path.join(self.tmpdir.name, 'plain.txt')
+        with open(plain, 'w'):
+            pass
+        files.atomic_write(self.path, [b'a'])
+        self.assertEqual(self.mode(self.path), self.mode(plain))
+        files.atomic_write(self.path, [b'a'], permissions=0o640)
+        self.assertEqual(self.mode(self.path), 0o640)
+
+    def test_error_keeps_previous_file(self):
+        files.atomic_write(self.path, [b'a'])
+
+        def chunks():
+            yield b'b'
+            raise IOError('interrupted')
+        with self.assertRaises(IOError):
+            files.atomic_write(self.path, chunks())
+        with open(self.path, 'rb') as F:
+            self.assertEqual(F.read(), b'a')
+        self.assertEqual(os.listdir(self.tmpdir.name), ['data.txt'])
@@ -0,0 +1,117 @@
+import unittest
+import tempfile
+import json
+import os
+
+from pipeline_common import metrics
+from pipeline_common.metrics import RunMetrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_stage(self):
+        run = RunMetrics('test')
+        with run.stage('sum'):
+            total = sum(range(100000))
+            run.count(rows_in=100000, rows_out=1)
+        run.count(rows_in=5) # outside of a stage, ignored
+        run.skipped('tiles')
+
+        first, second = run.stages
+        self.assertEqual(first['stage'], 'sum')
+        self.assertEqual(first['status'], metrics.OK)
+        self.assertEqual((first['rows_in'], first['rows_out']), (100000, 1))
+        self.assertGreater(first['wall_seconds'], 0)
+        self.assertGreaterEqual(first['cpu_seconds'], 0)
+        self.assertGreater(first['peak_rss_bytes'], 1 << 20)
+        self.assertNotIn('traced_peak_bytes', first)
+        self.assertNotIn('rows_geocoded', first)
+        self.assertEqual(second, {'stage': 'tiles', 'status': metrics.SKIPPED})
+        self.assertTrue(run.success)
+
+    def test_other_counts(self):
+        run = RunMetrics('test')
+        with run.stage('geocode'):
+            run.count(rows_in=10, rows_out=10, geocoded=7, missed=None)
+        self.assertEqual((run.stages[0]['rows_in'], run.stages[0]['rows_out'], run.stages[0]['rows_geocoded']), (10, 10, 7))
+        self.assertNotIn('rows_missed', run.stages[0])
+
+    def test_failed(self):
+        run = RunMetrics('test')
+        with self.assertRaises(KeyError):
+            with run.stage('lookup'):
+                {}['missing']
+        self.assertEqual(run.stages[0]['status'], metrics.FAILED)
+        self.assertIn('wall_seconds', run.stages[0])
+        self.assertFalse(run.success)
+
+    def test_start(self):
+        run = RunMetrics('test')
+        run.start('read')
+        run.count(rows_in=10)
+        run.start('write') # ends read
+        run.finish(failed=True)
+        run.finish() # nothing left to end
+        self.assertEqual([(s['stage'], s['status']) for s in run.stages], [('read', metrics.OK), ('write', metrics.FAILED)])
+        self.assertEqual(run.stages[0]['rows_in'], 10)
+        self.assertIn('wall_seconds', run.stages[1])
+
+    def test_no_metrics(self):
+        run = metrics.NoMetrics()
+        with run.stage('read'):
+            run.count(rows_in=10)
+        run.start('write')
+        run.skipped('tiles')
+        run.finish()
+        self.assertEqual(run.stages, [])
+        with tempfile.TemporaryDirectory() as tmpdir:
+            run.write(os.path.join(tmpdir, 'metrics.json'))
+            self.assertEqual(os.listdir(tmpdir), [])
+
+    def test_trace_memory(self):
+        run = RunMetrics('test', trace_memory=True)
+        with run.stage('allocate'):
+            data = bytearray(10 << 20)
+            del data
+        self.assertGreaterEqual(run.stages[0]['traced_peak_bytes'], 10 << 20)
+
+    def test_prometheus(self):
+        run = RunMetrics('map"pipeline')
+        with run.stage('clean'):
+            run.count(rows_in=10, rows_out=8)
+        run.skipped('tiles')
+        text = run.prometheus(now=1600000000.0)
+
+        self.assertIn('# TYPE pipeline_stage_wall_seconds gauge', text)
+        self.assertIn('pipeline_stage_rows_in{job="map\\"pipeline",stage="clean"} 10\n', text)
+        self.assertIn('pipeline_stage_rows_out{job="map\\"pipeline",stage="clean"} 8\n', text)
+        self.assertIn('pipeline_stage_skipped{job="map\\"pipeline",stage="tiles"} 1\n', text)
+        self.assertIn('pipeline_stage_skipped{job="map\\"pipeline",stage="clean"} 0\n', text)
+        self.assertIn('pipeline_run_success{job="map\\"pipeline"} 1\n', text)
+        self.assertIn('pipeline_run_timestamp_seconds{job="map\\"pipeline"} 1600000000.0\n', text)
+        # Other row counts are gauges too.
+        self.assertNotIn('pipeline_stage_rows_geocoded', text)
+        with run.stage('geocode'):
+            run.count(rows_in=8, rows_out=8, geocoded=6)
+        text = run.prometheus(now=1600000000.0)
+        self.assertIn('# HELP pipeline_stage_rows_geocoded Rows geocoded by the stage.\n', text)
+        self.assertIn('pipeline_stage_rows_geocoded{job="map\\"pipeline",stage="geocode"} 6\n', text)
+        # Skipped stages have no timings.
+        self.assertNotIn('pipeline_stage_wall_seconds{job="map\\"pipeline",stage="tiles"}', text)
+
+    def test_write(self):
+        run = RunMetrics('test')
+        with run.stage('clean'):
+            run.count(rows_out=3)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            json_path = os.path.join(tmpdir, 'metrics', 'metrics.json')
+            prom_path = os.path.join(tmpdir, 'test.prom')
+            run.write(json_path, prom_path)
+            with open(json_path) as F:
+                written = json.load(F)
+            self.assertEqual(written['job'], 'test')
+            self.assertTrue(written['success'])
+            self.assertEqual(written['stages'][0]['rows_out'], 3)
+            with open(prom_path) as F:
+                self.assertEqual(F.read().count('pipeline_stage_rows_out'), 3) # HELP, TYPE and sample
+            self.assertEqual(sorted(os.listdir(tmpdir)), ['metrics', 'test.prom'])
@@ -0,0 +1,9 @@
+from setuptools import setup
+
+# Only the code shared by the pipelines is a package, the pipelines are run as scripts.
+setup(
+    name='pipeline_common',
+    version='0.1',
+    packages=['pipeline_common'],
+    python_requires='>=3.6',
+)
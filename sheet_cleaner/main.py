@@ -13,6 +13,7 @@ from functions import (duplicate_rows_per_column, fix_na, fix_sex,
                        generate_error_tables, get_GoogleSheets, trim_df,
                        values2dataframe)
 from geocoding import csv_geocoder
+from pipeline_common.metrics import RunMetrics
 from sheet_processor import SheetProcessor
 
 parser = argparse.ArgumentParser(
@@ -34,8 +35,17 @@ def main():
     geocoder = csv_geocoder.CSVGeocoder(config['GEOCODING'].get('TSV_PATH'))
     sheets = get_GoogleSheets(config)
 
-    processor = SheetProcessor(sheets, geocoder, config)
-    processor.process()
+    # Time, memory and row counts of each step, written even when a step fails ([METRICS]).
+    metrics_config = config['METRICS'] if config.has_section('METRICS') else {}
+    metrics = RunMetrics('sheet_cleaner', config.getboolean('METRICS', 'TRACE_MEMORY', fallback=False))
+    processor = SheetProcessor(sheets, geocoder, config, metrics)
+    try:
+        processor.process()
+    except BaseException:
+        metrics.finish(failed=True)
+        raise
+    finally:
+        metrics.write(metrics_config.get('JSON'), metrics_config.get('PROM'))
 
     if args.push_to_git:
         processor.push_to_github()
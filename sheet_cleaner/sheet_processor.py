@@ -11,26 +11,32 @@ from spreadsheet import GoogleSheet
 
 from functions import (duplicate_rows_per_column, fix_na, fix_sex,
                        generate_error_tables, trim_df, values2dataframe)
+from pipeline_common.metrics import NoMetrics, RunMetrics
 
 
 class SheetProcessor:
 
-    def __init__(self, sheets: List[GoogleSheet], geocoder: csv_geocoder.CSVGeocoder, config: configparser.ConfigParser):
+    def __init__(self, sheets: List[GoogleSheet], geocoder: csv_geocoder.CSVGeocoder, config: configparser.ConfigParser,
+                 metrics: RunMetrics = None):
         self.for_github = []
         self.sheets = sheets
         self.geocoder = geocoder
         self.config = config
+        # Time, memory and row counts of each step (one per sheet, then combine, geocode and save).
+        self.metrics = metrics or NoMetrics()
 
     def process(self):
         """Does all the heavy handling of spreadsheets, writing output to CSV files."""
         for s in self.sheets:
             logging.info("Processing sheet %s", s.name)
+            self.metrics.start(f'sheet:{s.name}')
 
             ### Clean Private Sheet Entries. ###
             # note : private sheet gets updated on the fly and redownloaded to ensure continuity between fixes (granted its slower).
             
             range_ = f'{s.name}!A:AG'
             data = values2dataframe(s.read_values(range_))
+            self.metrics.count(rows_in=len(data))
 
             # Expand aggregated cases into one row each.
             logging.info("Rows before expansion: %d", len(data))
@@ -65,6 +71,7 @@ class SheetProcessor:
             clean = clean.drop('row', axis=1)
             clean.sort_values(by='ID')
             s.data = clean
+            self.metrics.count(rows_out=len(clean))
             non_fixable = non_fixable.sort_values(by='ID')
 
             # Save error_reports
@@ -77,6 +84,7 @@ class SheetProcessor:
             self.for_github.append(error_file)
             
         # Combine data from all sheets into a single datafile
+        self.metrics.start('combine')
         all_data = []
         for s in self.sheets:
             logging.info("sheet %s had %d rows", s.name, len(s.data))
@@ -85,8 +93,10 @@ class SheetProcessor:
         all_data = pd.concat(all_data, ignore_index=True)
         all_data = all_data.sort_values(by='ID')
         logging.info("all_data has %d rows", len(all_data))
+        self.metrics.count(rows_in=len(all_data), rows_out=len(all_data))
 
         # Fill geo columns.
+        self.metrics.start('geocode')
         geocode_matched = 0
         for i, row in all_data.iterrows():
             geocode = self.geocoder.geocode(row.city, row.province, row.country)
@@ -102,6 +112,7 @@ class SheetProcessor:
             all_data.at[i, 'admin1'] = geocode.admin1
             all_data.at[i, 'admin_id'] = geocode.admin_id
             all_data.at[i, 'country_new'] = geocode.country_new
+        self.metrics.count(rows_in=len(all_data), rows_out=len(all_data), geocoded=geocode_matched)
         logging.info("Geocode matched %d/%d", geocode_matched, len(all_data))
         logging.info("Top 10 geocode misses: %s", self.geocoder.misses.most_common(10))
         with open("geocode_misses.csv", "w") as f:
@@ -117,8 +128,11 @@ class SheetProcessor:
         dt = datetime.now().strftime('%Y-%m-%dT%H%M%S')
         file_name   = self.config['FILES']['DATA'].replace('TIMESTAMP', dt)
         latest_name = os.path.join(self.config['FILES']['LATEST'], 'latestdata.csv')
+        self.metrics.start('save')
         all_data.to_csv(file_name, index=False, encoding="utf-8")
         all_data.to_csv(latest_name, index=False, encoding="utf-8")
+        self.metrics.count(rows_out=len(all_data))
+        self.metrics.finish()
         logging.info("Wrote %s, %s", file_name, latest_name)
         self.for_github.extend([file_name, latest_name])
 
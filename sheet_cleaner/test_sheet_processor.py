@@ -5,6 +5,7 @@ import pathlib
 import os
 
 from geocoding import csv_geocoder
+from pipeline_common.metrics import RunMetrics
 from sheet_processor import SheetProcessor
 from unittest.mock import MagicMock, patch
 from spreadsheet import GoogleSheet
@@ -43,3 +44,16 @@ class TestSheetProcessor(unittest.TestCase):
             processor.process()
             # Checking that no exception is raised is fine for now.
             # We could also check for output files in tmpdirname later on.
+
+    def test_metrics(self):
+        # Same run as test_ok, recorded.
+        metrics = RunMetrics('sheet_cleaner')
+        with patch('sheet_processor.NoMetrics', return_value=metrics):
+            self.test_ok()
+        self.assertEqual([s['stage'] for s in metrics.stages], ['sheet:sheet-name', 'combine', 'geocode', 'save'])
+        # The aggregated row is kept, with 4 copies.
+        self.assertEqual((metrics.stages[0]['rows_in'], metrics.stages[0]['rows_out']), (1, 5))
+        # Every row goes through geocoding, cit/pro/coun isn't found.
+        self.assertEqual((metrics.stages[2]['rows_in'], metrics.stages[2]['rows_out'], metrics.stages[2]['rows_geocoded']), (5, 5, 0))
+        self.assertEqual(metrics.stages[-1]['rows_out'], 5)
+        self.assertIsNone(metrics.current)